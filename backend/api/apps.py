@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Register the signal handlers that expire cached user states
+        from . import authentication  # noqa: F401
+
+        if settings.REPLICA_DATABASES:
+            # A user pinned after a write must stay pinned whichever worker serves the next read
+            from core.caches import require_shared
+            require_shared(settings.REPLICA_PIN_CACHE, 'DATABASE_REPLICA_URLS')
@@ -0,0 +1,75 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .authentication import ClaimsJWTAuthentication
+
+# Methods served by the async views; every other method goes to the sync view
+ASYNC_METHODS = ('GET', 'HEAD')
+
+
+async def authenticate(request):
+    """
+    Resolve the JWT bearer of ``request`` like ``ClaimsJWTAuthentication``, through the async ORM.
+
+    Returns ``AnonymousUser`` when no token is sent; raises
+    ``AuthenticationFailed`` for invalid or revoked tokens and unknown or inactive users.
+    """
+    authenticator = ClaimsJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+    return await authenticator.aget_user(await authenticator.aget_validated_token(raw_token))
+
+
+def render(response):
+    """Render a DRF ``Response`` as JSON, the way the sync views' renderer would"""
+    if not isinstance(response, Response):
+        return response
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = JSONRenderer.media_type
+    response.renderer_context = {'response': response}
+    return response.render()
+
+
+def exception_response(exc):
+    """Response for an ``APIException``, shaped like DRF's default exception handler"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = Response(data, status=exc.status_code)
+    if isinstance(exc, AuthenticationFailed):
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+def async_read_view(sync_view):
+    """
+    Serve reads with the decorated coroutine and every other method with ``sync_view``.
+
+    The coroutine gets a DRF ``Request`` (``query_params``, ``user``) and
+    returns a DRF ``Response``; API exceptions are turned into responses as
+    DRF would. Reads are public, so no permission checks apply. Writes keep
+    the sync view's behaviour unchanged, run in the request's sync thread.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ASYNC_METHODS:
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            api_request = Request(request)
+            try:
+                api_request.user = await authenticate(request)
+                response = await view(api_request, *args, **kwargs)
+            except APIException as exc:
+                response = exception_response(exc)
+            return render(response)
+        # Like DRF views: writes reach the sync view, which enforces CSRF itself
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
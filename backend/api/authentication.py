@@ -0,0 +1,213 @@
+"""
+JWT authentication that builds ``request.user`` from token claims.
+
+Access tokens carry the user's id, username and staff flag (see
+``ClaimsRefreshToken``). A per-process cache remembers for
+``AUTH_USER_CACHE_SECONDS`` whether each user is still active and their
+current username and staff flag, so a deactivated or demoted user loses
+access within that window without a query on every request. The full
+``User`` row is only loaded when a view touches anything else. Tokens
+revoked through ``api.revocation`` are rejected.
+"""
+import calendar
+from collections import namedtuple
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import SESSION_CLAIM, ais_revoked, is_revoked
+
+User = get_user_model()
+
+# Copied into tokens at login; the fields a request can read without loading the user
+CLAIM_FIELDS = ('username', 'is_staff')
+
+UserState = namedtuple('UserState', ['is_active', 'username', 'is_staff'])
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry ``CLAIM_FIELDS`` and the login session"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for field in CLAIM_FIELDS:
+            token[field] = getattr(user, field)
+        token[SESSION_CLAIM] = token[api_settings.JTI_CLAIM]
+        return token
+
+    def set_iat(self, claim='iat', at_time=None):
+        # To the microsecond, so tokens issued just after a user's tokens were revoked stand
+        at_time = at_time or self.current_time
+        self.payload[claim] = calendar.timegm(at_time.utctimetuple()) + at_time.microsecond / 1e6
+
+    def rotate(self):
+        """Turn this token into its successor: new id and lifetime, same claims and session"""
+        self.set_jti()
+        self.set_exp()
+        self.set_iat()
+
+
+class UserStateCache:
+    """Process-local ``UserState`` by user id, each entry kept for ``AUTH_USER_CACHE_SECONDS``"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, user_id, state):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                now = time.monotonic()
+                self.entries = {key: entry for key, entry in self.entries.items() if entry[1] >= now}
+                if len(self.entries) >= self.max_entries:
+                    # Still full of live entries: drop the oldest
+                    del self.entries[next(iter(self.entries))]
+            self.entries[user_id] = (state, time.monotonic() + settings.AUTH_USER_CACHE_SECONDS)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_states = UserStateCache()
+
+
+# Changes made in this process apply at once, in other processes within the TTL
+
+@receiver(post_save, sender=User)
+def remember_user_state(sender, instance, **kwargs):
+    if instance.get_deferred_fields() & set(UserState._fields):
+        user_states.discard(instance.pk)
+    else:
+        user_states.set(instance.pk, UserState(*(getattr(instance, field) for field in UserState._fields)))
+
+
+@receiver(post_delete, sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    user_states.discard(instance.pk)
+
+
+def _state_queryset(user_id):
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*UserState._fields)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    ``request.user`` for a claims-bearing token: id, username and flags without a query.
+
+    Anything else (other fields, relations, saving, comparing with a model
+    instance) loads the ``User`` row on first use.
+    """
+
+    def __init__(self, user_id, state):
+        super().__init__(lambda: User.objects.select_related('profile').get(pk=user_id))
+        self.__dict__['_claims'] = {
+            'pk': user_id, 'id': user_id, 'username': state.username, 'is_staff': state.is_staff,
+            'is_active': True, 'is_authenticated': True, 'is_anonymous': False,
+        }
+
+    def __getattr__(self, name):
+        claims = self.__dict__['_claims']
+        if self._wrapped is empty and name in claims:
+            return claims[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        return True
+
+    def __str__(self):
+        return self.__dict__['_claims']['username']
+
+    @property
+    def is_loaded(self):
+        return self._wrapped is not empty
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that answers from token claims and ``user_states`` instead of loading the user.
+
+    Tokens issued without the claims fall back to loading the user, as before.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken("Token has been revoked")
+        return token
+
+    async def aget_validated_token(self, raw_token):
+        """``get_validated_token`` reading the denylist through the async ORM"""
+        token = super().get_validated_token(raw_token)
+        if await ais_revoked(token):
+            raise InvalidToken("Token has been revoked")
+        return token
+
+    def claimed_user_id(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        if not all(field in validated_token for field in CLAIM_FIELDS):
+            return None
+        return user_id
+
+    def user_from_state(self, user_id, state):
+        if state is None:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+        if not state.is_active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return ClaimsUser(user_id, state)
+
+    def get_user(self, validated_token):
+        user_id = self.claimed_user_id(validated_token)
+        if user_id is None:
+            return super().get_user(validated_token)
+        state = user_states.get(user_id)
+        if state is None:
+            row = _state_queryset(user_id).first()
+            state = UserState(*row) if row else None
+            if state is not None:
+                user_states.set(user_id, state)
+        return self.user_from_state(user_id, state)
+
+    async def aget_user(self, validated_token):
+        """``get_user`` through the async ORM"""
+        user_id = self.claimed_user_id(validated_token)
+        if user_id is None:
+            try:
+                user = await User.objects.aget(**{api_settings.USER_ID_FIELD: validated_token[api_settings.USER_ID_CLAIM]})
+            except User.DoesNotExist:
+                raise AuthenticationFailed("User not found", code='user_not_found')
+            if not user.is_active:
+                raise AuthenticationFailed("User is inactive", code='user_inactive')
+            return user
+        state = user_states.get(user_id)
+        if state is None:
+            row = await _state_queryset(user_id).afirst()
+            state = UserState(*row) if row else None
+            if state is not None:
+                user_states.set(user_id, state)
+        return self.user_from_state(user_id, state)
@@ -0,0 +1,101 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+EXCLUDE_QUERY_PARAM = 'exclude'
+
+# Fields rendered even when not asked for, so items can always be identified
+ALWAYS_INCLUDED = ('id',)
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+def requested_fields(request, available):
+    """
+    Resolve ``?fields=`` and ``?exclude=`` against the ``available`` field names.
+
+    Returns the names to render, in their original order. Unknown names are
+    rejected with a 400 so typos do not silently return everything.
+    """
+    params = getattr(request, 'query_params', request.GET)
+    fields = _split(params.get(FIELDS_QUERY_PARAM))
+    exclude = _split(params.get(EXCLUDE_QUERY_PARAM))
+
+    unknown = (fields | exclude) - set(available)
+    if unknown:
+        raise ValidationError({
+            FIELDS_QUERY_PARAM: f"Unknown fields: {', '.join(sorted(unknown))}. "
+                                f"Available: {', '.join(available)}"
+        })
+
+    return [
+        name for name in available
+        if name in ALWAYS_INCLUDED or ((not fields or name in fields) and name not in exclude)
+    ]
+
+
+def is_model_column(model, path):
+    """True if a ``__``-separated path ends at a concrete field of ``model`` or a related model"""
+    parts = path.split('__')
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete:
+            return False
+        if index < len(parts) - 1:
+            if not field.is_relation:
+                return False
+            model = field.related_model
+    return True
+
+
+def sparse_queryset(queryset, paths):
+    """
+    Load only the columns in ``paths`` (plus the primary key).
+
+    Relations are joined only when a requested path traverses them, since a
+    deferred foreign key cannot be followed by select_related.
+    """
+    paths = {queryset.model._meta.pk.name} | set(paths)
+    related = {path.split('__')[0] for path in paths if '__' in path}
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*sorted(related))
+    return queryset.only(*sorted(paths))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin rendering only the field names listed in ``context['fields']``.
+
+    Views resolve the list with ``requested_fields`` and load matching
+    columns with ``sparse_queryset``; without the context key every field
+    is rendered as before.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        return requested_fields(request, list(cls().fields))
+
+    @classmethod
+    def sparse_queryset(cls, queryset, fields, extra=()):
+        """Defer every column the given fields (and ``extra`` paths) do not read"""
+        serializer_fields = cls().fields
+        paths = [
+            serializer_fields[name].source.replace('.', '__') for name in fields
+            if serializer_fields[name].source != '*'
+        ]
+        return sparse_queryset(
+            queryset, [path for path in paths + list(extra) if is_model_column(queryset.model, path)]
+        )
@@ -0,0 +1,261 @@
+from datetime import datetime, timezone
+import io
+import json
+import math
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from api.authentication import ClaimsRefreshToken
+from poetry.models import Comment, Poem
+
+User = get_user_model()
+
+# seed_muse arguments per data size; each step is roughly ten times the previous one
+SIZES = {
+    'small': {'users': 20, 'poems': 50, 'comments': 300, 'likes': 600},
+    'medium': {'users': 100, 'poems': 500, 'comments': 3000, 'likes': 6000},
+    'large': {'users': 500, 'poems': 5000, 'comments': 30000, 'likes': 60000},
+}
+
+# URLconfs whose endpoints are benchmarked
+URLCONFS = ('poetry.urls', 'poetry.comments_urls', 'users.urls')
+
+# Endpoints deliberately not timed, with the reason recorded in the baseline
+SKIPPED = {
+    ('poem_detail', 'DELETE'): 'destructive',
+    ('comment_detail', 'DELETE'): 'destructive',
+    ('user_detail', 'DELETE'): 'destructive',
+    ('user_list_create', 'POST'): 'dominated by password hashing',
+    ('password_change', 'POST'): 'dominated by password hashing; changes credentials',
+    ('get_image_upload_url', 'GET'): 'calls S3',
+    ('get_image_upload_urls', 'POST'): 'calls S3',
+}
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def view_name(callback):
+    view = getattr(callback, 'view_class', callback)
+    return view.__name__
+
+
+def iter_endpoints():
+    """Yield ``(view name, method)`` for every endpoint of the benchmarked URLconfs"""
+    for urlconf in URLCONFS:
+        patterns = list(get_resolver(urlconf).url_patterns)
+        while patterns:
+            pattern = patterns.pop()
+            if isinstance(pattern, URLResolver):
+                patterns.extend(pattern.url_patterns)
+                continue
+            if isinstance(pattern, URLPattern):
+                view = getattr(pattern.callback, 'view_class', pattern.callback)
+                methods = getattr(view, 'http_method_names', ['get'])
+                for method in methods:
+                    if method not in ('options', 'head'):
+                        yield view_name(pattern.callback), method.upper()
+
+
+def build_cases(fixtures):
+    """
+    Requests timed per data size: ``(name, view, method, path, body, auth)``.
+
+    ``auth`` is None for anonymous requests, 'user' for the poem's author
+    or 'admin' for a staff user (user_detail falls back to IsAdminUser).
+
+    Writes are idempotent or paired (like, then unlike) so repeated
+    iterations leave the data set essentially unchanged.
+    """
+    slug = fixtures['poem'].slug
+    comment_id = fixtures['comment'].id
+    own_comment_id = fixtures['own_comment'].id
+    user_id = fixtures['user'].id
+    return [
+        ('poem_list', 'poem_list', 'GET', '/api/poems/', None, None),
+        ('poem_list cursor', 'poem_list', 'GET', '/api/poems/?cursor=', None, None),
+        ('poem_list search', 'poem_list', 'GET', '/api/poems/?search=light', None, None),
+        ('poem_list authenticated', 'poem_list', 'GET', '/api/poems/', None, 'user'),
+        ('poem_list create', 'poem_list', 'POST', '/api/poems/', {'title': 'Benchmark', 'content': 'ember'}, 'user'),
+        ('poem_detail', 'poem_detail', 'GET', f'/api/poems/{slug}/', None, None),
+        ('poem_detail top comments', 'poem_detail', 'GET', f'/api/poems/{slug}/?comments=top', None, None),
+        ('poem_detail update', 'poem_detail', 'PUT', f'/api/poems/{slug}/', {'description': 'benchmarked'}, 'user'),
+        ('poem_like', 'poem_like', 'PUT', f'/api/poems/{slug}/like/', None, 'user'),
+        ('poem_unlike', 'poem_like', 'DELETE', f'/api/poems/{slug}/like/', None, 'user'),
+        ('poem_like toggle', 'poem_like', 'POST', f'/api/poems/{slug}/like/', None, 'user'),
+        ('poem_comments', 'poem_comments', 'GET', f'/api/poems/{slug}/comments/', None, None),
+        ('poem_comments page', 'poem_comments', 'GET', f'/api/poems/{slug}/comments/?cursor=', None, None),
+        ('comment_list', 'comment_list', 'GET', '/api/comments/', None, None),
+        ('comment_list create', 'comment_list', 'POST', '/api/comments/',
+         {'poem': str(fixtures['poem'].id), 'content': 'benchmark'}, 'user'),
+        ('comment_detail', 'comment_detail', 'GET', f'/api/comments/{comment_id}/', None, None),
+        ('comment_detail update', 'comment_detail', 'PUT', f'/api/comments/{own_comment_id}/',
+         {'content': 'benchmarked'}, 'user'),
+        ('comment_like', 'comment_like', 'PUT', f'/api/comments/{comment_id}/like/', None, 'user'),
+        ('comment_unlike', 'comment_like', 'DELETE', f'/api/comments/{comment_id}/like/', None, 'user'),
+        ('comment_like toggle', 'comment_like', 'POST', f'/api/comments/{comment_id}/like/', None, 'user'),
+        ('comment_replies', 'comment_replies', 'GET', f'/api/comments/{comment_id}/replies/', None, None),
+        ('comment_replies page', 'comment_replies', 'GET', f'/api/comments/{comment_id}/replies/?cursor=', None, None),
+        ('user_list', 'user_list_create', 'GET', '/api/users/users/', None, None),
+        ('user_detail', 'user_detail', 'GET', f'/api/users/users/{user_id}/', None, 'admin'),
+        ('user_detail update', 'user_detail', 'PUT', f'/api/users/users/{user_id}/', {'first_name': 'Bench'}, 'admin'),
+        ('user_detail_public', 'user_detail_public', 'GET', f'/api/users/users/public/{user_id}/', None, None),
+        ('current_user', 'current_user', 'GET', '/api/users/users/me/', None, 'user'),
+        ('update_user_profile', 'update_user_profile', 'PUT', '/api/users/users/me/profile/', {'bio': 'bench'}, 'user'),
+        ('user_stats', 'user_stats', 'GET', '/api/users/users/me/stats/', None, 'user'),
+        ('update_avatar', 'update_avatar', 'PUT', '/api/users/users/me/avatar/',
+         {'avatar_url': 'https://robohash.org/bench'}, 'user'),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every poem, comment and user endpoint at several seeded data sizes and "
+        "record p50/p95 latency and query counts to a JSON baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='small,medium',
+            help=f"Comma-separated data sizes to seed and time: {', '.join(SIZES)} (default: small,medium)"
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint (default: 20)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed passed to seed_muse (default: 1)')
+        parser.add_argument('--output', default='benchmark-baseline.json', help='Where to write the results')
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Earlier results to diff against; fails if any endpoint now issues more queries'
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Keep the response cache between requests instead of timing every request cold'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = set(sizes) - set(SIZES)
+        if unknown:
+            raise CommandError(f"Unknown sizes: {', '.join(sorted(unknown))}")
+
+        results = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'skipped': {f"{method} {view}": reason for (view, method), reason in SKIPPED.items()},
+            'sizes': {},
+        }
+
+        # Benchmarks run against a throwaway test database, never the configured one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for size in sizes:
+                results['sizes'][size] = self.benchmark_size(size, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def benchmark_size(self, size, options):
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        call_command('seed_muse', seed=options['seed'], stdout=io.StringIO(), **SIZES[size])
+
+        poem = Poem.objects.select_related('user').order_by('-comments_count', 'pk').first()
+        fixtures = {
+            'poem': poem,
+            'user': poem.user,
+            'comment': Comment.objects.filter(poem=poem, depth=0).order_by('-replies_count', 'pk').first(),
+            'own_comment': Comment.objects.create(user=poem.user, poem=poem, content='benchmark'),
+        }
+        cases = build_cases(fixtures)
+        self.check_coverage(cases)
+
+        admin = User.objects.create_user(
+            username='benchmark_admin', email='benchmark_admin@example.com', password='benchmark', is_staff=True
+        )
+        tokens = {
+            'user': str(ClaimsRefreshToken.for_user(fixtures['user']).access_token),
+            'admin': str(ClaimsRefreshToken.for_user(admin).access_token),
+        }
+        client = Client()
+        endpoints = {}
+        self.stdout.write(f"\n{size}: {SIZES[size]}")
+        for name, view, method, path, body, auth in cases:
+            headers = {'HTTP_AUTHORIZATION': f"Bearer {tokens[auth]}"} if auth else {}
+            timings, queries, statuses = [], [], set()
+            for _ in range(options['iterations']):
+                if not options['warm_cache']:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.generic(
+                        method, path, json.dumps(body) if body is not None else '',
+                        content_type='application/json', **headers
+                    )
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+            endpoints[name] = {
+                'view': view,
+                'method': method,
+                'path': path,
+                'status': sorted(statuses),
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'queries_max': max(queries),
+                'queries_min': min(queries),
+            }
+            self.stdout.write(
+                f"  {name:<28} {method:<6} p50 {endpoints[name]['p50_ms']:>9.2f} ms"
+                f"  p95 {endpoints[name]['p95_ms']:>9.2f} ms  queries {max(queries):>4}"
+                f"  status {','.join(map(str, sorted(statuses)))}"
+            )
+        return {'data': SIZES[size], 'endpoints': endpoints}
+
+    def check_coverage(self, cases):
+        covered = {(view, method) for _, view, method, _, _, _ in cases} | set(SKIPPED)
+        for endpoint in sorted(set(iter_endpoints()) - covered):
+            self.stderr.write(f"No benchmark case for {endpoint[1]} {endpoint[0]}")
+
+    def compare(self, path, results):
+        """Print per-endpoint changes against a baseline; more queries than before is an error"""
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = []
+        for size, current in results['sizes'].items():
+            previous = baseline.get('sizes', {}).get(size)
+            if previous is None:
+                continue
+            self.stdout.write(f"\n{size} vs {path}:")
+            for name, now in current['endpoints'].items():
+                before = previous['endpoints'].get(name)
+                if before is None:
+                    continue
+                query_delta = now['queries_max'] - before['queries_max']
+                ratio = now['p95_ms'] / before['p95_ms'] if before['p95_ms'] else float('inf')
+                marker = ' QUERY REGRESSION' if query_delta > 0 else ''
+                self.stdout.write(f"  {name:<28} p95 x{ratio:.2f}  queries {query_delta:+d}{marker}")
+                if query_delta > 0:
+                    regressions.append(f"{size} {name}")
+
+        if regressions:
+            raise CommandError(f"Query count grew for: {', '.join(regressions)}")
@@ -0,0 +1,201 @@
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.benchmark_muse import percentile
+from poetry.models import Comment, Poem
+
+# Server command line per deployment; both run from the backend directory with gunicorn.conf.py
+DEPLOYMENTS = {
+    'wsgi': ['core.wsgi:application', '--worker-class', 'gthread'],
+    'asgi': ['core.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+READY_TIMEOUT = 30
+
+
+def typical(queryset, field):
+    """The row at the median of ``field`` among rows where it is positive, or None"""
+    queryset = queryset.filter(**{f'{field}__gt': 0}).order_by(field, 'pk')
+    count = queryset.count()
+    return queryset[count // 2] if count else None
+
+
+def build_paths(poem, comment, user_id):
+    """Public read endpoints served by async views under ASGI, by name"""
+    return {
+        'poem_list': '/api/poems/',
+        'poem_list search': '/api/poems/?search=light',
+        'poem_detail': f'/api/poems/{poem.slug}/',
+        'poem_comments': f'/api/poems/{poem.slug}/comments/',
+        'poem_comments page': f'/api/poems/{poem.slug}/comments/?cursor=',
+        'comment_replies': f'/api/comments/{comment.pk}/replies/',
+        'user_detail_public': f'/api/users/users/public/{user_id}/',
+    }
+
+
+class LoadRun:
+    """Issue GETs to one path from ``concurrency`` keep-alive connections for ``duration`` seconds"""
+
+    def __init__(self, port, path, concurrency, duration):
+        self.port = port
+        self.path = path
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def client(self, deadline):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', self.path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+    def run(self):
+        deadline = time.perf_counter() + self.duration
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for _ in range(self.concurrency):
+                pool.submit(self.client, deadline)
+        return {
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'throughput': round(len(self.latencies) / self.duration, 1),
+            'p50_ms': round(percentile(self.latencies, 0.50) * 1000, 2) if self.latencies else None,
+            'p95_ms': round(percentile(self.latencies, 0.95) * 1000, 2) if self.latencies else None,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the public read endpoints served by the WSGI "
+        "deployment (sync views, threaded workers) and the ASGI deployment (async views)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--deployments', nargs='+', choices=sorted(DEPLOYMENTS), default=['wsgi', 'asgi'],
+            help='Deployments to benchmark (default: both)'
+        )
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes (default: 2)')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker (default: 4)')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections (default: 32)')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per endpoint (default: 10)')
+        parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds per endpoint (default: 2)')
+        parser.add_argument('--port', type=int, default=8765, help='Port the servers listen on (default: 8765)')
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Turn the response cache on (needs REDIS_URL); by default every request reaches the database'
+        )
+        parser.add_argument('--endpoints', nargs='+', help='Only these endpoint names')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        # Median targets: the busiest threads measure serialization size, not the deployment
+        poem = typical(Poem.objects.all(), 'comments_count')
+        comment = typical(Comment.objects.filter(depth=0), 'replies_count')
+        if poem is None or comment is None:
+            raise CommandError("No poems or comments to read; seed the database first (manage.py seed_muse)")
+        paths = build_paths(poem, comment, poem.user_id)
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(paths)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            paths = {name: path for name, path in paths.items() if name in options['endpoints']}
+
+        results = {}
+        for deployment in options['deployments']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{deployment.upper()} deployment"))
+            with Server(deployment, options):
+                results[deployment] = {}
+                for name, path in paths.items():
+                    LoadRun(options['port'], path, options['concurrency'], options['warmup']).run()
+                    result = LoadRun(options['port'], path, options['concurrency'], options['duration']).run()
+                    results[deployment][name] = result
+                    self.stdout.write(
+                        f"  {name:<20} {result['throughput']:>9} req/s  p50 {result['p50_ms']} ms  "
+                        f"p95 {result['p95_ms']} ms  errors {result['errors']}"
+                    )
+
+        if {'wsgi', 'asgi'} <= results.keys():
+            self.stdout.write(self.style.MIGRATE_HEADING("ASGI / WSGI throughput"))
+            for name in paths:
+                wsgi, asgi = results['wsgi'][name]['throughput'], results['asgi'][name]['throughput']
+                ratio = f"{asgi / wsgi:.2f}x" if wsgi else 'n/a'
+                self.stdout.write(f"  {name:<20} {ratio}")
+
+        if options['output']:
+            report = {
+                'settings': {
+                    key: options[key] for key in ('workers', 'threads', 'concurrency', 'duration', 'cache')
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+
+class Server:
+    """A gunicorn process serving one deployment, for the duration of a ``with`` block"""
+
+    def __init__(self, deployment, options):
+        self.port = options['port']
+        self.command = [
+            sys.executable, '-m', 'gunicorn', *DEPLOYMENTS[deployment],
+            '--config', 'gunicorn.conf.py',
+            '--bind', f"127.0.0.1:{self.port}",
+            '--workers', str(options['workers']),
+            '--threads', str(options['threads']),
+            '--log-level', 'warning',
+        ]
+        self.env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings')}
+        # The response cache needs a shared cache, so --cache needs REDIS_URL
+        self.env['POETRY_RESPONSE_CACHE'] = '1' if options['cache'] else '0'
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=settings.BASE_DIR, env=self.env)
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Server exited with status {self.process.returncode}: {' '.join(self.command)}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise CommandError(f"Server did not accept connections within {READY_TIMEOUT}s")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete token revocations and rotated refresh token claims that no live token can match"
+
+    def handle(self, *args, **options):
+        revoked, rotated = purge_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {revoked} expired revocations and {rotated} expired refresh token claims"
+        ))
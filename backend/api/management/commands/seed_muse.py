@@ -0,0 +1,196 @@
+from collections import defaultdict
+import random
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from poetry.models import Comment, Like, Poem
+from users.models import Profile
+
+User = get_user_model()
+
+# Deepest reply level generated; the comment path column holds 13 UUIDs
+MAX_SUPPORTED_DEPTH = 12
+
+WORDS = (
+    'light', 'river', 'silence', 'ember', 'harbor', 'winter', 'orchard', 'salt', 'lantern', 'moth',
+    'thunder', 'glass', 'hollow', 'meadow', 'iron', 'veil', 'marrow', 'tide', 'ash', 'lullaby',
+    'cathedral', 'wound', 'honey', 'compass', 'feather', 'dusk', 'granite', 'threshold', 'echo', 'bloom',
+)
+
+
+def zipf_weights(count, skew):
+    """Weights for ranks 1..count following a Zipf law; rank 1 is the most active"""
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+class MuseDataGenerator:
+    """
+    Build synthetic users, poems, comment threads and likes with skewed activity.
+
+    A few users write most poems, a few poems draw most comments and likes,
+    and replies favour continuing the latest branch so threads grow deep.
+    """
+
+    def __init__(self, rng, skew, max_depth, batch_size, password):
+        self.rng = rng
+        self.skew = skew
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.password_hash = make_password(password)
+
+    def text(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def ranked(self, items):
+        """Shuffle ``items`` and pair them with Zipf weights, so popularity is random but skewed"""
+        items = list(items)
+        self.rng.shuffle(items)
+        return items, zipf_weights(len(items), self.skew)
+
+    def create_users(self, count):
+        token = uuid.UUID(int=self.rng.getrandbits(128)).hex[:8]
+        users = [
+            User(
+                username=f"seed_{token}_{index}",
+                email=f"seed_{token}_{index}@example.com",
+                password=self.password_hash,
+            )
+            for index in range(count)
+        ]
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        # bulk_create bypasses User.save, which normally creates the profile
+        Profile.objects.bulk_create(
+            [Profile(user=user, avatar_url=f"https://robohash.org/{user.username}") for user in users],
+            batch_size=self.batch_size,
+        )
+        return users
+
+    def create_poems(self, users, count):
+        authors, weights = self.ranked(users)
+        poems = [
+            Poem(
+                user=author,
+                title=self.text(1, 4).title(),
+                description=self.text(5, 20),
+                content='\n'.join(self.text(3, 9) for _ in range(self.rng.randint(4, 40))),
+                thoughts=self.text(0, 30),
+            )
+            for author in self.rng.choices(authors, weights, k=count)
+        ]
+        Poem.allocate_slugs(poems)
+        return Poem.objects.bulk_create(poems, batch_size=self.batch_size)
+
+    def create_comments(self, users, poems, count):
+        commenters, user_weights = self.ranked(users)
+        targets, poem_weights = self.ranked(poems)
+        per_poem = defaultdict(int)
+        for poem in self.rng.choices(targets, poem_weights, k=count):
+            per_poem[poem] += 1
+
+        created = []
+        batch = []
+        for poem, total in per_poem.items():
+            thread = []
+            depths = {}
+            for _ in range(total):
+                parent = None
+                if thread and self.rng.random() < 0.7:
+                    # Mostly continue the newest branch, which builds long chains
+                    parent = thread[-1] if self.rng.random() < 0.5 else self.rng.choice(thread)
+                    if depths[parent.id] >= self.max_depth:
+                        parent = None
+                comment = Comment(
+                    id=uuid.uuid4(),
+                    user=self.rng.choices(commenters, user_weights)[0],
+                    poem=poem,
+                    parent=parent,
+                    content=self.text(3, 40),
+                )
+                depths[comment.id] = depths[parent.id] + 1 if parent else 0
+                thread.append(comment)
+            batch.extend(thread)
+            # Flush whole threads only, so every parent precedes its replies
+            if len(batch) >= self.batch_size:
+                created.extend(Comment.bulk_create_thread(batch, batch_size=self.batch_size))
+                batch = []
+        if batch:
+            created.extend(Comment.bulk_create_thread(batch, batch_size=self.batch_size))
+        return created
+
+    def create_likes(self, users, poems, comments, count):
+        likers, user_weights = self.ranked(users)
+        poem_targets, poem_weights = self.ranked(poems)
+        comment_targets, comment_weights = self.ranked(comments)
+
+        seen = set()
+        likes = []
+        # Most likes go to poems; a user likes each target at most once
+        for _ in range(count * 3):
+            if len(likes) >= count:
+                break
+            user = self.rng.choices(likers, user_weights)[0]
+            if comment_targets and self.rng.random() < 0.25:
+                target = self.rng.choices(comment_targets, comment_weights)[0]
+                like = Like(user=user, content_type='comment', comment=target)
+            elif poem_targets:
+                target = self.rng.choices(poem_targets, poem_weights)[0]
+                like = Like(user=user, content_type='poem', poem=target)
+            else:
+                break
+            key = (user.pk, like.content_type, target.pk)
+            if key not in seen:
+                seen.add(key)
+                likes.append(like)
+        return Like.objects.bulk_create(likes, batch_size=self.batch_size, ignore_conflicts=True)
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate users, poems, deeply nested comment threads and likes with skewed activity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Users to create (default: 50)')
+        parser.add_argument('--poems', type=int, default=200, help='Poems to create (default: 200)')
+        parser.add_argument('--comments', type=int, default=2000, help='Comments and replies to create (default: 2000)')
+        parser.add_argument('--likes', type=int, default=5000, help='Poem and comment likes to create (default: 5000)')
+        parser.add_argument(
+            '--max-depth', type=int, default=8,
+            help=f'Deepest reply level (default: 8, at most {MAX_SUPPORTED_DEPTH})'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of user and poem popularity; higher is more concentrated (default: 1.1)'
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT (default: 1000)')
+        parser.add_argument(
+            '--password', default='seed-password',
+            help='Password of every generated user (default: seed-password)'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['max_depth'] <= MAX_SUPPORTED_DEPTH:
+            raise CommandError(f"--max-depth must be between 0 and {MAX_SUPPORTED_DEPTH}")
+        if options['users'] < 1 and (options['poems'] or options['comments'] or options['likes']):
+            raise CommandError("--users must be at least 1 to create content")
+
+        generator = MuseDataGenerator(
+            random.Random(options['seed']), options['skew'], options['max_depth'],
+            options['batch_size'], options['password'],
+        )
+
+        users = generator.create_users(options['users'])
+        self.stdout.write(f"Created {len(users)} users")
+        poems = generator.create_poems(users, options['poems'])
+        self.stdout.write(f"Created {len(poems)} poems")
+        comments = generator.create_comments(users, poems, options['comments']) if poems else []
+        self.stdout.write(f"Created {len(comments)} comments")
+        likes = generator.create_likes(users, poems, comments, options['likes'])
+        self.stdout.write(f"Created {len(likes)} likes")
+
+        # Likes were inserted without signals; recount every stored counter
+        call_command('reconcile_counters', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Seeding complete"))
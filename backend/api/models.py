@@ -1,3 +1,26 @@
 from django.db import models
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """
+    One entry of the revocation log (see ``api.revocation``).
+
+    Tokens under ``key`` are void until ``expires_at``: all of them, or only
+    those issued before ``issued_before`` when it is set. The id numbers
+    the log, so processes read only the entries added since their last sync.
+    """
+    key = models.CharField(max_length=255, db_index=True)
+    issued_before = models.FloatField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class RotatedRefreshToken(models.Model):
+    """A refresh token already exchanged for a new one, kept until it would have expired"""
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
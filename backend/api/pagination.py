@@ -1,14 +1,260 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
 
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class StandardResultsSetPagination(PageNumberPagination):
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination for API results, by page number or by opaque keyset cursor.
+
+    Page mode (``?page=N``) slices with OFFSET. Cursor mode is selected by
+    passing ``?cursor=`` (empty for the first page) and seeks on the
+    queryset's leading ordering field plus the primary key, so every page
+    costs the same no matter how deep it is.
+
+    ``?count=exact|approximate|none`` controls the total: exact runs a
+    COUNT, approximate reads the planner's row estimate where the database
+    offers one. Page mode defaults to exact, cursor mode to none.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    page_query_param = 'page'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_modes = ('exact', 'approximate', 'none')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window = self.get_window(queryset, request)
+        self.count = self.get_count(queryset)
+        return self.finish_page(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, querying through the async ORM"""
+        window = self.get_window(queryset, request)
+        self.count = await self.aget_count(queryset)
+        return self.finish_page([row async for row in window])
+
+    def get_window(self, queryset, request):
+        """Read the request's paging parameters and return the (unevaluated) rows to fetch"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next = None
+        self.previous = None
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.use_cursor = cursor is not None
+        self.count_mode = self.get_count_mode(request)
+
+        if self.use_cursor:
+            return self.get_cursor_window(queryset, cursor)
+        return self.get_page_window(queryset, request)
+
+    def finish_page(self, rows):
+        """Trim the fetched rows to one page and set the next/previous links"""
+        if self.use_cursor:
+            return self.finish_cursor_page(rows)
+        return self.finish_page_number_page(rows)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.next,
+            'previous': self.previous,
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    # Totals
+
+    def get_count_mode(self, request):
+        default = 'none' if self.use_cursor else 'exact'
+        mode = request.query_params.get(self.count_query_param, default)
+        if mode not in self.count_modes:
+            raise ValidationError({self.count_query_param: f"Must be one of: {', '.join(self.count_modes)}"})
+        return mode
+
+    def get_count(self, queryset):
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'approximate':
+            return approximate_count(queryset)
+        return None
+
+    async def aget_count(self, queryset):
+        if self.count_mode == 'exact':
+            return await queryset.acount()
+        if self.count_mode == 'approximate':
+            return await sync_to_async(approximate_count)(queryset)
+        return None
+
+    # Page number mode
+
+    def get_page_window(self, queryset, request):
+        try:
+            page = int(request.query_params.get(self.page_query_param, 1))
+        except (TypeError, ValueError):
+            raise NotFound('Invalid page.')
+        if page < 1:
+            raise NotFound('Invalid page.')
+
+        self.page_number = page
+        start = (page - 1) * self.page_size
+        # Fetch one extra row to learn whether a next page exists without counting
+        return queryset[start:start + self.page_size + 1]
+
+    def finish_page_number_page(self, rows):
+        url = self.request.build_absolute_uri()
+        if len(rows) > self.page_size:
+            self.next = replace_query_param(url, self.page_query_param, self.page_number + 1)
+        if self.page_number > 1:
+            self.previous = replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return rows[:self.page_size]
+
+    # Cursor mode
+
+    def get_cursor_window(self, queryset, cursor):
+        ordering, field, descending = self.get_ordering(queryset)
+        position = self.decode_cursor(cursor, ordering) if cursor else None
+        reverse = bool(position and position['r'])
+
+        key_fields = [field] if field.primary_key else [field, queryset.model._meta.pk]
+        step_descending = descending != reverse
+        prefix = '-' if step_descending else ''
+        queryset = queryset.order_by(*[f'{prefix}{f.name}' for f in key_fields])
+
+        if position:
+            values = self.cursor_values(key_fields, position['v'])
+            queryset = queryset.filter(self.seek_filter(key_fields, values, step_descending))
+
+        self.cursor_state = (ordering, key_fields, position, reverse)
+        return queryset[:self.page_size + 1]
+
+    def finish_cursor_page(self, rows):
+        ordering, key_fields, position, reverse = self.cursor_state
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if rows:
+            if has_more or reverse:
+                self.next = self.cursor_link(ordering, key_fields, rows[-1], reverse=False)
+            if (has_more and reverse) or (position and not reverse):
+                self.previous = self.cursor_link(ordering, key_fields, rows[0], reverse=True)
+        return rows
+
+    def get_ordering(self, queryset):
+        """Return the ordering string, its model field and direction"""
+        order_by = queryset.query.order_by or queryset.model._meta.ordering
+        ordering = order_by[0] if order_by else 'pk'
+        if not isinstance(ordering, str) or '__' in ordering:
+            raise ValidationError({self.cursor_query_param: 'Cursor pagination is not supported for this ordering'})
+
+        descending = ordering.startswith('-')
+        name = ordering.lstrip('-')
+        opts = queryset.model._meta
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except Exception:
+            raise ValidationError({self.cursor_query_param: 'Cursor pagination is not supported for this ordering'})
+        if not field.concrete or field.null:
+            raise ValidationError({self.cursor_query_param: 'Cursor pagination is not supported for this ordering'})
+        return ordering, field, descending
+
+    @staticmethod
+    def seek_filter(key_fields, values, descending):
+        """Row-value comparison ``(a, b) > (x, y)`` spelled out as Q objects"""
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(key_fields, values):
+            condition |= Q(**equal, **{f'{field.attname}__{lookup}': value})
+            equal[field.attname] = value
+        return condition
+
+    @staticmethod
+    def encode_cursor(ordering, key_fields, row, reverse=False):
+        """Opaque cursor positioned just after (or, reversed, before) ``row``"""
+        position = {
+            'o': ordering,
+            'v': [field.value_to_string(row) for field in key_fields],
+            'r': reverse,
+        }
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def cursor_link(self, ordering, key_fields, row, reverse):
+        cursor = self.encode_cursor(ordering, key_fields, row, reverse)
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, cursor, ordering):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            valid = position['o'] == ordering and isinstance(position['v'], list)
+            position['r'] = bool(position.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            valid = False
+        if not valid:
+            raise NotFound('Invalid cursor')
+        return position
+
+    @staticmethod
+    def cursor_values(key_fields, values):
+        """A decoded cursor's position as one Python value per key field"""
+        # A missing tiebreaker would silently seek on the ordering field alone
+        if len(values) != len(key_fields) or None in values:
+            raise NotFound('Invalid cursor')
+        try:
+            return [field.to_python(value) for field, value in zip(key_fields, values)]
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+
+def approximate_count(queryset):
+    """
+    Estimate the number of rows a queryset returns from planner statistics.
+
+    Only PostgreSQL exposes a row estimate; other backends fall back to an
+    exact COUNT.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class StandardResultsSetPagination(KeysetPagination):
     """Standard pagination for API results"""
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
-    
-class LargeResultsSetPagination(PageNumberPagination):
+
+
+class FeedResultsSetPagination(StandardResultsSetPagination):
+    """Pagination for the poem feed"""
+    page_size = 20
+
+
+class LargeResultsSetPagination(KeysetPagination):
     """Pagination for large result sets"""
     page_size = 50
     page_size_query_param = 'page_size'
-    max_page_size = 200
\ No newline at end of file
+    max_page_size = 200
@@ -0,0 +1,244 @@
+"""
+Revoked JWTs: a denylist in the database behind an in-process Bloom filter.
+
+Logging out revokes the login session a token belongs to (its ``sid``
+claim), changing a password revokes every token issued to the user until
+then. Each revocation is a ``RevokedToken`` row, kept for as long as a
+token it covers can live; the row ids number a log shared by every
+process. Each process folds the rows added since its last read into a
+local Bloom filter at most once per ``JWT_DENYLIST_SYNC_SECONDS``, so
+checking a token nobody revoked costs a few hashes; only filter hits
+(revoked tokens and rare false positives) read the denylist itself.
+
+Revocations apply at once in the process that makes them and within the
+sync interval in the others. Rotated refresh tokens are not logged: the
+refresh endpoint claims each one once, with a conflict-tolerant INSERT
+into ``RotatedRefreshToken``.
+"""
+from datetime import datetime, timezone
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken, RotatedRefreshToken
+
+# Login session claim; set on the first refresh token and kept through rotation and into access tokens
+SESSION_CLAIM = 'sid'
+
+USER_KEY = 'user:{}'
+
+# A log id missing this long after a later one appeared was rolled back, not still being committed
+PENDING_SECONDS = 60
+# Only ids this close to the newest can still be committing; older gaps are rollbacks
+PENDING_WINDOW = 1000
+
+
+def _revocations():
+    # Always the primary: a lagging replica would delay revocations past the sync interval
+    return RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class BloomFilter:
+    """Set of strings in a fixed bit array; may answer a false "present", never a false "absent"."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self.positions(key)
+        with self.lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class Denylist:
+    """
+    This process's view of the revocation log.
+
+    ``applied`` is the highest log id folded into the filter; lower ids
+    that were not committed yet when it was read wait in ``pending``.
+    When the filter holds ``capacity`` keys it is rebuilt from the
+    revocations that have not expired.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.reset()
+
+    def new_filter(self, keys=0):
+        # Sized so a rebuild leaves room to grow, however many revocations are live
+        return BloomFilter(max(self.capacity or settings.JWT_DENYLIST_CAPACITY, 2 * keys))
+
+    def reset(self):
+        self.filter = self.new_filter()
+        self.applied = 0
+        self.pending = {}
+        self.synced_at = None
+
+    def is_stale(self):
+        return self.synced_at is None or time.monotonic() - self.synced_at >= settings.JWT_DENYLIST_SYNC_SECONDS
+
+    def entries_to_read(self):
+        """Query for the log entries this process has not folded in yet"""
+        if self.filter.count >= self.filter.capacity:
+            return _revocations().filter(expires_at__gt=_now()).values_list('pk', 'key')
+        return _revocations().filter(Q(pk__gt=self.applied) | Q(pk__in=list(self.pending))).values_list('pk', 'key')
+
+    def apply(self, entries):
+        """Fold fetched log ``entries`` (id, key) into the filter"""
+        now = time.monotonic()
+        rebuild = self.filter.count >= self.filter.capacity
+        bloom = self.new_filter(len(entries)) if rebuild else self.filter
+        found = set()
+        for number, key in entries:
+            bloom.add(key)
+            found.add(number)
+        generation = max(found, default=self.applied)
+        # Ids skipped below the newest one belong to transactions still committing, or rolled back
+        for number in range(max(self.applied, generation - PENDING_WINDOW) + 1, generation):
+            if number not in found:
+                self.pending.setdefault(number, now)
+        self.pending = {
+            number: seen for number, seen in self.pending.items()
+            if number not in found and now - seen < PENDING_SECONDS
+        }
+        self.filter = bloom
+        self.applied = max(self.applied, generation)
+        self.synced_at = now
+
+    def sync(self):
+        # Another thread already syncing: check against the filter as it is
+        if not self.is_stale() or not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.apply(list(self.entries_to_read()))
+        finally:
+            self.lock.release()
+
+    async def async_sync(self):
+        if not self.is_stale() or not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.apply([entry async for entry in self.entries_to_read()])
+        finally:
+            self.lock.release()
+
+    def revoke(self, key, issued_before=None):
+        """Deny tokens under ``key`` (only those issued before ``issued_before``, if given) while they can live"""
+        revocation = _revocations().create(
+            key=key, issued_before=issued_before, expires_at=_now() + api_settings.REFRESH_TOKEN_LIFETIME
+        )
+        self.filter.add(revocation.key)
+
+    def live(self, keys):
+        return _revocations().filter(key__in=keys, expires_at__gt=_now()).values_list('key', 'issued_before')
+
+    def lookup(self, keys):
+        """The live revocations of ``keys`` the filter may hold, as key: issued_before (None voids every token)"""
+        self.sync()
+        candidates = [key for key in keys if key in self.filter]
+        return _fold(self.live(candidates)) if candidates else {}
+
+    async def alookup(self, keys):
+        await self.async_sync()
+        candidates = [key for key in keys if key in self.filter]
+        return _fold([entry async for entry in self.live(candidates)]) if candidates else {}
+
+
+def _fold(entries):
+    """Merge revocations of the same key: revoking everything beats any cut-off, a later cut-off beats an earlier one"""
+    found = {}
+    for key, issued_before in entries:
+        if key not in found or issued_before is None:
+            found[key] = issued_before
+        elif found[key] is not None:
+            found[key] = max(found[key], issued_before)
+    return found
+
+
+denylist = Denylist()
+
+
+def session_id(token):
+    """The login session ``token`` belongs to; tokens issued before sessions existed are their own"""
+    return token.get(SESSION_CLAIM) or token[api_settings.JTI_CLAIM]
+
+
+def revoke_session(token):
+    """Void ``token`` and every token refreshed from the same login"""
+    denylist.revoke(session_id(token))
+
+
+def revoke_user(user_id):
+    """Void every token issued to the user until now"""
+    denylist.revoke(USER_KEY.format(user_id), time.time())
+
+
+def claim_refresh(token):
+    """Mark a refresh token used by rotation; False if it already was"""
+    connection = connections[DEFAULT_DB_ALIAS]
+    expires_at = datetime.fromtimestamp(token['exp'], timezone.utc)
+    # A single statement, so two concurrent refreshes cannot both claim the token
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {connection.ops.quote_name(RotatedRefreshToken._meta.db_table)} (jti, expires_at) "
+            f"VALUES (%s, %s) ON CONFLICT (jti) DO NOTHING",
+            [token[api_settings.JTI_CLAIM], connection.ops.adapt_datetimefield_value(expires_at)],
+        )
+        return cursor.rowcount == 1
+
+
+def purge_expired(now=None):
+    """Delete revocations and claims no live token can match; returns the rows deleted of each"""
+    now = now or _now()
+    revoked, _ = _revocations().filter(expires_at__lte=now).delete()
+    rotated, _ = RotatedRefreshToken.objects.using(DEFAULT_DB_ALIAS).filter(expires_at__lte=now).delete()
+    return revoked, rotated
+
+
+def _keys(token):
+    return (session_id(token), token[api_settings.JTI_CLAIM], USER_KEY.format(token[api_settings.USER_ID_CLAIM]))
+
+
+def _is_revoked(token, found):
+    if not found:
+        return False
+    session, jti, user = _keys(token)
+    # Users are revoked as of a time: tokens issued later stand
+    return (
+        session in found or jti in found
+        or (user in found and (found[user] is None or token.get('iat', 0) < found[user]))
+    )
+
+
+def is_revoked(token):
+    return _is_revoked(token, denylist.lookup(_keys(token)))
+
+
+async def ais_revoked(token):
+    return _is_revoked(token, await denylist.alookup(_keys(token)))
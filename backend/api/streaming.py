@@ -0,0 +1,35 @@
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(batches):
+    """
+    Encode batches of already-serialized items as one JSON array, piece by piece.
+
+    Only one batch is held in memory at a time.
+    """
+    encoder = JSONEncoder(separators=(',', ':'))
+    yield '['
+    first = True
+    for batch in batches:
+        for item in batch:
+            yield encoder.encode(item) if first else ',' + encoder.encode(item)
+            first = False
+    yield ']'
+
+
+def streaming_json_response(batches):
+    """Stream batches of serialized items to the client as a JSON array"""
+    return StreamingHttpResponse(iter_json_array(batches), content_type='application/json')
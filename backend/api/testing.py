@@ -0,0 +1,164 @@
+from collections import Counter
+import io
+import json
+import random
+import re
+from urllib.parse import urlsplit
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from .authentication import ClaimsRefreshToken, user_states
+from .revocation import denylist
+
+# Password of every user created by seed_muse in tests
+SEED_PASSWORD = 'seed-password'
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN \((?:\?, )*\?\)")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so repeated statements group together"""
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LISTS.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def describe_queries(queries):
+    """One line per distinct query fingerprint, most frequent first"""
+    counts = Counter(fingerprint(query['sql']) for query in queries)
+    return '\n'.join(f"  {count} x {sql}" for sql, count in counts.most_common())
+
+
+def seed(seed, **counts):
+    """Run seed_muse quietly with a fixed random seed"""
+    call_command('seed_muse', seed=seed, password=SEED_PASSWORD, stdout=io.StringIO(), **counts)
+
+
+def grow_thread(poem, users, comments, rng):
+    """Add ``comments`` comments and replies to ``poem``, nesting some of them deeply"""
+    from poetry.models import Comment
+
+    existing = list(Comment.objects.filter(poem=poem))
+    batch = []
+    for index in range(comments):
+        parents = existing + batch
+        parent = rng.choice(parents) if parents and rng.random() < 0.7 else None
+        if parent is not None and parent.depth >= 8:
+            parent = None
+        comment = Comment(id=uuid.uuid4(), user=rng.choice(users), poem=poem, parent=parent, content=f"grown {index}")
+        comment.depth = parent.depth + 1 if parent else 0
+        batch.append(comment)
+    Comment.bulk_create_thread(batch)
+
+
+def like_everything(user, poems=(), comments=()):
+    """Have ``user`` like the given poems and comments, without going through the API"""
+    from poetry.models import Like
+
+    Like.objects.bulk_create(
+        [Like(user=user, content_type='poem', poem=poem) for poem in poems] +
+        [Like(user=user, content_type='comment', comment=comment) for comment in comments],
+        ignore_conflicts=True,
+    )
+
+
+def call_async_view(view, path, **headers):
+    """
+    GET ``path`` through an async view, bypassing the URLconf (which routes
+    to the sync views unless ``ASYNC_READ_VIEWS`` is set).
+    """
+    request = RequestFactory().get(path, **headers)
+    match = resolve(urlsplit(path).path)
+    return async_to_sync(view)(request, *match.args, **match.kwargs)
+
+
+# Revocations are read once per sync interval; keep that read out of the measured requests
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], JWT_DENYLIST_SYNC_SECONDS=3600,
+)
+class QueryBudgetTestCase(TestCase):
+    """
+    Base for tests asserting how many SQL queries an endpoint may issue.
+
+    ``assertQueryBudget`` measures a request on the seeded data, calls
+    ``grow()`` to add data, and measures it again: both runs must stay
+    within the budget and issue the same number of queries. Failures list
+    the offending statements by fingerprint.
+    """
+    # seed_muse arguments for the initial data set and for every growth step
+    seed_counts = {'users': 6, 'poems': 10, 'comments': 40, 'likes': 60}
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(1, **cls.seed_counts)
+        cls.rng = random.Random(1)
+
+    def grow(self):
+        """Add another seeded batch; subclasses also grow the objects their tests target"""
+        seed(self.rng.randrange(1 << 30), **self.seed_counts)
+
+    def setUp(self):
+        # Users rolled back with the previous test may reappear under the same id
+        user_states.clear()
+        # ...and so may their revocations, which this process's filter still holds
+        denylist.reset()
+
+    def auth_headers(self, user):
+        return {'HTTP_AUTHORIZATION': f"Bearer {ClaimsRefreshToken.for_user(user).access_token}"}
+
+    def measure(self, method, path, data=None, user=None, status=200):
+        """Issue one request with a cold response cache and return the queries it ran"""
+        cache.clear()
+        headers = self.auth_headers(user) if user is not None else {}
+        body = json.dumps(data) if data is not None else ''
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.generic(method, path, body, content_type='application/json', **headers)
+        if status is not None:
+            self.assertEqual(
+                response.status_code, status,
+                f"{method} {path} returned {response.status_code}: {getattr(response, 'content', b'')[:300]!r}"
+            )
+        return captured.captured_queries
+
+    def assertQueryBudget(self, budget, method, path, data=None, user=None, status=200, prepare=None):
+        """
+        Assert a request stays within ``budget`` queries before and after the data grows.
+
+        ``prepare`` runs before each measurement, e.g. to undo a write. An
+        unmeasured warm-up request first fills per-process caches such as
+        backend introspection, which would otherwise count against whichever
+        test happens to run first.
+        """
+        if prepare is not None:
+            prepare()
+        self.measure(method, path, data, user, status)
+
+        runs = []
+        for stage in ('seeded', 'grown'):
+            if stage == 'grown':
+                self.grow()
+            if prepare is not None:
+                prepare()
+            queries = self.measure(method, path, data, user, status)
+            if len(queries) > budget:
+                self.fail(
+                    f"{method} {path} ran {len(queries)} queries on {stage} data, budget is {budget}:\n"
+                    f"{describe_queries(queries)}"
+                )
+            runs.append(queries)
+
+        seeded, grown = runs
+        if len(seeded) != len(grown):
+            self.fail(
+                f"{method} {path} ran {len(seeded)} queries on seeded data but {len(grown)} after growth:\n"
+                f"seeded:\n{describe_queries(seeded)}\ngrown:\n{describe_queries(grown)}"
+            )
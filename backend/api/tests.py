@@ -1,3 +1,634 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from datetime import datetime, timedelta, timezone
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, router, transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from prometheus_client import REGISTRY
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+import io
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import urlsplit
+import uuid
 
-# Create your tests here.
+from api.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, user_states
+from api.management.commands.benchmark_muse import (
+    SKIPPED, Command as BenchmarkCommand, build_cases, iter_endpoints, percentile, view_name,
+)
+from api.management.commands.seed_muse import MAX_SUPPORTED_DEPTH
+from api.models import RevokedToken, RotatedRefreshToken
+from api.revocation import (
+    USER_KEY, BloomFilter, Denylist, _is_revoked, _keys, claim_refresh, denylist, revoke_session, revoke_user,
+)
+from core import replicas
+from core.db.pool import ConnectionPool, PoolTimeout, close_pools
+from core.logs import ProcessSafeRotatingFileHandler, QueueHandler, SamplingFilter
+from poetry.models import Comment, Like, Poem
+from users.models import Profile
+from .testing import SEED_PASSWORD, describe_queries, fingerprint, seed
+
+
+class FingerprintTests(SimpleTestCase):
+
+    def test_literals_and_in_lists_collapse(self):
+        first = fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'o''brien'  LIMIT 21")
+        second = fingerprint("SELECT * FROM t WHERE id IN (7) AND name = 'x' LIMIT 1")
+        self.assertEqual(first, second)
+        self.assertEqual(first, "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+
+    def test_describe_groups_repeated_queries(self):
+        queries = [{'sql': f"SELECT * FROM t WHERE id = {pk}"} for pk in range(3)]
+        queries.append({'sql': "SELECT COUNT(*) FROM t"})
+        self.assertEqual(
+            describe_queries(queries),
+            "  3 x SELECT * FROM t WHERE id = ?\n  1 x SELECT COUNT(*) FROM t",
+        )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SeedMuseTests(TestCase):
+    counts = {'users': 5, 'poems': 12, 'comments': 60, 'likes': 80}
+
+    def snapshot(self):
+        return (
+            list(get_user_model().objects.order_by('username').values_list('username', flat=True)),
+            list(Poem.objects.order_by('title', 'slug').values_list('title', 'slug')),
+            Comment.objects.count(),
+            Like.objects.count(),
+        )
+
+    def test_creates_the_requested_data(self):
+        seed(1, max_depth=3, **self.counts)
+        users = get_user_model().objects.all()
+        self.assertEqual(users.count(), 5)
+        self.assertEqual(Profile.objects.count(), 5)
+        self.assertTrue(users[0].check_password(SEED_PASSWORD))
+        self.assertEqual(Poem.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertTrue(0 < Like.objects.count() <= 80)
+        self.assertLessEqual(Comment.objects.aggregate(deepest=Max('depth'))['deepest'], 3)
+        for comment in Comment.objects.exclude(parent=None).select_related('parent'):
+            self.assertEqual(comment.depth, comment.parent.depth + 1)
+            self.assertEqual(comment.poem_id, comment.parent.poem_id)
+
+    def test_counters_are_reconciled(self):
+        seed(2, **self.counts)
+        poems = Poem.objects.annotate(liked=Count('likes', distinct=True), commented=Count('comments', distinct=True))
+        for poem in poems:
+            self.assertEqual((poem.likes_count, poem.comments_count), (poem.liked, poem.commented))
+        comments = Comment.objects.annotate(liked=Count('likes', distinct=True), replied=Count('replies', distinct=True))
+        for comment in comments:
+            self.assertEqual((comment.likes_count, comment.replies_count), (comment.liked, comment.replied))
+
+    def test_same_seed_gives_the_same_data(self):
+        seed(3, **self.counts)
+        first = self.snapshot()
+        get_user_model().objects.all().delete()
+        seed(3, **self.counts)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_rejects_unsupported_arguments(self):
+        with self.assertRaisesMessage(CommandError, '--max-depth'):
+            seed(1, max_depth=MAX_SUPPORTED_DEPTH + 1)
+        with self.assertRaisesMessage(CommandError, '--users'):
+            seed(1, users=0, poems=1)
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class BenchmarkMuseTests(SimpleTestCase):
+
+    def test_percentile_is_nearest_rank(self):
+        samples = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(samples, 0.5), 3)
+        self.assertEqual(percentile(samples, 0.95), 5)
+        self.assertEqual(percentile(samples, 0), 1)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+    def test_every_endpoint_is_timed_or_skipped(self):
+        fixtures = {
+            'poem': Poem(slug='benchmark'), 'user': get_user_model()(id=1),
+            'comment': Comment(id=uuid.uuid4()), 'own_comment': Comment(id=uuid.uuid4()),
+        }
+        cases = build_cases(fixtures)
+        covered = {(view, method) for _, view, method, _, _, _ in cases}
+        endpoints = set(iter_endpoints())
+        self.assertEqual(endpoints - covered - set(SKIPPED), set())
+        self.assertEqual((covered | set(SKIPPED)) - endpoints, set())
+        stderr = io.StringIO()
+        BenchmarkCommand(stderr=stderr).check_coverage(cases)
+        self.assertEqual(stderr.getvalue(), '')
+        for name, view, method, path, body, auth in cases:
+            self.assertEqual(view_name(resolve(urlsplit(path).path).func), view, name)
+
+    def test_unknown_sizes_are_rejected(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown sizes: huge'):
+            call_command('benchmark_muse', sizes='small,huge', stdout=io.StringIO())
+
+    def results(self, queries, p95):
+        return {'sizes': {'small': {'endpoints': {'poem_list': {'queries_max': queries, 'p95_ms': p95}}}}}
+
+    def test_compare_fails_only_on_more_queries(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as baseline:
+            json.dump(self.results(3, 10.0), baseline)
+        self.addCleanup(os.remove, baseline.name)
+
+        stdout = io.StringIO()
+        BenchmarkCommand(stdout=stdout).compare(baseline.name, self.results(3, 25.0))
+        self.assertIn('p95 x2.50  queries +0', stdout.getvalue())
+        BenchmarkCommand(stdout=io.StringIO()).compare(baseline.name, self.results(2, 5.0))
+        with self.assertRaisesMessage(CommandError, 'Query count grew for: small poem_list'):
+            BenchmarkCommand(stdout=io.StringIO()).compare(baseline.name, self.results(4, 5.0))
+
+
+class MetricsEndpointTests(TestCase):
+
+    @override_settings(METRICS_AUTH_TOKEN=None, DEBUG=True)
+    def test_reports_request_metrics(self):
+        self.client.get('/api/poems/')
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'muse_http_requests_total{', response.content)
+        self.assertIn(b'view="poetry.views.poem_list"', response.content)
+
+    @override_settings(METRICS_AUTH_TOKEN=None, DEBUG=False)
+    def test_hidden_in_production_without_a_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_requires_token_when_configured(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='secret').status_code, 401)
+        response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_counts_queries_and_statuses_per_view(self):
+        labels = {'view': 'poetry.views.poem_detail', 'method': 'GET'}
+        requests = self.sample('muse_http_requests_total', status='404', **labels)
+        observed = self.sample('muse_db_queries_per_request_count', **labels)
+        queries = self.sample('muse_db_queries_per_request_sum', **labels)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get('/api/poems/missing/').status_code, 404)
+
+        self.assertEqual(self.sample('muse_http_requests_total', status='404', **labels), requests + 1)
+        self.assertEqual(self.sample('muse_db_queries_per_request_count', **labels), observed + 1)
+        self.assertEqual(self.sample('muse_db_queries_per_request_sum', **labels), queries + len(captured))
+
+    def test_unresolved_paths_share_one_label(self):
+        before = self.sample('muse_http_requests_total', view='<unresolved>', method='GET', status='404')
+        self.client.get('/no/such/page/')
+        self.client.get('/nor/this/one/')
+        after = self.sample('muse_http_requests_total', view='<unresolved>', method='GET', status='404')
+        self.assertEqual(after, before + 2)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+
+    def record(self, msg, *args, level=logging.INFO):
+        return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+    def test_sampling_keeps_one_in_rate_below_level(self):
+        sampler = SamplingFilter(rate=0.25)
+        kept = [sampler.filter(self.record("like")) for _ in range(100)]
+        self.assertEqual(sum(kept), 25)
+        self.assertTrue(all(sampler.filter(self.record("x", level=logging.WARNING)) for _ in range(10)))
+
+    def test_prepare_defers_formatting_of_immutable_args(self):
+        handler = QueueHandler()
+        lazy = handler.prepare(self.record("Poem %s by %s", 7, 'ada'))
+        self.assertEqual((lazy.msg, lazy.args), ("Poem %s by %s", (7, 'ada')))
+
+        tags = ['a']
+        eager = handler.prepare(self.record("Tags %s", tags))
+        tags.append('b')
+        self.assertEqual((eager.msg, eager.args), ("Tags ['a']", None))
+
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = self.record("failed")
+            record.exc_info = sys.exc_info()
+        prepared = handler.prepare(record)
+        self.assertIsNone(prepared.exc_info)
+        self.assertIn("ValueError: boom", prepared.exc_text)
+
+    def test_listener_writes_through_output_logger(self):
+        output = logging.getLogger('api.tests.output')
+        collected = logging.handlers.BufferingHandler(capacity=100)
+        output.addHandler(collected)
+        self.addCleanup(output.removeHandler, collected)
+
+        handler = QueueHandler(output_logger='api.tests.output')
+        handler.handle(self.record("Comment %s", 3))
+        handler.stop_listener()
+        self.assertEqual([r.getMessage() for r in collected.buffer], ["Comment 3"])
+
+    def test_processes_sharing_a_file_rotate_safely(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'muse.log')
+        # Two handlers on one file stand in for two worker processes
+        workers = [ProcessSafeRotatingFileHandler(path, maxBytes=40, backupCount=50) for _ in range(2)]
+        for handler in workers:
+            self.addCleanup(handler.close)
+        for line in range(40):
+            workers[line % 2].emit(self.record("line %s", line))
+
+        written = []
+        for name in os.listdir(directory):
+            if not name.endswith('.lock'):
+                with open(os.path.join(directory, name)) as log:
+                    written.extend(log.read().split())
+        self.assertGreater(len(os.listdir(directory)), 3)
+        self.assertEqual(written.count('line'), 40)
+        self.assertEqual(sorted(int(text) for text in written if text.isdigit()), list(range(40)))
+
+
+@override_settings(JWT_DENYLIST_SYNC_SECONDS=3600)
+class ClaimsAuthenticationTests(TestCase):
+
+    def setUp(self):
+        user_states.clear()
+        # Read the revocation log up front; its periodic sync is not part of authenticating
+        denylist.reset()
+        denylist.sync()
+        self.user = get_user_model().objects.create_user(username='claims', password='pw')
+        self.authentication = ClaimsJWTAuthentication()
+
+    def authenticate(self, token):
+        return self.authentication.get_user(self.authentication.get_validated_token(str(token.access_token)))
+
+    def test_claims_answer_without_a_query(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertEqual((user.pk, user.username, user.is_authenticated), (self.user.pk, 'claims', True))
+        self.assertFalse(user.is_loaded)
+
+    def test_state_is_queried_once_per_ttl(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        user_states.clear()
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+            self.authenticate(token)
+
+    def test_other_fields_load_the_user(self):
+        user = self.authenticate(ClaimsRefreshToken.for_user(self.user))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.date_joined, self.user.date_joined)
+        self.assertTrue(user.is_loaded)
+
+    def test_deactivated_user_is_rejected(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_tokens_without_claims_load_the_user(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate(RefreshToken.for_user(self.user))
+        self.assertIsInstance(user, get_user_model())
+
+
+# No cache at all: every instance must find revocations through the database
+@override_settings(
+    JWT_DENYLIST_SYNC_SECONDS=0, CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+)
+class DenylistTests(TestCase):
+
+    def token(self, user_id=1):
+        token = RefreshToken()
+        token[jwt_settings.USER_ID_CLAIM] = user_id
+        return token
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [f'jti-{index}' for index in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 50)
+
+    def test_revocations_reach_other_processes(self):
+        revoking, other = Denylist(), Denylist()
+        other.sync()
+        revoking.revoke('session-1')
+        self.assertNotIn('session-1', other.filter)
+        self.assertEqual(other.lookup(['session-1', 'session-2']), {'session-1': None})
+
+    def test_logout_in_one_instance_is_seen_by_another(self):
+        token, other = self.token(), Denylist()
+        other.sync()
+        self.assertFalse(_is_revoked(token, other.lookup(_keys(token))))
+        revoke_session(token)
+        self.assertTrue(_is_revoked(token, other.lookup(_keys(token))))
+        self.assertTrue(_is_revoked(token, async_to_sync(Denylist().alookup)(_keys(token))))
+
+    def test_user_revocations_cover_tokens_issued_before(self):
+        earlier, other = self.token(user_id=7), Denylist()
+        revoke_user(7)
+        later = self.token(user_id=7)
+        later['iat'] = int(time.time()) + 5
+        self.assertTrue(_is_revoked(earlier, other.lookup(_keys(earlier))))
+        self.assertFalse(_is_revoked(later, other.lookup(_keys(later))))
+        # A second password change moves the cut-off forward
+        Denylist().revoke(USER_KEY.format(7), later['iat'] + 1)
+        self.assertTrue(_is_revoked(later, Denylist().lookup(_keys(later))))
+
+    def test_unrevoked_tokens_skip_the_database_between_syncs(self):
+        denylist = Denylist()
+        Denylist().revoke('session-1')
+        with override_settings(JWT_DENYLIST_SYNC_SECONDS=60):
+            denylist.sync()
+            with self.assertNumQueries(0):
+                self.assertEqual(denylist.lookup(['session-2']), {})
+
+    def test_entries_still_being_committed_are_read_later(self):
+        denylist = Denylist()
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        first = RevokedToken.objects.create(key='session-1', expires_at=expires_at)
+        RevokedToken.objects.create(pk=first.pk + 2, key='session-3', expires_at=expires_at)
+        denylist.sync()
+        self.assertEqual(denylist.pending.keys(), {first.pk + 1})
+        RevokedToken.objects.create(pk=first.pk + 1, key='session-2', expires_at=expires_at)
+        denylist.sync()
+        self.assertIn('session-2', denylist.filter)
+        self.assertEqual((denylist.applied, denylist.pending), (first.pk + 2, {}))
+
+    def test_full_filter_is_rebuilt_from_live_entries(self):
+        denylist, revoking = Denylist(capacity=4), Denylist()
+        for index in range(5):
+            revoking.revoke(f'session-{index}')
+        denylist.sync()
+        # The first two expire, then one more revocation arrives
+        RevokedToken.objects.filter(key__in=['session-0', 'session-1']).update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        revoking.revoke('session-5')
+        denylist.sync()
+        self.assertEqual(denylist.filter.count, 4)
+        self.assertNotIn('session-0', denylist.filter)
+        self.assertIn('session-5', denylist.filter)
+        self.assertEqual(denylist.lookup(['session-1', 'session-2']), {'session-2': None})
+
+    def test_refresh_tokens_are_claimed_once(self):
+        token = self.token()
+        self.assertTrue(claim_refresh(token))
+        self.assertFalse(claim_refresh(token))
+        self.assertTrue(claim_refresh(self.token()))
+
+    def test_purge_deletes_only_expired_rows(self):
+        revoke_session(self.token())
+        expired = self.token()
+        claim_refresh(expired)
+        claim_refresh(self.token())
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        RevokedToken.objects.create(key='session-old', expires_at=past)
+        RotatedRefreshToken.objects.filter(jti=expired[jwt_settings.JTI_CLAIM]).update(expires_at=past)
+        stdout = io.StringIO()
+        call_command('purge_revoked_tokens', stdout=stdout)
+        self.assertIn('Deleted 1 expired revocations and 1 expired refresh token claims', stdout.getvalue())
+        self.assertEqual((RevokedToken.objects.count(), RotatedRefreshToken.objects.count()), (1, 1))
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: its per-test transaction would keep every read on the primary
+
+    def setUp(self):
+        User = get_user_model()
+        self.writer = User.objects.create_user(username='writer', email='writer@example.com', password='pw-writer-1')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='pw-reader-1')
+        cache.clear()
+        self.set_replica_health(True)
+        self.addCleanup(replicas.health.checked.clear)
+
+    def set_replica_health(self, healthy):
+        replicas.health.checked['replica'] = (healthy, time.monotonic())
+
+    def read_database(self, method='GET', user=None):
+        """Database the router picks for reads while the middleware handles a request"""
+        headers = {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        request = RequestFactory().generic(method, '/api/poems/', **headers)
+        chosen = []
+
+        def view(request):
+            chosen.append(router.db_for_read(Poem))
+            return HttpResponse()
+
+        replicas.ReplicaMiddleware(view)(request)
+        return chosen[0]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.read_database(), 'replica')
+        self.assertEqual(self.read_database(user=self.reader), 'replica')
+        self.assertEqual(self.read_database('POST'), 'default')
+        self.assertEqual(router.db_for_read(Poem), 'default')
+
+    def test_writes_and_transactions_use_primary(self):
+        token = replicas._replica.set('replica')
+        self.addCleanup(replicas._replica.reset, token)
+        self.assertEqual(router.db_for_write(Poem), 'default')
+        self.assertEqual(router.db_for_read(Poem), 'replica')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Poem), 'default')
+
+    def test_writer_is_pinned_to_primary(self):
+        self.client.post(
+            '/api/poems/', {'title': 'Pinned', 'content': 'Lines'},
+            HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.writer).access_token}"
+        )
+        self.assertEqual(self.read_database(user=self.writer), 'default')
+        self.assertEqual(self.read_database(user=self.reader), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        self.client.post(
+            '/api/poems/', {},
+            HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.writer).access_token}"
+        )
+        self.assertEqual(self.read_database(user=self.writer), 'replica')
+
+    def test_pins_live_in_the_configured_cache(self):
+        caches_setting = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+            'pins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pins'},
+        }
+        with override_settings(CACHES=caches_setting, REPLICA_PIN_CACHE='pins'):
+            replicas.pin_to_primary(self.writer.pk)
+            self.assertIsNotNone(caches['pins'].get(replicas.PIN_KEY.format(self.writer.pk)))
+            caches['default'].clear()
+            self.assertEqual(self.read_database(user=self.writer), 'default')
+            caches['pins'].clear()
+            self.assertEqual(self.read_database(user=self.writer), 'replica')
+
+    def test_replicas_require_a_shared_pin_cache(self):
+        config = apps.get_app_config('api')
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DATABASE_REPLICA_URLS'):
+            config.ready()
+        shared = {
+            **settings.CACHES,
+            'pins': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/pins'},
+        }
+        with override_settings(CACHES=shared, REPLICA_PIN_CACHE='pins'):
+            config.ready()
+        with override_settings(REPLICA_DATABASES=[]):
+            config.ready()
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        self.set_replica_health(False)
+        self.assertEqual(self.read_database(), 'default')
+
+    def test_probe_checks_lag(self):
+        self.assertTrue(replicas.health.probe('default'))
+        with override_settings(REPLICA_MAX_LAG_SECONDS=-1):
+            self.assertFalse(replicas.health.probe('default'))
+
+
+class StandInConnection:
+    """Enough of a DB-API connection for the pool"""
+
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+
+    def close(self):
+        self.closed = True
+
+
+def ping_stand_in(connection):
+    if connection.broken:
+        raise ConnectionError("server closed the connection")
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def pool(self, **options):
+        return ConnectionPool('test', ping=ping_stand_in, **{'timeout': 0.05, **options})
+
+    def test_reuses_returned_connections(self):
+        pool = self.pool()
+        first = pool.acquire(StandInConnection)
+        pool.release(first)
+        self.assertIs(pool.acquire(StandInConnection), first)
+        self.assertEqual(pool.size, 1)
+
+    def test_waits_then_times_out_at_max_size(self):
+        pool = self.pool(max_size=1, timeout=2)
+        held = pool.acquire(StandInConnection)
+        threading.Timer(0.05, pool.release, [held]).start()
+        self.assertIs(pool.acquire(StandInConnection), held)
+
+        pool.timeout = 0.05
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(StandInConnection)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = self.pool(max_size=1)
+
+        def refuse():
+            raise ConnectionError("refused")
+
+        with self.assertRaises(ConnectionError):
+            pool.acquire(refuse)
+        self.assertEqual(pool.size, 0)
+        pool.acquire(StandInConnection)
+
+    def test_pings_idle_connections_and_replaces_broken_ones(self):
+        pool = self.pool(ping_after=0)
+        broken = pool.acquire(StandInConnection)
+        pool.release(broken)
+        broken.broken = True
+        replacement = pool.acquire(StandInConnection)
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_reaps_idle_connections_down_to_min_size(self):
+        pool = self.pool(min_size=1, max_idle=0)
+        connections = [pool.acquire(StandInConnection) for _ in range(3)]
+        for held in connections:
+            pool.release(held)
+        time.sleep(0.01)
+        pool.acquire(StandInConnection)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(sum(held.closed for held in connections), 2)
+
+    def test_replaces_connections_past_max_lifetime(self):
+        pool = self.pool(max_lifetime=0)
+        old = pool.acquire(StandInConnection)
+        pool.release(old)
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_close_closes_idle_and_returned_connections(self):
+        pool = self.pool()
+        idle, held = pool.acquire(StandInConnection), pool.acquire(StandInConnection)
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        pool.release(held)
+        self.assertTrue(held.closed)
+        self.assertEqual(pool.size, 0)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Pooled backend needs PostgreSQL")
+class PooledBackendTests(SimpleTestCase):
+
+    def wrapper(self):
+        from core.db.postgresql_pool.base import DatabaseWrapper
+        settings_dict = {**connection.settings_dict, 'ENGINE': 'core.db.postgresql_pool', 'POOL': {'MAX_SIZE': 2}}
+        wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+        self.addCleanup(close_pools, lambda key: key[0] == 'pool_test')
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_close_returns_the_connection_to_the_pool(self):
+        wrapper = self.wrapper()
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+        self.assertEqual(self.backend_pid(wrapper), pid)
+        wrapper.close()
+
+    def test_returned_connections_are_rolled_back(self):
+        wrapper = self.wrapper()
+        wrapper.set_autocommit(False)
+        pid = self.backend_pid(wrapper)
+        wrapper.close()
+        other = self.wrapper()
+        self.assertEqual(self.backend_pid(other), pid)
+        self.assertTrue(other.get_autocommit())
+        other.close()
@@ -1,9 +1,12 @@
 # api/urls.py
 from django.urls import path, include
 
+from . import views
+
 urlpatterns = [
     path('auth/', include('users.auth_urls')),
     path('users/', include('users.urls')),
     path('poems/', include('poetry.urls')),
     path('comments/', include('poetry.comments_urls')),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
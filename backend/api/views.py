@@ -1,3 +1,25 @@
-from django.shortcuts import render
+import secrets
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core.metrics import render_metrics
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus scrape endpoint for the request metrics of every worker.
+
+    Requires ``Authorization: Bearer <METRICS_AUTH_TOKEN>``. Without that
+    setting the endpoint is only served with ``DEBUG`` on.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseNotFound()
+    elif not secrets.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,30 @@
+"""
+Checks for features that keep state in a cache every process must see.
+
+LocMemCache lives inside one process: under several workers, or several
+servers, a value one of them sets is invisible to the rest.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends whose entries no other process can read
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(alias='default'):
+    """True when cache ``alias`` is visible to every process"""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def require_shared(alias, feature):
+    """Refuse to start ``feature`` on a cache other processes cannot see"""
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f"{feature} needs the cache '{alias}', which is not configured")
+    if not is_shared(alias):
+        raise ImproperlyConfigured(
+            f"{feature} needs a cache shared by every process, but '{alias}' is "
+            f"{settings.CACHES[alias]['BACKEND']}; set REDIS_URL or turn {feature} off"
+        )
@@ -0,0 +1,171 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+from core.metrics import DB_POOL_CONNECTIONS, DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No connection came free within the pool's timeout"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections to one database, in one process.
+
+    At most ``max_size`` connections are open at once; a checkout waits up
+    to ``timeout`` seconds for one to be returned before raising
+    ``PoolTimeout``. Connections idle for more than ``max_idle`` seconds are
+    closed, down to ``min_size``, and any connection older than
+    ``max_lifetime`` is replaced. A connection idle for at least
+    ``ping_after`` seconds is checked with ``ping`` (which raises when the
+    connection is broken) before it is handed out.
+    """
+
+    def __init__(self, name, min_size=0, max_size=10, timeout=10.0, max_idle=300.0,
+                 max_lifetime=3600.0, ping_after=10.0, ping=None):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.ping = ping
+        # (connection, returned at), most recently returned last
+        self.idle = collections.deque()
+        self.opened_at = {}
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def acquire(self, connect):
+        """Check out a connection, opening one with ``connect()`` if none is idle and there is room"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            connection, returned_at = self._checkout(deadline)
+            if connection is None:
+                connection = self._open(connect)
+            elif time.monotonic() - returned_at >= self.ping_after and not self._alive(connection):
+                self.release(connection, discard=True)
+                continue
+            DB_POOL_WAIT.labels(database=self.name).observe(time.monotonic() - start)
+            return connection
+
+    def release(self, connection, discard=False):
+        """Return a checked-out connection; ``discard`` closes it instead, e.g. when it is broken"""
+        now = time.monotonic()
+        with self.condition:
+            expired = now - self.opened_at.get(id(connection), now) >= self.max_lifetime
+            if discard or expired or self.closed:
+                self._close(connection)
+            else:
+                self.idle.append((connection, now))
+            self._reap(now)
+            self._report()
+            self.condition.notify()
+
+    def close(self):
+        """Close the idle connections now and the checked-out ones when they are returned"""
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                self._close(self.idle.popleft()[0])
+            self._report()
+            self.condition.notify_all()
+
+    def _checkout(self, deadline):
+        """An idle connection and when it was returned, or (None, None) once there is room to open one"""
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolTimeout(f"Connection pool for '{self.name}' is closed")
+                self._reap(time.monotonic())
+                if self.idle:
+                    entry = self.idle.pop()
+                    self._report()
+                    return entry
+                if self.size < self.max_size:
+                    # Reserve the slot; the connection is opened outside the lock
+                    self.size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    DB_POOL_TIMEOUTS.labels(database=self.name).inc()
+                    raise PoolTimeout(
+                        f"No connection to '{self.name}' came free within {self.timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                self.condition.wait(remaining)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[id(connection)] = time.monotonic()
+            self._report()
+        return connection
+
+    def _alive(self, connection):
+        if self.ping is None:
+            return True
+        try:
+            self.ping(connection)
+        except Exception as e:
+            logger.warning("Discarding broken pooled connection to '%s': %s", self.name, e)
+            return False
+        return True
+
+    def _close(self, connection):
+        self.size -= 1
+        self.opened_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning("Error closing pooled connection to '%s': %s", self.name, e)
+
+    def _reap(self, now):
+        # The oldest returned connections sit at the left
+        while self.idle and self.size > self.min_size and now - self.idle[0][1] > self.max_idle:
+            self._close(self.idle.popleft()[0])
+
+    def _report(self):
+        DB_POOL_CONNECTIONS.labels(database=self.name, state='idle').set(len(self.idle))
+        DB_POOL_CONNECTIONS.labels(database=self.name, state='in_use').set(self.size - len(self.idle))
+
+
+_pools = {}
+# Pools inherited through fork; their connections belong to the parent process,
+# and garbage-collecting them here would close the parent's sockets
+_inherited = []
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(key, factory):
+    """The process's pool for ``key``, created with ``factory()`` on first use"""
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _inherited.append(_pools)
+            _pools, _pools_pid = {}, os.getpid()
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def close_pools(matching=lambda key: True):
+    """Close and forget the pools whose key satisfies ``matching``"""
+    with _pools_lock:
+        for key in [key for key in _pools if matching(key)]:
+            _pools.pop(key).close()
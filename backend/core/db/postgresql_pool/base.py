@@ -0,0 +1,83 @@
+"""
+PostgreSQL backend that checks connections out of a per-process pool.
+
+Set ``ENGINE`` to ``core.db.postgresql_pool`` and tune the pool with the
+database's ``POOL`` dict (``MIN_SIZE``, ``MAX_SIZE``, ``TIMEOUT``,
+``MAX_IDLE``, ``MAX_LIFETIME``, ``PING_AFTER``; see
+``core.db.pool.ConnectionPool``). Use it with ``CONN_MAX_AGE = 0``: Django
+then "closes" the connection after every request, which hands it back to
+the pool, so threads and ASGI requests share a bounded set of
+connections instead of each holding or opening their own.
+"""
+from functools import partial
+
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgresDatabaseCreation
+
+from core.db.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+# libpq transaction states, the same in psycopg2 and psycopg 3
+TRANSACTION_IDLE = 0
+TRANSACTION_OPEN = (2, 3)  # in a transaction, in a failed transaction
+
+
+def ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if not connection.autocommit:
+        connection.rollback()
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use
+        close_pools(lambda key: key[1] == test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Pool the current connection was checked out of
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        key = (self.alias, conn_params.get('dbname'), repr(sorted(conn_params.items())))
+        options = {name.lower(): value for name, value in self.settings_dict.get('POOL', {}).items()}
+        return get_pool(key, lambda: ConnectionPool(self.alias, ping=ping, **options))
+
+    def get_new_connection(self, conn_params):
+        # The maintenance connection used to create and drop test databases is not pooled
+        if self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)
+        pool = self.get_pool(conn_params)
+        try:
+            connection = pool.acquire(partial(super().get_new_connection, conn_params))
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+        self.pool = pool
+        return connection
+
+    def reset_connection(self):
+        """Roll back whatever the connection left open; False if it cannot be reused"""
+        if self.connection.closed:
+            return False
+        if self.connection.info.transaction_status in TRANSACTION_OPEN:
+            try:
+                self.connection.rollback()
+            except self.Database.Error:
+                return False
+        return self.connection.info.transaction_status == TRANSACTION_IDLE
+
+    def _close(self):
+        pool, self.pool = self.pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Closed inside an atomic block, Django keeps referencing the connection
+        discard = self.in_atomic_block or not self.reset_connection()
+        with self.wrap_database_errors:
+            pool.release(self.connection, discard=discard)
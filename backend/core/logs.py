@@ -0,0 +1,175 @@
+import atexit
+import copy
+import datetime
+import decimal
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so one process per log file
+    fcntl = None
+
+# Handlers of this logger write what the queue handler's listener dequeues
+OUTPUT_LOGGER = 'core.logs.output'
+
+# Arguments of these types are immutable, so formatting them can wait for the listener
+LAZY_ARG_TYPES = (
+    str, bytes, int, float, bool, type(None), uuid.UUID, decimal.Decimal,
+    datetime.date, datetime.time, datetime.timedelta,
+)
+
+_exception_formatter = logging.Formatter()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a background listener instead of writing them in the caller.
+
+    The listener thread passes them to the handlers of ``output_logger``.
+    It starts with the first record a process emits, so workers forked
+    after logging was configured each get their own. The queue is bounded:
+    when the listener falls behind records are dropped and counted rather
+    than blocking requests, and a warning reports how many once there is room.
+    """
+
+    def __init__(self, maxsize=10000, output_logger=OUTPUT_LOGGER):
+        super().__init__(queue.Queue(maxsize))
+        self.output_logger = output_logger
+        self.listener = None
+        self.listener_pid = None
+        self.start_lock = threading.Lock()
+        self.dropped = 0
+
+    def start_listener(self):
+        with self.start_lock:
+            if self.listener_pid == os.getpid():
+                return
+            # A listener copied from the parent process has no thread here
+            self.queue = queue.Queue(self.queue.maxsize)
+            self.listener = logging.handlers.QueueListener(
+                self.queue, *logging.getLogger(self.output_logger).handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            self.listener_pid = os.getpid()
+            atexit.register(self.stop_listener)
+
+    def stop_listener(self):
+        """Write out whatever is still queued and stop the listener thread"""
+        with self.start_lock:
+            if self.listener is not None and self.listener_pid == os.getpid():
+                self.listener.stop()
+            self.listener = self.listener_pid = None
+
+    def prepare(self, record):
+        """
+        Copy the record for the queue, keeping the message unformatted when safe.
+
+        Tracebacks are rendered now, while their frames exist. Arguments are
+        merged into the message here only if one of them could still change
+        before the listener gets to it.
+        """
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            if not all(isinstance(value, LAZY_ARG_TYPES) for value in values):
+                record.msg = record.getMessage()
+                record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': "Log queue full, dropped %d records", 'args': (dropped,),
+            })
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+    def emit(self, record):
+        if self.listener_pid != os.getpid():
+            self.start_listener()
+        super().emit(record)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through a fixed fraction ``rate`` of the records below ``level``.
+
+    Records at ``level`` or above always pass. Sampling is by count, not
+    chance, so exactly one in every ``1 / rate`` records is kept.
+    """
+
+    def __init__(self, rate=1.0, level=logging.WARNING):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= self.level or self.rate >= 1:
+            return True
+        seen = next(self.counter)
+        return int((seen + 1) * self.rate) > int(seen * self.rate)
+
+
+class ProcessSafeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    ``RotatingFileHandler`` that several processes can share.
+
+    Each write holds an exclusive ``flock`` on a side lock file, and a
+    process reopens the log when another one has rotated it, so gunicorn
+    workers neither interleave lines nor rotate over each other's files.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self.lock_file = open(f'{self.baseFilename}.lock', 'a') if fcntl else None
+
+    def reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        if self.lock_file is None:
+            return super().emit(record)
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                self.reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
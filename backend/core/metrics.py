@@ -0,0 +1,94 @@
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every worker
+# writes its samples to files there and a scrape aggregates all workers.
+MULTIPROCESS_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    'muse_http_request_duration_seconds', 'Time spent handling a request', ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'muse_http_requests_total', 'Requests handled, by response status', ['view', 'method', 'status'],
+)
+RESPONSE_SIZE = Histogram(
+    'muse_http_response_size_bytes', 'Size of non-streaming response bodies', ['view', 'method'],
+    buckets=SIZE_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'muse_db_queries_per_request', 'Database queries issued while handling a request', ['view', 'method'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    'muse_db_query_duration_seconds', 'Time spent in database queries per request', ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Connection pools (core/db/pool.py); gauges add up the live workers' pools
+DB_POOL_CONNECTIONS = Gauge(
+    'muse_db_pool_connections', 'Open pooled connections, by state (idle or in_use)', ['database', 'state'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_WAIT = Histogram(
+    'muse_db_pool_wait_seconds', 'Time spent waiting to check out a pooled connection', ['database'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    'muse_db_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection', ['database'],
+)
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` callable counting and timing the queries it sees"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def view_label(request):
+    """Dotted path of the view that handled a request; bounded by the URLconf"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED_VIEW
+    # DRF's @api_view and class-based views carry the named view on view_class
+    view = getattr(match.func, 'view_class', match.func)
+    return f"{view.__module__}.{view.__name__}"
+
+
+def observe_request(request, response, duration, queries):
+    """Record one handled request"""
+    labels = {'view': view_label(request), 'method': request.method}
+    REQUEST_LATENCY.labels(**labels).observe(duration)
+    REQUESTS.labels(status=str(response.status_code), **labels).inc()
+    DB_QUERIES.labels(**labels).observe(queries.count)
+    DB_TIME.labels(**labels).observe(queries.duration)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(**labels).observe(len(response.content))
+
+
+def render_metrics():
+    """Metrics in the Prometheus text format, aggregated over every worker process"""
+    if os.environ.get(MULTIPROCESS_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
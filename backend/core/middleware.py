@@ -1,8 +1,14 @@
 # In core/middleware.py
 import re
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
+from django.db import connections
 from django.urls import resolve
 
+from .metrics import QueryRecorder, observe_request
+
 class CSRFExemptMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -15,4 +21,50 @@ class CSRFExemptMiddleware:
         if view_path in self.csrf_exempt_views:
             setattr(request, '_dont_enforce_csrf_checks', True)
             
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, database queries and time, response size and status per view.
+    
+    Queries are observed through ``execute_wrapper`` on every configured
+    database; samples are exposed by ``api.views.metrics``. Under ASGI the
+    wrappers are installed in the request's sync thread, where the async
+    ORM runs its queries on that thread's connections.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.record_queries(stack, queries)
+            response = self.get_response(request)
+        observe_request(request, response, time.perf_counter() - start, queries)
+        return response
+    
+    async def __acall__(self, request):
+        queries = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self.record_queries)(stack, queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        observe_request(request, response, time.perf_counter() - start, queries)
+        return response
+    
+    @staticmethod
+    def record_queries(stack, queries):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(queries))
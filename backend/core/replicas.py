@@ -0,0 +1,199 @@
+"""
+Read replicas: safe-method requests read from a healthy replica, everything else uses the primary.
+
+``ReplicaMiddleware`` picks the replica for a request and pins users who
+just wrote to the primary for ``REPLICA_PIN_SECONDS``, so they read their
+own changes; ``ReplicaRouter`` sends the request's reads to that replica.
+Pins live in the ``REPLICA_PIN_CACHE`` cache, which every process must
+share: the next request may reach another worker.
+"""
+from contextvars import ContextVar
+import itertools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'db:pin:user:{}'
+
+# Seconds of replication lag, or 0 when the replica has replayed all it received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Replica the current request reads from; None reads from the primary
+_replica = ContextVar('replica', default=None)
+
+
+class ReplicaHealth:
+    """
+    Per-process record of which replicas are reachable and caught up.
+
+    A replica is probed at most once per ``REPLICA_HEALTH_CHECK_INTERVAL``:
+    it is healthy when it answers and lags by no more than
+    ``REPLICA_MAX_LAG_SECONDS``. Probes run in the request that finds the
+    result stale; concurrent requests keep using the previous result.
+    """
+
+    def __init__(self):
+        self.checked = {}
+        self.lock = threading.Lock()
+        self.rotation = itertools.count()
+
+    def lag(self, alias):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL if connection.vendor == 'postgresql' else 'SELECT 0')
+            return float(cursor.fetchone()[0])
+
+    def probe(self, alias):
+        try:
+            lag = self.lag(alias)
+        except DatabaseError as e:
+            logger.warning("Replica %s unreachable, reading from the primary: %s", alias, e)
+            return False
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            logger.warning("Replica %s lags %.1fs, reading from the primary", alias, lag)
+            return False
+        return True
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        healthy, checked_at = self.checked.get(alias, (True, None))
+        if checked_at is not None and now - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+            return healthy
+        if not self.lock.acquire(blocking=False):
+            return healthy and checked_at is not None
+        try:
+            healthy = self.probe(alias)
+            previous, _ = self.checked.get(alias, (True, None))
+            if healthy and not previous:
+                logger.info("Replica %s healthy again", alias)
+            self.checked[alias] = (healthy, time.monotonic())
+        finally:
+            self.lock.release()
+        return healthy
+
+    def choose(self):
+        """A healthy replica, taking turns between them, or None"""
+        replicas = settings.REPLICA_DATABASES
+        if not replicas:
+            return None
+        start = next(self.rotation)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self.is_healthy(alias):
+                return alias
+        return None
+
+
+health = ReplicaHealth()
+
+
+def token_user_id(request):
+    """User id claimed by the request's access token, without touching the database"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return AccessToken(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+def is_pinned(request):
+    user_id = token_user_id(request)
+    return user_id is not None and caches[settings.REPLICA_PIN_CACHE].get(PIN_KEY.format(user_id)) is not None
+
+
+def pin_to_primary(user_id):
+    """Send the user's reads to the primary until replicas have caught up with a write"""
+    caches[settings.REPLICA_PIN_CACHE].set(PIN_KEY.format(user_id), True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def choose_database(request):
+    """Replica alias to serve a request's reads from, or None for the primary"""
+    if request.method not in SAFE_METHODS or not settings.REPLICA_DATABASES:
+        return None
+    # Inside an enclosing transaction every read goes to the primary anyway
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block or is_pinned(request):
+        return None
+    return health.choose()
+
+
+def record_write(request, response):
+    user = getattr(request, 'user', None)
+    if (
+        request.method not in SAFE_METHODS and response.status_code < 400
+        and user is not None and user.is_authenticated
+    ):
+        pin_to_primary(user.pk)
+
+
+class ReplicaRouter:
+    """Reads go to the replica chosen for the current request; writes and migrations to the primary"""
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        # Reads inside a transaction must see that transaction's writes
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Choose the database a request reads from, and pin users to the primary after they write"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica.set(choose_database(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        record_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # Health probes query the replica, so choose from a sync thread
+        token = _replica.set(await sync_to_async(choose_database)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        await sync_to_async(record_write)(request, response)
+        return response
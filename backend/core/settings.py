@@ -16,9 +16,22 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 AWS_ACCESS_KEY = os.getenv('AWS_ACCESS_KEY')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+# Image uploads (see utilities/aws_s3.py); AWS_S3_ENDPOINT_URL points them at a local S3 stand-in
+AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME', 'kenyamall')
+AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'eu-north-1')
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL') or None
+# Seconds a presigned upload URL stays valid
+AWS_S3_PRESIGNED_EXPIRY = int(os.getenv('AWS_S3_PRESIGNED_EXPIRY', 1000))
+# Most URLs one batch request may ask for, and the largest upload a presigned POST accepts
+AWS_S3_MAX_UPLOAD_URLS = int(os.getenv('AWS_S3_MAX_UPLOAD_URLS', 10))
+AWS_S3_MAX_UPLOAD_BYTES = int(os.getenv('AWS_S3_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+# HTTP connections the shared S3 client keeps open, across threads
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_S3_MAX_POOL_CONNECTIONS', 10))
 
 # Add this to your settings.py
 
+# Records are queued by the 'queue' handler and written by a listener thread
+# through the handlers of core.logs.OUTPUT_LOGGER, so requests never wait on I/O
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -32,7 +45,18 @@ LOGGING = {
             'style': '{',
         },
     },
+    'filters': {
+        # High-volume events: keep one in LIKE_LOG_SAMPLE_RATE of them below WARNING
+        'sample_likes': {
+            '()': 'core.logs.SamplingFilter',
+            'rate': float(os.environ.get('LIKE_LOG_SAMPLE_RATE', '0.1')),
+        },
+    },
     'handlers': {
+        'queue': {
+            '()': 'core.logs.QueueHandler',
+            'level': 'INFO',
+        },
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
@@ -40,7 +64,8 @@ LOGGING = {
         },
         'file': {
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
+            # Shared by every gunicorn worker
+            'class': 'core.logs.ProcessSafeRotatingFileHandler',
             'filename': 'logs/user_auth.log',
             'maxBytes': 10485760,  # 10MB
             'backupCount': 10,
@@ -49,22 +74,24 @@ LOGGING = {
     },
     'loggers': {
         '': {  # Root logger
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
         },
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'django.request': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
-        'myapp': {  # Replace with your app name
+        'poetry.likes': {
+            'filters': ['sample_likes'],
+        },
+        'core.logs.output': {
             'handlers': ['console', 'file'],
-            'level': 'INFO',
             'propagate': False,
         },
     },
@@ -111,6 +138,9 @@ INSTALLED_APPS = [
 # In settings.py
 # In settings.py
 MIDDLEWARE = [
+    # Outermost, so request metrics cover every other middleware
+    'core.middleware.MetricsMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -150,13 +180,86 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Route the public read endpoints to their async views (set by core/asgi.py)
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# Check PostgreSQL connections out of a per-process pool (core/db/postgresql_pool)
+DATABASE_POOL = os.environ.get('DATABASE_POOL') == '1'
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600
+        # Under ASGI each request queries from its own short-lived thread, so a
+        # persistent connection would never be reused; connect per request there.
+        # Pooled connections go back to the pool at the end of every request
+        conn_max_age=0 if ASYNC_READ_VIEWS or DATABASE_POOL else 600
     )
 }
 
+# Read replicas: comma-separated database URLs in DATABASE_REPLICA_URLS. Safe-method
+# requests read from a healthy one (see core/replicas.py); tests mirror the primary
+REPLICA_DATABASES = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **dj_database_url.parse(url.strip(), conn_max_age=DATABASES['default']['CONN_MAX_AGE']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+if DATABASE_POOL:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql':
+            database['ENGINE'] = 'core.db.postgresql_pool'
+            database['POOL'] = {
+                'MIN_SIZE': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                # Per worker process; keep workers x MAX_SIZE under the server's max_connections
+                'MAX_SIZE': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+                # Seconds a request waits for a free connection before failing
+                'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+                'MAX_IDLE': float(os.environ.get('DATABASE_POOL_MAX_IDLE', 300)),
+                'MAX_LIFETIME': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', 3600)),
+                # Connections idle this long are pinged before reuse
+                'PING_AFTER': float(os.environ.get('DATABASE_POOL_PING_AFTER', 10)),
+            }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Seconds a user reads from the primary after writing, so they see their own changes
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 10))
+# Cache alias holding those pins; every process must see it, so it cannot be per-process memory
+REPLICA_PIN_CACHE = os.environ.get('REPLICA_PIN_CACHE', 'default')
+# Replicas lagging further behind than this are skipped until they catch up
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+# Seconds between health probes of each replica, per process
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 5))
+
+# Cache
+# Shared Redis cache when REDIS_URL is set, per-process memory otherwise
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cache public poetry responses (see poetry/cache.py). Writes invalidate them through the
+# cache, so every worker must share it: on by default with Redis, and refused without one
+POETRY_RESPONSE_CACHE = os.environ.get('POETRY_RESPONSE_CACHE', '1' if os.environ.get('REDIS_URL') else '0') == '1'
+
+# Seconds a cached public poetry response may be served
+POETRY_CACHE_TIMEOUT = int(os.environ.get('POETRY_CACHE_TIMEOUT', 300))
+
+# Bearer token required to scrape /api/metrics; unset, the endpoint is only served with DEBUG on
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')
+
 #User model
 AUTH_USER_MODEL = 'users.user'
 
@@ -208,12 +311,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # In settings.py
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAdminUser'
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.StandardResultsSetPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -226,8 +329,20 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Each refresh returns a new refresh token; the one presented cannot be used again
+    'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Seconds a process trusts its record of a user being active (see api/authentication.py);
+# deactivating or demoting a user takes effect in other processes within this window
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', 30))
+
+# Revoked tokens (see api/revocation.py): how often a process reads new revocations from the
+# database, i.e. how long a logout takes to reach other processes, and how many revocations its
+# local filter holds before it is rebuilt. Run purge_revoked_tokens daily to drop expired rows
+JWT_DENYLIST_SYNC_SECONDS = float(os.environ.get('JWT_DENYLIST_SYNC_SECONDS', 1))
+JWT_DENYLIST_CAPACITY = int(os.environ.get('JWT_DENYLIST_CAPACITY', 100000))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS=True
 CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
@@ -0,0 +1,20 @@
+# Gunicorn reads this file from the working directory on startup
+import os
+import shutil
+import tempfile
+
+# Must be set before the app imports prometheus_client, so workers share samples
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'muse-prometheus')
+)
+
+
+def on_starting(server):
+    # Samples left by a previous run would otherwise be added to this one
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
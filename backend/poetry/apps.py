@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PoetryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'poetry'
+    
+    def ready(self):
+        # Register the counter maintenance signal handlers
+        from . import signals  # noqa: F401
+        
+        if settings.POETRY_RESPONSE_CACHE:
+            from core.caches import require_shared
+            require_shared('default', 'POETRY_RESPONSE_CACHE')
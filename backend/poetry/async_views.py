@@ -0,0 +1,137 @@
+"""
+Async versions of the public read endpoints, for ASGI deployments.
+
+Each view answers GET (and HEAD) through Django's async ORM and hands
+every other method to its sync counterpart in ``views``, so responses,
+cache entries and validators are the same whichever one serves a request.
+``core/asgi.py`` routes these endpoints here (see ``ASYNC_READ_VIEWS``).
+"""
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+import logging
+
+from api.async_support import async_read_view
+from api.pagination import FeedResultsSetPagination, StandardResultsSetPagination
+from . import views
+from .cache import acached_public_get, aconditional_poem_get
+from .comment_tree import (
+    aexpand_thread_page,
+    aload_poem_thread,
+    aload_reply_thread,
+    thread_queryset,
+    walk_comment_tree
+)
+from .likes import alike_context
+from .models import Comment, Poem
+from .search import get_search_engine
+from .serializers import PoemDetailSerializer, RecursiveCommentSerializer, ThreadPageCommentSerializer
+
+logger = logging.getLogger(__name__)
+
+
+@async_read_view(views.poem_list)
+@acached_public_get('poem')
+async def poem_list(request):
+    """
+    List poems
+    """
+    if request.query_params.get('search'):
+        # Picking the search engine may inspect the schema, once per process
+        await sync_to_async(get_search_engine)(Poem.objects.db)
+
+    serializer_class, fields, poems, error = views._poem_feed(request)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = FeedResultsSetPagination()
+    poems_page = await paginator.apaginate_queryset(poems, request)
+
+    context = await alike_context(request, poems=poems_page) if 'is_liked' in fields else {'request': request}
+    serializer = serializer_class(poems_page, many=True, context={**context, 'fields': fields})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@aconditional_poem_get
+@async_read_view(views.poem_detail)
+@acached_public_get('comment', slug_kwarg='slug')
+async def poem_detail(request, slug):
+    """
+    Retrieve a poem, embedding the thread per ?comments= / ?comment_depth=
+    """
+    embedding, error = views._comment_embedding(request)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        poem = await Poem.objects.select_related('user').defer('search_vector').aget(slug=slug)
+    except Poem.DoesNotExist:
+        return Response({'error': 'Poem not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    context = {'request': request, **embedding}
+    if embedding['comments'] != 'none':
+        max_depth = 0 if embedding['comments'] == 'top' else embedding.get('comment_depth')
+        thread = await aload_poem_thread(poem, max_depth=max_depth)
+        context.update(await alike_context(request, comments=walk_comment_tree(thread)), thread=thread)
+
+    serializer = PoemDetailSerializer(poem, context=context)
+    return Response(serializer.data)
+
+
+@aconditional_poem_get
+@async_read_view(views.poem_comments)
+@acached_public_get('comment', slug_kwarg='slug')
+async def poem_comments(request, slug):
+    """
+    Get all comments for a poem, or one bounded page of the thread with ?cursor=
+    """
+    try:
+        poem = await Poem.objects.aget(slug=slug)
+    except Poem.DoesNotExist:
+        raise NotFound()
+
+    if request.query_params.get('cursor') is not None:
+        return await _thread_page_response(request, thread_queryset().filter(poem=poem, depth=0))
+
+    top_comments = await aload_poem_thread(poem)
+    context = await alike_context(request, comments=walk_comment_tree(top_comments))
+
+    serializer = RecursiveCommentSerializer(top_comments, many=True, context=context)
+    return Response(serializer.data)
+
+
+@async_read_view(views.comment_replies)
+async def comment_replies(request, pk):
+    """
+    Get all replies for a specific comment, or one bounded page of them with ?cursor=
+    """
+    try:
+        comment = await Comment.objects.aget(pk=pk)
+    except Comment.DoesNotExist:
+        raise NotFound()
+
+    if request.query_params.get('cursor') is not None:
+        replies = thread_queryset().filter(parent_id=comment.pk)
+        return await _thread_page_response(request, replies)
+
+    replies = await aload_reply_thread(comment)
+    context = await alike_context(request, comments=walk_comment_tree(replies))
+
+    serializer = RecursiveCommentSerializer(replies, many=True, context=context)
+    return Response(serializer.data)
+
+
+async def _thread_page_response(request, roots):
+    """``views._thread_page_response`` through the async ORM"""
+    limits, error = views._thread_page_limits(request)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = StandardResultsSetPagination()
+    roots = await paginator.apaginate_queryset(roots.order_by('created_at', 'pk'), request)
+    await aexpand_thread_page(roots, max_replies=limits['replies'], max_depth=limits['depth'])
+
+    context = {**await alike_context(request, comments=walk_comment_tree(roots)), 'thread_page': limits}
+    serializer = ThreadPageCommentSerializer(roots, many=True, context=context)
+    return paginator.get_paginated_response(serializer.data)
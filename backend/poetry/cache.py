@@ -0,0 +1,333 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from rest_framework.response import Response
+import calendar
+import functools
+import hashlib
+import logging
+import time
+
+from .likes import aliked_id_set, liked_id_set
+from .models import Poem
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_VERSION_KEY = 'poetry:version'
+POEM_VERSION_KEY = 'poetry:version:poem:{}'
+SLUG_KEY = 'poetry:slug:{}'
+RESPONSE_KEY = 'poetry:response:{}:{}'
+
+
+def _initial_version():
+    # Start from the clock so a counter lost to eviction never reuses old versions
+    return int(time.time() * 1000)
+
+
+def get_versions(*keys):
+    """Fetch version counters in one cache round-trip, creating missing ones"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key, _initial_version())
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    """``get_versions`` through the async cache API"""
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _initial_version(), timeout=None)
+            versions[key] = await cache.aget(key, _initial_version())
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_versions(poem_id=None, slug=None, feed=True):
+    """
+    Invalidate cached responses once the current transaction commits.
+
+    Changes scoped to a poem bump that poem's version (its page and comment
+    thread); those that show in the feed (``feed``) bump the global version.
+    """
+    if not settings.POETRY_RESPONSE_CACHE:
+        return
+
+    def bump():
+        if feed:
+            _bump(GLOBAL_VERSION_KEY)
+        if poem_id is not None:
+            _bump(POEM_VERSION_KEY.format(poem_id))
+        if slug is not None:
+            cache.delete(SLUG_KEY.format(slug))
+    transaction.on_commit(bump)
+
+
+def poem_id_for_slug(slug):
+    """Resolve a slug to a poem id, remembering the answer in the cache"""
+    key = SLUG_KEY.format(slug)
+    poem_id = cache.get(key)
+    if poem_id is None:
+        poem_id = Poem.objects.filter(slug=slug).values_list('id', flat=True).first()
+        if poem_id is not None:
+            cache.set(key, poem_id, timeout=None)
+    return poem_id
+
+
+async def apoem_id_for_slug(slug):
+    """``poem_id_for_slug`` through the async cache API and ORM"""
+    key = SLUG_KEY.format(slug)
+    poem_id = await cache.aget(key)
+    if poem_id is None:
+        poem_id = await Poem.objects.filter(slug=slug).values_list('id', flat=True).afirst()
+        if poem_id is not None:
+            await cache.aset(key, poem_id, timeout=None)
+    return poem_id
+
+
+def _iter_liked_items(data):
+    """Yield every serialized poem or comment carrying an ``is_liked`` field"""
+    if isinstance(data, dict):
+        if 'is_liked' in data:
+            yield data
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                yield from _iter_liked_items(value)
+    elif isinstance(data, list):
+        for item in data:
+            yield from _iter_liked_items(item)
+
+
+def clear_user_fields(data):
+    """Reset per-user fields so a body can be shared between users"""
+    for item in _iter_liked_items(data):
+        item['is_liked'] = False
+
+
+def merge_user_fields(request, data, content_type):
+    """Fill in ``is_liked`` for the requesting user with one query"""
+    if not request.user.is_authenticated:
+        return
+    items = list(_iter_liked_items(data))
+    if not items:
+        return
+    liked = {str(pk) for pk in liked_id_set(request, content_type, [item['id'] for item in items])}
+    for item in items:
+        item['is_liked'] = str(item['id']) in liked
+
+
+async def amerge_user_fields(request, data, content_type):
+    """``merge_user_fields`` through the async ORM"""
+    if not request.user.is_authenticated:
+        return
+    items = list(_iter_liked_items(data))
+    if not items:
+        return
+    liked = {str(pk) for pk in await aliked_id_set(request, content_type, [item['id'] for item in items])}
+    for item in items:
+        item['is_liked'] = str(item['id']) in liked
+
+
+def _response_key(view, request, versions):
+    """Cache key of a view's response to ``request`` at the given versions"""
+    params = sorted(request.query_params.lists())
+    fingerprint = f"{request.get_host()}{request.path}?{params}:{versions}"
+    return RESPONSE_KEY.format(view.__name__, hashlib.md5(fingerprint.encode()).hexdigest())
+
+
+def _strip_user_fields(data):
+    """``clear_user_fields``, returning the items that were liked so they can be restored"""
+    liked = [item for item in _iter_liked_items(data) if item['is_liked']]
+    clear_user_fields(data)
+    return liked
+
+
+def _restore_liked(items):
+    for item in items:
+        item['is_liked'] = True
+
+
+def cached_public_get(content_type, slug_kwarg=None):
+    """
+    Cache a view's GET responses under versioned keys, when ``POETRY_RESPONSE_CACHE`` is on.
+
+    Keys combine the request URL and query parameters with the poem's
+    version when ``slug_kwarg`` names the view argument holding the poem
+    slug, or with the global (feed) version otherwise. Bumping a version
+    makes older entries unreachable, so nothing is ever scanned or deleted.
+    Cached bodies are user-neutral; ``is_liked`` is merged in after the
+    lookup for the items of ``content_type`` ('poem' or 'comment') the
+    response carries.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not settings.POETRY_RESPONSE_CACHE:
+                return view(request, *args, **kwargs)
+
+            version_keys = [GLOBAL_VERSION_KEY]
+            if slug_kwarg is not None:
+                poem_id = poem_id_for_slug(kwargs[slug_kwarg])
+                if poem_id is None:
+                    return view(request, *args, **kwargs)
+                version_keys = [POEM_VERSION_KEY.format(poem_id)]
+
+            key = _response_key(view, request, get_versions(*version_keys))
+
+            data = cache.get(key)
+            if data is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                data = response.data
+                # The view already resolved is_liked for this user; cache a neutral
+                # copy (the backend pickles on set) and restore it without a query
+                liked = _strip_user_fields(data)
+                cache.set(key, data, timeout=settings.POETRY_CACHE_TIMEOUT)
+                _restore_liked(liked)
+                cache_status = 'MISS'
+            else:
+                merge_user_fields(request, data, content_type)
+                cache_status = 'HIT'
+
+            response = Response(data)
+            response['X-Cache'] = cache_status
+            return response
+        return wrapper
+    return decorator
+
+
+def acached_public_get(content_type, slug_kwarg=None):
+    """``cached_public_get`` for async views, sharing the same keys and entries"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not settings.POETRY_RESPONSE_CACHE:
+                return await view(request, *args, **kwargs)
+
+            version_keys = [GLOBAL_VERSION_KEY]
+            if slug_kwarg is not None:
+                poem_id = await apoem_id_for_slug(kwargs[slug_kwarg])
+                if poem_id is None:
+                    return await view(request, *args, **kwargs)
+                version_keys = [POEM_VERSION_KEY.format(poem_id)]
+
+            key = _response_key(view, request, await aget_versions(*version_keys))
+
+            data = await cache.aget(key)
+            if data is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                data = response.data
+                liked = _strip_user_fields(data)
+                await cache.aset(key, data, timeout=settings.POETRY_CACHE_TIMEOUT)
+                _restore_liked(liked)
+                cache_status = 'MISS'
+            else:
+                await amerge_user_fields(request, data, content_type)
+                cache_status = 'HIT'
+
+            response = Response(data)
+            response['X-Cache'] = cache_status
+            return response
+        return wrapper
+    return decorator
+
+
+def _poem_validators(request, slug):
+    """Read a poem's change timestamps with one indexed query, once per request"""
+    if not hasattr(request, '_poem_validators'):
+        rows = Poem.objects.filter(slug=slug).order_by().values_list('updated_at', 'thread_updated_at')[:1]
+        request._poem_validators = rows[0] if rows else None
+    return request._poem_validators
+
+
+def poem_etag(request, slug, **kwargs):
+    """Strong validator for a poem's page or thread, or None if it does not exist"""
+    validators = _poem_validators(request, slug)
+    if validators is None:
+        return None
+    updated_at, thread_updated_at = validators
+    # Responses differ per query string and, through is_liked, per credentials
+    fingerprint = ':'.join([
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        updated_at.isoformat(),
+        thread_updated_at.isoformat() if thread_updated_at else '',
+        request.META.get('HTTP_AUTHORIZATION', ''),
+    ])
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def poem_last_modified(request, slug, **kwargs):
+    validators = _poem_validators(request, slug)
+    if validators is None:
+        return None
+    updated_at, thread_updated_at = validators
+    return max(updated_at, thread_updated_at or updated_at)
+
+
+def conditional_poem_get(view):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` for a slug-addressed poem view.
+
+    Validators come from ``Poem.updated_at`` and ``Poem.thread_updated_at``
+    (stamped on every comment or like change), so a matching request costs
+    one indexed lookup and returns 304 before authentication, caching or
+    serialization run. Other methods than GET and HEAD skip the lookup.
+    """
+    conditional = vary_on_headers('Authorization')(
+        condition(etag_func=poem_etag, last_modified_func=poem_last_modified)(view)
+    )
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        return conditional(request, *args, **kwargs)
+    return wrapper
+
+
+def aconditional_poem_get(view):
+    """
+    ``conditional_poem_get`` for async views; Django's ``condition`` only wraps sync views.
+
+    Other methods pass straight through, as they do in the sync wrapper.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, slug, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await view(request, slug=slug, **kwargs)
+
+        rows = Poem.objects.filter(slug=slug).order_by().values_list('updated_at', 'thread_updated_at')[:1]
+        rows = [row async for row in rows]
+        request._poem_validators = rows[0] if rows else None
+        etag = poem_etag(request, slug)
+        etag = quote_etag(etag) if etag else None
+        last_modified = poem_last_modified(request, slug)
+        timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = await view(request, slug=slug, **kwargs)
+
+        if timestamp and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timestamp)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+    return wrapper
@@ -0,0 +1,199 @@
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber, Substr
+import logging
+
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+# Every path segment is a UUID in its canonical 36-character form
+PATH_SEGMENT_LENGTH = 36
+
+
+def thread_queryset():
+    """Base queryset for loading a whole comment thread in a single query"""
+    return Comment.objects.select_related('user').order_by('path')
+
+
+def build_comment_tree(comments, pruned_totals=None):
+    """
+    Assemble a flat iterable of comments into nested nodes in memory.
+
+    Every comment gets ``tree_replies`` (its direct children, oldest first),
+    ``replies_count`` and ``total_replies_count`` attached. Comments whose
+    parent is not part of the loaded set are returned as the roots.
+
+    ``pruned_totals`` maps the paths of comments whose replies were not
+    loaded to their number of descendants; those comments keep their stored
+    ``replies_count``.
+    """
+    pruned_totals = pruned_totals or {}
+    nodes = {}
+    for comment in comments:
+        comment.tree_replies = []
+        comment.total_replies_count = 0
+        nodes[comment.id] = comment
+
+    roots = []
+    for comment in nodes.values():
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.tree_replies.append(comment)
+
+    # Deepest nodes first, so every child total is final before its parent reads it
+    for comment in sorted(nodes.values(), key=lambda c: c.depth, reverse=True):
+        comment.tree_replies.sort(key=lambda c: c.created_at)
+        if comment.path in pruned_totals:
+            comment.total_replies_count = pruned_totals[comment.path]
+            continue
+        comment.replies_count = len(comment.tree_replies)
+        comment.total_replies_count = sum(
+            child.total_replies_count + 1 for child in comment.tree_replies
+        )
+
+    roots.sort(key=lambda c: c.created_at)
+    return roots
+
+
+def _descendant_counts(queryset, depth):
+    prefix_length = (PATH_SEGMENT_LENGTH + 1) * (depth + 1) - 1
+    return queryset.filter(depth__gt=depth).order_by().annotate(
+        ancestor_path=Substr('path', 1, prefix_length)
+    ).values('ancestor_path').annotate(total=Count('id')).values_list('ancestor_path', 'total')
+
+
+def count_descendants_below(queryset, depth):
+    """
+    Count the comments under each depth-``depth`` comment of ``queryset``.
+
+    One grouped query keyed by ancestor path, cut from the descendants'
+    own paths. Comments without descendants are absent from the result.
+    """
+    return dict(_descendant_counts(queryset, depth))
+
+
+async def acount_descendants_below(queryset, depth):
+    """``count_descendants_below`` through the async ORM"""
+    return {path: total async for path, total in _descendant_counts(queryset, depth)}
+
+
+def _poem_thread_comments(poem, max_depth):
+    comments = thread_queryset().filter(poem=poem)
+    if max_depth is not None:
+        comments = comments.filter(depth__lte=max_depth)
+    return comments
+
+
+def load_poem_thread(poem, max_depth=None):
+    """
+    Load the comments on a poem and return the top-level comments as a tree.
+
+    With ``max_depth`` only comments down to that depth are loaded (0 for
+    top-level only); the deepest loaded comments still report how many
+    replies sit below them.
+    """
+    pruned_totals = None
+    if max_depth is not None:
+        pruned_totals = count_descendants_below(Comment.objects.filter(poem=poem), max_depth)
+    comments = list(_poem_thread_comments(poem, max_depth))
+    logger.debug("Loaded %s comments for poem %s", len(comments), poem.pk)
+    return build_comment_tree(comments, pruned_totals)
+
+
+async def aload_poem_thread(poem, max_depth=None):
+    """``load_poem_thread`` through the async ORM"""
+    pruned_totals = None
+    if max_depth is not None:
+        pruned_totals = await acount_descendants_below(Comment.objects.filter(poem=poem), max_depth)
+    comments = [comment async for comment in _poem_thread_comments(poem, max_depth)]
+    logger.debug("Loaded %s comments for poem %s", len(comments), poem.pk)
+    return build_comment_tree(comments, pruned_totals)
+
+
+def load_reply_thread(comment):
+    """Load every descendant of a comment and return its direct replies as a tree"""
+    replies = list(thread_queryset().filter(path__startswith=f"{comment.path}."))
+    logger.debug("Loaded %s replies under comment %s", len(replies), comment.pk)
+    return build_comment_tree(replies)
+
+
+async def aload_reply_thread(comment):
+    """``load_reply_thread`` through the async ORM"""
+    replies = [reply async for reply in thread_queryset().filter(path__startswith=f"{comment.path}.")]
+    logger.debug("Loaded %s replies under comment %s", len(replies), comment.pk)
+    return build_comment_tree(replies)
+
+
+def _next_thread_level(level, max_replies):
+    """
+    The comments of ``level`` that have replies, by id, and the query for
+    the oldest ``max_replies`` replies of each; the query is None when none do.
+    """
+    parents = {comment.id: comment for comment in level if comment.replies_count}
+    if not parents:
+        return parents, None
+    replies = thread_queryset().filter(parent_id__in=list(parents)).annotate(
+        sibling_rank=Window(
+            RowNumber(), partition_by=F('parent_id'), order_by=[F('created_at').asc(), F('id').asc()]
+        )
+    ).filter(sibling_rank__lte=max_replies)
+    return parents, replies
+
+
+def _attach_thread_level(parents, level):
+    for comment in level:
+        comment.tree_replies = []
+        parents[comment.parent_id].tree_replies.append(comment)
+    for parent in parents.values():
+        parent.tree_replies.sort(key=lambda c: (c.created_at, c.id))
+
+
+def expand_thread_page(roots, max_replies, max_depth):
+    """
+    Attach at most ``max_replies`` replies per comment, ``max_depth`` levels below ``roots``.
+
+    Runs one query per level whatever the size of the thread: the children
+    of the previous level are selected by parent id (served by the parent
+    index) and a window keeps the oldest ``max_replies`` of each parent.
+    Comments keep their stored ``replies_count``, so a node was truncated
+    when it counts more replies than it has in ``tree_replies``.
+    """
+    level = list(roots)
+    for comment in level:
+        comment.tree_replies = []
+
+    for _ in range(max_depth if max_replies else 0):
+        parents, replies = _next_thread_level(level, max_replies)
+        if replies is None:
+            break
+        level = list(replies)
+        _attach_thread_level(parents, level)
+
+    return roots
+
+
+async def aexpand_thread_page(roots, max_replies, max_depth):
+    """``expand_thread_page`` through the async ORM"""
+    level = list(roots)
+    for comment in level:
+        comment.tree_replies = []
+
+    for _ in range(max_depth if max_replies else 0):
+        parents, replies = _next_thread_level(level, max_replies)
+        if replies is None:
+            break
+        level = [reply async for reply in replies]
+        _attach_thread_level(parents, level)
+
+    return roots
+
+
+def walk_comment_tree(roots):
+    """Yield every comment in an assembled tree, parents before their replies"""
+    stack = list(reversed(roots))
+    while stack:
+        comment = stack.pop()
+        yield comment
+        stack.extend(reversed(getattr(comment, 'tree_replies', [])))
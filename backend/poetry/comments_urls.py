@@ -1,9 +1,13 @@
 from django.urls import path
-from . import views
+from django.conf import settings
+from . import async_views, views
+
+# Under ASGI the public reads are served by the async views
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
     path('', views.comment_list, name='comment-list'),
     path('<uuid:pk>/', views.comment_detail, name='comment-detail'),
     path('<uuid:pk>/like/', views.comment_like, name='comment-like'),
-    path('<uuid:pk>/replies/', views.comment_replies, name='comment-replies'),
+    path('<uuid:pk>/replies/', read_views.comment_replies, name='comment-replies'),
 ]
\ No newline at end of file
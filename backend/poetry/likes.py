@@ -0,0 +1,236 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+import logging
+import uuid
+
+from .models import Like, Poem
+
+logger = logging.getLogger(__name__)
+
+
+def liked_ids(request, content_type, objects):
+    """
+    Return the set of ids among ``objects`` that the requesting user has liked.
+
+    Resolves a whole page in a single query, and without any query at all for
+    anonymous users or empty pages.
+    """
+    return liked_id_set(request, content_type, [obj.id for obj in objects])
+
+
+def _liked_queryset(request, content_type, ids):
+    field = 'poem_id' if content_type == 'poem' else 'comment_id'
+    return Like.objects.filter(
+        user_id=request.user.pk,
+        content_type=content_type,
+        **{f'{field}__in': ids}
+    ).values_list(field, flat=True)
+
+
+def liked_id_set(request, content_type, ids):
+    """Return the subset of ``ids`` the requesting user has liked, in one query"""
+    if not request or not request.user.is_authenticated or not ids:
+        return set()
+    return set(_liked_queryset(request, content_type, ids))
+
+
+async def aliked_id_set(request, content_type, ids):
+    """``liked_id_set`` through the async ORM"""
+    if not request or not request.user.is_authenticated or not ids:
+        return set()
+    return {pk async for pk in _liked_queryset(request, content_type, ids)}
+
+
+def like_context(request, poems=None, comments=None):
+    """Build serializer context with the user's likes pre-resolved for a page"""
+    context = {'request': request}
+    if poems is not None:
+        context['liked_poem_ids'] = liked_ids(request, 'poem', poems)
+    if comments is not None:
+        context['liked_comment_ids'] = liked_ids(request, 'comment', comments)
+    return context
+
+
+async def alike_context(request, poems=None, comments=None):
+    """``like_context`` through the async ORM"""
+    context = {'request': request}
+    if poems is not None:
+        context['liked_poem_ids'] = await aliked_id_set(request, 'poem', [poem.id for poem in poems])
+    if comments is not None:
+        context['liked_comment_ids'] = await aliked_id_set(request, 'comment', [comment.id for comment in comments])
+    return context
+
+
+def set_like(user, target_model, lookup, value, liked=None):
+    """
+    Like or unlike a poem or comment, identified by ``lookup``=``value``.
+    
+    ``liked`` True inserts the like, False deletes it and None toggles:
+    the like is deleted, and inserted only if there was nothing to delete.
+    Rows are keyed directly by the lookup and inserts are conflict-tolerant,
+    so repeated or concurrent calls are idempotent and never recount. On
+    PostgreSQL the like row, the stored counter and the poem's
+    ``thread_updated_at`` are all written by one statement.
+    
+    Returns ``(liked, changed, likes_count)``, or ``None`` if the target does not exist.
+    """
+    from .cache import bump_versions
+    
+    content_type = 'poem' if target_model is Poem else 'comment'
+    using = router.db_for_write(Like)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    
+    lookup_field = target_model._meta.get_field(lookup)
+    statement = _LikeStatement(
+        connection, target_model, content_type,
+        lookup_column=qn(lookup_field.column),
+        lookup_value=lookup_field.get_db_prep_value(value, connection),
+        user_pk=user.pk,
+    )
+    if connection.vendor == 'postgresql':
+        row = statement.execute_combined(liked)
+    else:
+        with transaction.atomic(using=using):
+            row = statement.execute_in_steps(liked)
+    
+    if row is None:
+        return None
+    delta, likes_count, poem_id = row
+    # A toggle that changed nothing lost a race to an identical like
+    liked = delta > 0 if delta else liked is not False
+    if delta:
+        bump_versions(poem_id=Poem._meta.pk.to_python(poem_id), feed=target_model is Poem)
+        logger.info("User %s %s %s %s", user.pk, 'liked' if liked else 'unliked', content_type, value)
+    return liked, bool(delta), likes_count
+
+
+class _LikeStatement:
+    """SQL for one ``set_like`` call; rows read are ``(delta, likes_count, poem_id)``"""
+    
+    def __init__(self, connection, target_model, content_type, lookup_column, lookup_value, user_pk):
+        qn = connection.ops.quote_name
+        self.connection = connection
+        self.is_poem = target_model is Poem
+        self.content_type = content_type
+        self.lookup_column = lookup_column
+        self.lookup_value = lookup_value
+        self.user_pk = user_pk
+        self.like_table = qn(Like._meta.db_table)
+        self.like_column = qn(Like._meta.get_field(content_type).column)
+        self.target_table = qn(target_model._meta.db_table)
+        self.poem_table = qn(Poem._meta.db_table)
+        # Poems are their own poem; comments carry the poem they belong to
+        self.poem_column = 'id' if self.is_poem else qn(target_model._meta.get_field('poem').column)
+        self.stamp = Poem._meta.get_field('thread_updated_at').get_db_prep_value(timezone.now(), connection)
+    
+    def insert(self, source, condition=''):
+        """INSERT ... SELECT of the like from ``source`` rows, and its parameters"""
+        sql = (
+            f"INSERT INTO {self.like_table} (id, user_id, created_at, content_type, {self.like_column}) "
+            f"SELECT %s, %s, %s, %s, id FROM {source}{condition} "
+            f"ON CONFLICT DO NOTHING RETURNING {self.like_column}"
+        )
+        return sql, [
+            Like._meta.pk.get_db_prep_value(uuid.uuid4(), self.connection),
+            self.user_pk,
+            Like._meta.get_field('created_at').get_db_prep_value(timezone.now(), self.connection),
+            self.content_type,
+        ]
+    
+    def delete(self, target_id_sql):
+        sql = (
+            f"DELETE FROM {self.like_table} WHERE user_id = %s AND content_type = %s "
+            f"AND {self.like_column} = ({target_id_sql}) RETURNING {self.like_column}"
+        )
+        return sql, [self.user_pk, self.content_type]
+    
+    def execute_combined(self, liked):
+        """
+        One data-modifying CTE: ``WITH changed AS (INSERT/DELETE ... RETURNING) UPDATE ... RETURNING``.
+        
+        Every part sees the same snapshot, so the target's counter is read
+        from the UPDATE when it ran and from the target row otherwise.
+        """
+        ctes, params = [], []
+        
+        def cte(name, sql, sql_params=()):
+            ctes.append(f"{name} AS ({sql})")
+            params.extend(sql_params)
+        
+        cte(
+            'target',
+            f"SELECT id, likes_count, {self.poem_column} AS poem_id FROM {self.target_table} "
+            f"WHERE {self.lookup_column} = %s",
+            [self.lookup_value]
+        )
+        changes = []
+        if liked is not True:
+            cte('deleted', *self.delete('SELECT id FROM target'))
+            changes.append(f"SELECT {self.like_column} AS target_id, -1 AS delta FROM deleted")
+        if liked is not False:
+            condition = ' WHERE NOT EXISTS (SELECT 1 FROM deleted)' if liked is None else ''
+            cte('inserted', *self.insert('target', condition))
+            changes.append(f"SELECT {self.like_column} AS target_id, 1 AS delta FROM inserted")
+        cte('changed', ' UNION ALL '.join(changes))
+        
+        # Mark the poem's thread as changed for HTTP validators
+        poem_stamp = ', thread_updated_at = %s' if self.is_poem else ''
+        cte(
+            'updated',
+            f"UPDATE {self.target_table} AS liked SET likes_count = liked.likes_count + changed.delta{poem_stamp} "
+            f"FROM changed WHERE liked.id = changed.target_id RETURNING liked.id, liked.likes_count",
+            [self.stamp] if self.is_poem else []
+        )
+        if not self.is_poem:
+            cte(
+                'stamped',
+                f"UPDATE {self.poem_table} SET thread_updated_at = %s "
+                f"WHERE id IN (SELECT poem_id FROM target) AND EXISTS (SELECT 1 FROM changed)",
+                [self.stamp]
+            )
+        
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH {', '.join(ctes)} "
+                f"SELECT changed.delta, COALESCE(updated.likes_count, target.likes_count), target.poem_id "
+                f"FROM target LEFT JOIN changed ON TRUE LEFT JOIN updated ON updated.id = target.id",
+                params
+            )
+            return cursor.fetchone()
+    
+    def execute_in_steps(self, liked):
+        """The same change as separate statements, for databases without data-modifying CTEs"""
+        target_id = f"SELECT id FROM {self.target_table} WHERE {self.lookup_column} = %s"
+        with self.connection.cursor() as cursor:
+            changed = delta = None
+            if liked is not True:
+                sql, params = self.delete(target_id)
+                cursor.execute(sql, params + [self.lookup_value])
+                changed, delta = cursor.fetchone(), -1
+            if liked is True or (liked is None and not changed):
+                sql, params = self.insert(self.target_table, f" WHERE {self.lookup_column} = %s")
+                cursor.execute(sql, params + [self.lookup_value])
+                changed, delta = cursor.fetchone(), 1
+            
+            if not changed:
+                cursor.execute(
+                    f"SELECT likes_count, {self.poem_column} FROM {self.target_table} "
+                    f"WHERE {self.lookup_column} = %s",
+                    [self.lookup_value]
+                )
+                row = cursor.fetchone()
+                return None if row is None else (None, *row)
+            
+            poem_stamp = ', thread_updated_at = %s' if self.is_poem else ''
+            cursor.execute(
+                f"UPDATE {self.target_table} SET likes_count = likes_count + %s{poem_stamp} WHERE id = %s "
+                f"RETURNING likes_count, {self.poem_column}",
+                [delta] + ([self.stamp] if self.is_poem else []) + [changed[0]]
+            )
+            likes_count, poem_id = cursor.fetchone()
+            if not self.is_poem:
+                cursor.execute(
+                    f"UPDATE {self.poem_table} SET thread_updated_at = %s WHERE id = %s", [self.stamp, poem_id]
+                )
+            return delta, likes_count, poem_id
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from poetry.models import Comment, Like, Poem
+
+
+def count_of(model, field):
+    """Correlated subquery counting ``model`` rows that point at the outer row via ``field``"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(c=Count('pk')).values('c')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like/comment/reply counters on poems and comments"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of rows recomputed per UPDATE statement (default: 1000)'
+        )
+    
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        
+        poems = self.reconcile(Poem, chunk_size, {
+            'likes_count': count_of(Like, 'poem'),
+            'comments_count': count_of(Comment, 'poem'),
+        })
+        self.stdout.write(f"Reconciled counters on {poems} poems")
+        
+        comments = self.reconcile(Comment, chunk_size, {
+            'likes_count': count_of(Like, 'comment'),
+            'replies_count': count_of(Comment, 'parent'),
+        })
+        self.stdout.write(self.style.SUCCESS(f"Reconciled counters on {comments} comments"))
+    
+    def reconcile(self, model, chunk_size, counters):
+        """Walk the table in primary key order, recounting one chunk per UPDATE"""
+        total = 0
+        last_pk = None
+        while True:
+            chunk = model.objects.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return total
+            
+            with transaction.atomic():
+                model.objects.filter(pk__in=pks).update(**counters)
+            total += len(pks)
+            last_pk = pks[-1]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.9 on 2026-10-18 02:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(c=Count('pk')).values('c')
+    ), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Poem = apps.get_model('poetry', 'Poem')
+    Comment = apps.get_model('poetry', 'Comment')
+    Like = apps.get_model('poetry', 'Like')
+    Poem.objects.update(
+        likes_count=_count_of(Like, 'poem'),
+        comments_count=_count_of(Comment, 'poem'),
+    )
+    Comment.objects.update(
+        likes_count=_count_of(Like, 'comment'),
+        replies_count=_count_of(Comment, 'parent'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poetry', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='poem',
+            name='comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='poem',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poetry', '0002_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poem',
+            index=models.Index(fields=['created_at', 'id'], name='poetry_poem_created_7d7227_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poem',
+            index=models.Index(fields=['likes_count', 'id'], name='poetry_poem_likes_c_16d3bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poem',
+            index=models.Index(fields=['comments_count', 'id'], name='poetry_poem_comment_638a4b_idx'),
+        ),
+    ]
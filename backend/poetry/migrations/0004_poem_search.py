@@ -0,0 +1,96 @@
+# Generated by Django 4.2.9 on 2026-10-18 02:28
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    CREATE FUNCTION poetry_poem_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.content, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # Also fire when Django writes the column itself, so a full save never leaves it stale
+    """
+    CREATE TRIGGER poetry_poem_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, content, search_vector ON poetry_poem
+    FOR EACH ROW EXECUTE FUNCTION poetry_poem_search_vector_update()
+    """,
+    "UPDATE poetry_poem SET search_vector = NULL",
+    "CREATE INDEX poetry_poem_search_vector_gin ON poetry_poem USING gin (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS poetry_poem_search_vector_gin",
+    "DROP TRIGGER IF EXISTS poetry_poem_search_vector_trigger ON poetry_poem",
+    "DROP FUNCTION IF EXISTS poetry_poem_search_vector_update()",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE poetry_poem_fts USING fts5(
+        title, description, content, content='poetry_poem', content_rowid='rowid',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER poetry_poem_fts_insert AFTER INSERT ON poetry_poem BEGIN
+        INSERT INTO poetry_poem_fts(rowid, title, description, content)
+        VALUES (new.rowid, new.title, new.description, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER poetry_poem_fts_delete AFTER DELETE ON poetry_poem BEGIN
+        INSERT INTO poetry_poem_fts(poetry_poem_fts, rowid, title, description, content)
+        VALUES ('delete', old.rowid, old.title, old.description, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER poetry_poem_fts_update AFTER UPDATE OF title, description, content ON poetry_poem BEGIN
+        INSERT INTO poetry_poem_fts(poetry_poem_fts, rowid, title, description, content)
+        VALUES ('delete', old.rowid, old.title, old.description, old.content);
+        INSERT INTO poetry_poem_fts(rowid, title, description, content)
+        VALUES (new.rowid, new.title, new.description, new.content);
+    END
+    """,
+    "INSERT INTO poetry_poem_fts(poetry_poem_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS poetry_poem_fts_update",
+    "DROP TRIGGER IF EXISTS poetry_poem_fts_delete",
+    "DROP TRIGGER IF EXISTS poetry_poem_fts_insert",
+    "DROP TABLE IF EXISTS poetry_poem_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poetry', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poem',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poetry', '0004_poem_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poem',
+            name='thread_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,10 +1,43 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
+from collections import Counter
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
+# Shares the sampling configured for the like endpoints (see LOGGING)
+like_logger = logging.getLogger('poetry.likes')
+
+# Attempts at inserting a poem with a freshly allocated slug before giving up
+SLUG_SAVE_ATTEMPTS = 5
+
+# Distinct base slugs looked up per prefix query when allocating in bulk
+SLUG_QUERY_BATCH = 200
+
+# Leaves room for a numeric suffix within the slug column's 250 characters
+SLUG_BASE_MAX_LENGTH = 240
+
+
+def _counter_safe_save_kwargs(instance, counter_fields, kwargs):
+    """
+    Keep a full save of an existing row from writing back stale counters.
+    
+    Counter columns are only ever changed with F() updates, so updating an
+    existing row without explicit update_fields writes every other loaded
+    field (deferred ones are left alone, as Django itself would).
+    """
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        deferred = instance.get_deferred_fields()
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in counter_fields
+            and field.attname not in deferred
+        ]
+    return kwargs
+
 
 class Poem(models.Model):
     """Model for storing poetry content"""
@@ -19,40 +52,110 @@ class Poem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized counters, maintained by poetry.signals
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    
+    # Last comment or like change anywhere in the thread, for HTTP validators
+    thread_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Weighted full-text vector, maintained by a database trigger (see poetry.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'thread_updated_at')
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['slug']),
             models.Index(fields=['created_at']),
+            # Keyset pagination seeks on (sort key, id)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['likes_count', 'id']),
+            models.Index(fields=['comments_count', 'id']),
         ]
     
     def __str__(self):
         return self.title
     
     def save(self, *args, **kwargs):
+        kwargs = _counter_safe_save_kwargs(self, self.COUNTER_FIELDS, kwargs)
+        
         # Generate a unique slug if one doesn't exist
-        if not self.slug:
-            base_slug = slugify(self.title)
-            unique_slug = base_slug
-            counter = 1
-            
-            while Poem.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            self.slug = unique_slug
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            self._save_with_new_slug(*args, **kwargs)
+        logger.info("Poem saved: %s (ID: %s) by user %s", self.title, self.id, self.user_id)
+    
+    def _save_with_new_slug(self, *args, **kwargs):
+        """
+        Insert with the next free slug, retrying if a concurrent save takes it.
         
-        super().save(*args, **kwargs)
-        logger.info(f"Poem saved: {self.title} (ID: {self.id}) by user {self.user.username}")
+        Each attempt runs in a savepoint so a unique violation on the slug
+        leaves any surrounding transaction usable.
+        """
+        for attempt in range(1, SLUG_SAVE_ATTEMPTS + 1):
+            Poem.allocate_slugs([self])
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == SLUG_SAVE_ATTEMPTS or not Poem.objects.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
+                logger.warning("Slug '%s' was taken concurrently, retrying (attempt %s)", self.slug, attempt)
+                self.slug = ''
+    
+    @staticmethod
+    def base_slug(title):
+        return slugify(title)[:SLUG_BASE_MAX_LENGTH] or 'untitled'
+    
+    @classmethod
+    def allocate_slugs(cls, poems):
+        """
+        Assign unique slugs to every poem in ``poems`` that lacks one.
+        
+        Taken slugs are looked up with one prefix query per batch of distinct
+        base slugs rather than one query per candidate, so this also serves
+        bulk imports followed by ``Poem.objects.bulk_create``.
+        """
+        pending = [poem for poem in poems if not poem.slug]
+        bases = sorted({cls.base_slug(poem.title) for poem in pending})
+        taken = {base: set() for base in bases}
+        
+        for start in range(0, len(bases), SLUG_QUERY_BATCH):
+            batch = bases[start:start + SLUG_QUERY_BATCH]
+            prefixes = models.Q()
+            for base in batch:
+                prefixes |= models.Q(slug__startswith=base)
+            for slug in cls.objects.filter(prefixes).values_list('slug', flat=True):
+                if slug in taken:
+                    taken[slug].add(0)
+                    continue
+                head, _, suffix = slug.rpartition('-')
+                if head in taken and suffix.isdigit():
+                    taken[head].add(int(suffix))
+        
+        # Hand out the lowest free suffix per base, as "base", "base-1", "base-2", ...
+        for poem in pending:
+            base = cls.base_slug(poem.title)
+            suffix = 0
+            while suffix in taken[base]:
+                suffix += 1
+            taken[base].add(suffix)
+            poem.slug = f"{base}-{suffix}" if suffix else base
+        return poems
     
     @property
     def like_count(self):
-        return self.likes.count()
+        return self.likes_count
     
     @property
     def comment_count(self):
-        return self.comments.count()
+        return self.comments_count
 
 
 class Like(models.Model):
@@ -106,8 +209,10 @@ class Like(models.Model):
         elif self.comment:
             self.content_type = 'comment'
         
-        super().save(*args, **kwargs)
-        logger.info(f"Like created by {self.user.username} on {self.content_type} (ID: {self.id})")
+        # Counters are bumped by the post_save signal, inside this transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        like_logger.info("Like created by user %s on %s (ID: %s)", self.user_id, self.content_type, self.id)
 
 
 class Comment(models.Model):
@@ -123,6 +228,10 @@ class Comment(models.Model):
     # Denormalized fields for performance
     path = models.CharField(max_length=500, db_index=True)
     depth = models.IntegerField(default=0)
+    likes_count = models.IntegerField(default=0)
+    replies_count = models.IntegerField(default=0)
+    
+    COUNTER_FIELDS = ('likes_count', 'replies_count')
     
     class Meta:
         ordering = ['created_at']
@@ -137,34 +246,100 @@ class Comment(models.Model):
         return f"Comment by {self.user.username} on {self.poem.title if self.poem else 'reply'}"
     
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        if is_new:
+            # The UUID exists before the INSERT, so the path can be written by it
+            self.assign_path()
+        
+        # Counters are bumped by the post_save signal, inside this transaction
+        with transaction.atomic():
+            super().save(*args, **_counter_safe_save_kwargs(self, self.COUNTER_FIELDS, kwargs))
+        
+        if is_new and self.parent_id:
+            logger.info("Reply created to comment %s by user %s", self.parent_id, self.user_id)
+        elif is_new:
+            logger.info("Comment created on poem %s by user %s", self.poem_id, self.user_id)
+    
+    def assign_path(self):
+        """Compute path, depth and (for replies) poem from the parent, without saving"""
         # Check if this is a top-level comment or a reply
-        if not self.parent:
-            if not self.poem:
+        if not self.parent_id:
+            if not self.poem_id:
                 raise ValueError("Top-level comments must be associated with a poem")
             # For top-level comments, create a new path
-            super().save(*args, **kwargs)  # Save first to get ID
             self.path = str(self.id)
             self.depth = 0
-            super().save(update_fields=['path', 'depth'])
-            logger.info(f"Comment created on poem '{self.poem.title}' by {self.user.username}")
         else:
-            # For replies, extend the parent's path
-            if self.poem:
-                raise ValueError("Replies cannot be directly associated with a poem")
-            self.poem = self.parent.poem  # Inherit poem from parent
-            super().save(*args, **kwargs)  # Save first to get ID
-            self.path = f"{self.parent.path}.{self.id}"
-            self.depth = self.parent.depth + 1
-            super().save(update_fields=['path', 'depth', 'poem'])
-            logger.info(f"Reply created to comment {self.parent.id} by {self.user.username}")
+            # For replies, extend the parent's path and inherit its poem
+            parent = self.parent
+            if self.poem_id and self.poem_id != parent.poem_id:
+                raise ValueError("Replies cannot be associated with a different poem than their parent")
+            self.poem_id = parent.poem_id
+            self.path = f"{parent.path}.{self.id}"
+            self.depth = parent.depth + 1
+    
+    @classmethod
+    def bulk_create_thread(cls, comments, batch_size=500):
+        """
+        Insert whole comment threads with ``bulk_create``.
+        
+        Replies may point at parents from the same batch (which must come
+        before them) or at saved comments. Paths, depths and counters are
+        filled in beforehand, and the counters of saved parents and poems
+        are bumped with one F() update each.
+        """
+        comments = list(comments)
+        batch = {comment.id: comment for comment in comments}
+        
+        # Load saved parents referenced only by id in one query
+        saved_parent_ids = {
+            comment.parent_id for comment in comments
+            if comment.parent_id and comment.parent_id not in batch
+            and not Comment.parent.is_cached(comment)
+        }
+        saved_parents = cls.objects.in_bulk(saved_parent_ids)
+        
+        prepared = set()
+        poem_counts = Counter()
+        parent_counts = Counter()
+        for comment in comments:
+            comment.likes_count = 0
+            comment.replies_count = 0
+            if comment.parent_id in saved_parents:
+                comment.parent = saved_parents[comment.parent_id]
+            if comment.parent_id in batch:
+                if comment.parent_id not in prepared:
+                    raise ValueError("Parent comments must come before their replies")
+                comment.parent = batch[comment.parent_id]
+                comment.parent.replies_count += 1
+            elif comment.parent_id:
+                parent_counts[comment.parent_id] += 1
+            comment.assign_path()
+            poem_counts[comment.poem_id] += 1
+            prepared.add(comment.id)
+        
+        with transaction.atomic():
+            created = cls.objects.bulk_create(comments, batch_size=batch_size)
+            for poem_id, count in poem_counts.items():
+                Poem.objects.filter(pk=poem_id).update(comments_count=F('comments_count') + count)
+            for parent_id, count in parent_counts.items():
+                cls.objects.filter(pk=parent_id).update(replies_count=F('replies_count') + count)
+        
+        # bulk_create sends no signals, so invalidate cached threads here
+        from .cache import bump_versions
+        for poem_id in poem_counts:
+            bump_versions(poem_id=poem_id)
+        
+        logger.info("Bulk created %s comments on %s poems", len(created), len(poem_counts))
+        return created
     
     @property
     def like_count(self):
-        return self.likes.count()
+        return self.likes_count
     
     @property
     def reply_count(self):
-        return self.replies.count()
+        return self.replies_count
     
     @property
     def is_reply(self):
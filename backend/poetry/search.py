@@ -0,0 +1,128 @@
+from django.db import connections
+from django.db.models import F, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration used by the PostgreSQL trigger and queries
+SEARCH_CONFIG = 'english'
+
+# FTS5 table shadowing poetry_poem on SQLite, kept in sync by triggers
+FTS_TABLE = 'poetry_poem_fts'
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+
+class PostgresSearchEngine:
+    """
+    Search over the trigger-maintained ``Poem.search_vector`` column.
+
+    The vector weights title (A) over description (B) over content (C) and
+    is covered by a GIN index, so matching never scans poem bodies.
+    """
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query),
+            search_highlight=SearchHeadline(
+                'content', search_query, config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP,
+                max_words=30, min_words=10,
+            ),
+        )
+
+
+class SQLiteSearchEngine:
+    """
+    Search through the FTS5 table mirroring poems on SQLite.
+
+    bm25 is weighted like the PostgreSQL vector (title > description >
+    content) so local and test environments rank results the same way.
+    """
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if match is None:
+            # Still annotated, so callers can order by rank
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField()),
+                search_highlight=Value('', output_field=TextField()),
+            )
+
+        table = queryset.model._meta.db_table
+        fts_row = f"SELECT {{}} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.rowid"
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT {table}.id FROM {table} JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = {table}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s",
+                [match],
+            )
+        ).annotate(
+            # bm25 scores lower for better matches; negate it so higher ranks first
+            search_rank=RawSQL(
+                fts_row.format(f"-bm25({FTS_TABLE}, 10.0, 4.0, 1.0)"), [match], output_field=FloatField()
+            ),
+            search_highlight=RawSQL(
+                fts_row.format(
+                    f"snippet({FTS_TABLE}, 2, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '...', 30)"
+                ),
+                [match],
+                output_field=TextField(),
+            ),
+        )
+
+    @staticmethod
+    def match_expression(query):
+        """Quote every word so user input can never be parsed as FTS5 syntax"""
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"' for term in terms)
+
+
+class ContainsSearchEngine:
+    """Unindexed fallback for databases without a full-text engine"""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(description__icontains=query)
+        ).annotate(
+            search_rank=Value(0.0, output_field=FloatField()),
+            search_highlight=Value('', output_field=TextField()),
+        )
+
+
+_engines = {}
+
+
+def get_search_engine(using='default'):
+    """Pick the search engine for a database alias, checking its schema once"""
+    if using not in _engines:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            engine = PostgresSearchEngine()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            engine = SQLiteSearchEngine()
+        else:
+            logger.warning("No full-text index on database '%s', falling back to icontains search", using)
+            engine = ContainsSearchEngine()
+        _engines[using] = engine
+    return _engines[using]
+
+
+def search_poems(queryset, query):
+    """
+    Filter poems to those matching ``query``.
+
+    Results are annotated with ``search_rank`` (higher is more relevant) and
+    ``search_highlight`` (a content snippet with matches wrapped in <mark>).
+    """
+    return get_search_engine(queryset.db).search(queryset, query)
@@ -1,4 +1,11 @@
+from django.urls import reverse
+from rest_framework.utils.urls import replace_query_param
+
+from api.fieldsets import SparseFieldsetMixin
+from api.pagination import KeysetPagination
 from .models import Comment, Like, Poem
+from .comment_tree import load_poem_thread, walk_comment_tree
+from .likes import like_context
 from rest_framework import serializers
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -9,17 +16,21 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'username', 'content_type', 'created_at']
         read_only_fields = ['id', 'created_at', 'content_type', 'user']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     likes_count = serializers.IntegerField(read_only=True)
     replies_count = serializers.IntegerField(read_only=True)
     is_liked = serializers.SerializerMethodField()
     
     def get_is_liked(self, obj):
+        # Prefer the likes resolved for the whole page by the view
+        liked_ids = self.context.get('liked_comment_ids')
+        if liked_ids is not None:
+            return obj.id in liked_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(
-                user=request.user,
+                user_id=request.user.pk,
                 comment=obj,
                 content_type='comment'
             ).exists()
@@ -50,22 +61,59 @@ class RecursiveCommentSerializer(CommentSerializer):
         ).exclude(id=obj.id).count()
     
     def get_replies(self, obj):
-        # Only fetch immediate children
-        replies = Comment.objects.filter(parent=obj)
+        # Use the children assembled by the comment tree builder when available
+        replies = getattr(obj, 'tree_replies', None)
+        if replies is None:
+            # Fallback: only fetch immediate children
+            replies = Comment.objects.filter(parent=obj)
         serializer = RecursiveCommentSerializer(replies, many=True, context=self.context)
         return serializer.data
 
-class PoemListSerializer(serializers.ModelSerializer):
+class ThreadPageCommentSerializer(CommentSerializer):
+    """
+    Comment in a depth- and breadth-limited thread page.
+    
+    ``replies`` holds the replies loaded by ``expand_thread_page``;
+    ``more_replies`` links to the next page of this comment's replies
+    (continuing after the last loaded one) or is null when all are shown.
+    ``context['thread_page']`` carries the page's limits for those links.
+    """
+    replies = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField()
+    
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['replies', 'more_replies']
+    
+    def get_replies(self, obj):
+        return ThreadPageCommentSerializer(obj.tree_replies, many=True, context=self.context).data
+    
+    def get_more_replies(self, obj):
+        if obj.replies_count <= len(obj.tree_replies):
+            return None
+        url = self.context['request'].build_absolute_uri(reverse('comment-replies', kwargs={'pk': obj.id}))
+        for param, value in self.context['thread_page'].items():
+            url = replace_query_param(url, param, value)
+        cursor = ''
+        if obj.tree_replies:
+            key_fields = [Comment._meta.get_field('created_at'), Comment._meta.pk]
+            cursor = KeysetPagination.encode_cursor('created_at', key_fields, obj.tree_replies[-1])
+        return replace_query_param(url, KeysetPagination.cursor_query_param, cursor)
+
+class PoemListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     likes_count = serializers.IntegerField(read_only=True)
     comments_count = serializers.IntegerField(read_only=True)
     is_liked = serializers.SerializerMethodField()
     
     def get_is_liked(self, obj):
+        # Prefer the likes resolved for the whole page by the view
+        liked_ids = self.context.get('liked_poem_ids')
+        if liked_ids is not None:
+            return obj.id in liked_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(
-                user=request.user,
+                user_id=request.user.pk,
                 poem=obj,
                 content_type='poem'
             ).exists()
@@ -79,10 +127,27 @@ class PoemListSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'user', 'slug', 'created_at', 'updated_at', 'likes_count', 'comments_count', 'is_liked']
 
+class PoemSearchResultSerializer(PoemListSerializer):
+    """Poem list entry with the relevance rank and highlighted snippet of a search"""
+    search_rank = serializers.FloatField(read_only=True)
+    search_highlight = serializers.CharField(read_only=True)
+    
+    class Meta(PoemListSerializer.Meta):
+        fields = PoemListSerializer.Meta.fields + ['search_rank', 'search_highlight']
+
 class PoemDetailSerializer(serializers.ModelSerializer):
+    """
+    Poem with its comment thread embedded.
+    
+    ``context['comments']`` picks how much of the thread to embed: 'all'
+    (the default), 'top' or 'none'; ``context['comment_depth']`` limits
+    'all' to that many levels of replies. ``context['thread']`` may carry
+    the thread already loaded (with its likes in the context), as async
+    views do since serialization cannot query there.
+    """
     username = serializers.CharField(source='user.username', read_only=True)
     likes_count = serializers.IntegerField(read_only=True)
-    comments_count = serializers.SerializerMethodField()
+    comments_count = serializers.IntegerField(read_only=True)
     comments = serializers.SerializerMethodField()
     
     class Meta:
@@ -94,12 +159,21 @@ class PoemDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'user', 'slug', 'created_at', 'updated_at', 'likes_count', 'comments_count']
     
-    def get_comments_count(self, obj):
-        # Count all comments related to this poem (including replies)
-        return Comment.objects.filter(poem=obj).count()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('comments') == 'none':
+            self.fields.pop('comments')
     
     def get_comments(self, obj):
-        # Get only top-level comments (no parent)
-        comments = Comment.objects.filter(poem=obj, parent=None).prefetch_related('replies')
-        serializer = RecursiveCommentSerializer(comments, many=True, context=self.context)
+        if 'thread' in self.context:
+            return RecursiveCommentSerializer(self.context['thread'], many=True, context=self.context).data
+        
+        # Load the thread (down to the requested depth) in one query and nest it in memory
+        max_depth = 0 if self.context.get('comments') == 'top' else self.context.get('comment_depth')
+        comments = load_poem_thread(obj, max_depth=max_depth)
+        context = {
+            **self.context,
+            **like_context(self.context.get('request'), comments=walk_comment_tree(comments)),
+        }
+        serializer = RecursiveCommentSerializer(comments, many=True, context=context)
         return serializer.data
\ No newline at end of file
@@ -0,0 +1,94 @@
+from django.db.models import F, QuerySet, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_versions
+from .models import Comment, Like, Poem
+
+
+def _deleting_poem(origin):
+    """True when a delete was started on a poem, so its whole thread goes with it"""
+    if isinstance(origin, QuerySet):
+        return origin.model is Poem
+    return isinstance(origin, Poem)
+
+
+def _bump_like_counters(like, delta):
+    if like.poem_id:
+        Poem.objects.filter(pk=like.poem_id).update(
+            likes_count=F('likes_count') + delta, thread_updated_at=timezone.now()
+        )
+    elif like.comment_id:
+        Comment.objects.filter(pk=like.comment_id).update(likes_count=F('likes_count') + delta)
+        Poem.objects.filter(
+            pk=Subquery(Comment.objects.filter(pk=like.comment_id).values('poem_id')[:1])
+        ).update(thread_updated_at=timezone.now())
+
+
+def _bump_comment_counters(comment, delta):
+    if comment.poem_id:
+        Poem.objects.filter(pk=comment.poem_id).update(
+            comments_count=F('comments_count') + delta, thread_updated_at=timezone.now()
+        )
+    if comment.parent_id:
+        Comment.objects.filter(pk=comment.parent_id).update(replies_count=F('replies_count') + delta)
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        _bump_like_counters(instance, 1)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_poem(origin):
+        _bump_like_counters(instance, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        _bump_comment_counters(instance, 1)
+    elif instance.poem_id:
+        # An edit changes the thread without touching any counter
+        Poem.objects.filter(pk=instance.poem_id).update(thread_updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_poem(origin):
+        _bump_comment_counters(instance, -1)
+
+
+def _like_poem_id(like):
+    """The poem a like belongs to, without loading the liked comment if possible"""
+    if like.poem_id:
+        return like.poem_id
+    if Like.comment.is_cached(like):
+        return like.comment.poem_id
+    return Comment.objects.filter(pk=like.comment_id).values_list('poem_id', flat=True).first()
+
+
+@receiver(post_save, sender=Poem)
+def poem_saved_invalidate(sender, instance, **kwargs):
+    bump_versions(poem_id=instance.pk)
+
+
+@receiver(post_delete, sender=Poem)
+def poem_deleted_invalidate(sender, instance, **kwargs):
+    bump_versions(poem_id=instance.pk, slug=instance.slug)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed_invalidate(sender, instance, origin=None, **kwargs):
+    if not _deleting_poem(origin):
+        # Edits leave the poem's comment count, the only part of the feed comments touch, alone
+        bump_versions(poem_id=instance.poem_id, feed=kwargs.get('created', True))
+
+
+@receiver([post_save, post_delete], sender=Like)
+def like_changed_invalidate(sender, instance, origin=None, **kwargs):
+    if not _deleting_poem(origin):
+        bump_versions(poem_id=_like_poem_id(instance), feed=bool(instance.poem_id))
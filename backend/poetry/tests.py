@@ -1,3 +1,936 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+import base64
+import io
+import json
+from unittest import mock
+import uuid
 
-# Create your tests here.
+from api.authentication import ClaimsRefreshToken, user_states
+from api.testing import QueryBudgetTestCase, call_async_view, grow_thread, like_everything
+from core.caches import require_shared
+from . import async_views
+from .comment_tree import load_poem_thread, load_reply_thread
+from .likes import liked_ids
+from .models import SLUG_SAVE_ATTEMPTS, Comment, Like, Poem
+from .search import ContainsSearchEngine
+
+User = get_user_model()
+
+# Comments made by PoetryTestCase.comment are dated this many minutes after it
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PoetryTestCase(TestCase):
+    """An author's poem and a reader, with helpers to build threads and call the API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', email='author@example.com', password='author-password')
+        cls.reader = User.objects.create_user('reader', email='reader@example.com', password='reader-password')
+        cls.poem = Poem.objects.create(user=cls.author, title='Night Light', content='The lamp hums in the dark')
+
+    def setUp(self):
+        cache.clear()
+        user_states.clear()
+
+    def api(self, method, path, data=None, user=None, **headers):
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {ClaimsRefreshToken.for_user(user).access_token}"
+        body = json.dumps(data) if data is not None else ''
+        return self.client.generic(method, path, body, content_type='application/json', **headers)
+
+    def comment(self, parent=None, minutes=0, user=None, poem=None):
+        """A comment on the poem (or a reply to ``parent``), dated ``minutes`` after EPOCH"""
+        comment = Comment.objects.create(
+            user=user or self.reader, poem=None if parent else poem or self.poem, parent=parent,
+            content=f"at {minutes}"
+        )
+        Comment.objects.filter(pk=comment.pk).update(created_at=EPOCH + timedelta(minutes=minutes))
+        comment.refresh_from_db()
+        return comment
+
+
+@override_settings(POETRY_RESPONSE_CACHE=True)
+class PoetryQueryBudgetTestCase(QueryBudgetTestCase):
+    """
+    Seeded poems and threads, plus a reader who has liked some of them.
+
+    Growth adds seeded content and also deepens the busiest thread and the
+    reader's likes, so the endpoints under test really see more rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.poem = Poem.objects.select_related('user').order_by('-comments_count', 'pk').first()
+        cls.author = cls.poem.user
+        cls.reader = User.objects.exclude(pk=cls.author.pk).order_by('pk').first()
+        cls.comment = Comment.objects.filter(poem=cls.poem, depth=0).order_by('-replies_count', 'pk').first()
+        cls.own_comment = Comment.objects.create(user=cls.author, poem=cls.poem, content='mine')
+        # A reply chain, so every level a thread page expands holds comments
+        parent = cls.comment
+        for depth in range(3):
+            parent = Comment.objects.create(user=cls.reader, poem=cls.poem, parent=parent, content=f"chain {depth}")
+        like_everything(
+            cls.reader,
+            poems=Poem.objects.order_by('pk')[:5],
+            comments=Comment.objects.filter(poem=cls.poem).order_by('pk')[:10],
+        )
+
+    def grow(self):
+        super().grow()
+        grow_thread(self.poem, list(User.objects.all()), comments=30, rng=self.rng)
+        like_everything(
+            self.reader,
+            poems=Poem.objects.order_by('-created_at')[:5],
+            comments=Comment.objects.filter(poem=self.poem).order_by('-created_at')[:10],
+        )
+
+
+class PoemQueryBudgetTests(PoetryQueryBudgetTestCase):
+
+    def test_poem_list(self):
+        self.assertQueryBudget(2, 'GET', '/api/poems/')
+
+    def test_poem_list_authenticated(self):
+        self.assertQueryBudget(3, 'GET', '/api/poems/', user=self.reader)
+
+    def test_poem_list_cursor(self):
+        self.assertQueryBudget(2, 'GET', '/api/poems/?cursor=&ordering=-likes_count', user=self.reader)
+
+    def test_poem_list_search(self):
+        self.assertQueryBudget(3, 'GET', '/api/poems/?search=light', user=self.reader)
+
+    def test_poem_list_sparse_fields(self):
+        self.assertQueryBudget(2, 'GET', '/api/poems/?fields=title,slug')
+
+    def test_poem_create(self):
+        self.assertQueryBudget(5, 'POST', '/api/poems/', {'title': 'Budget', 'content': 'x'}, user=self.author, status=201)
+
+    def test_poem_detail(self):
+        self.assertQueryBudget(5, 'GET', f'/api/poems/{self.poem.slug}/', user=self.reader)
+
+    def test_poem_detail_top_comments(self):
+        self.assertQueryBudget(6, 'GET', f'/api/poems/{self.poem.slug}/?comments=top', user=self.reader)
+
+    def test_poem_detail_without_comments(self):
+        self.assertQueryBudget(3, 'GET', f'/api/poems/{self.poem.slug}/?comments=none')
+
+    def test_poem_update(self):
+        self.assertQueryBudget(2, 'PUT', f'/api/poems/{self.poem.slug}/', {'description': 'edited'}, user=self.author)
+
+    def test_poem_comments(self):
+        self.assertQueryBudget(5, 'GET', f'/api/poems/{self.poem.slug}/comments/', user=self.reader)
+
+    def test_poem_comments_page(self):
+        self.assertQueryBudget(7, 'GET', f'/api/poems/{self.poem.slug}/comments/?cursor=', user=self.reader)
+
+
+class CommentQueryBudgetTests(PoetryQueryBudgetTestCase):
+
+    def test_comment_list(self):
+        self.assertQueryBudget(3, 'GET', '/api/comments/', user=self.reader)
+
+    def test_comment_list_filtered(self):
+        self.assertQueryBudget(2, 'GET', f'/api/comments/?poem={self.poem.pk}&fields=content')
+
+    def test_comment_create(self):
+        self.assertQueryBudget(
+            6, 'POST', '/api/comments/', {'poem': str(self.poem.pk), 'content': 'hi'}, user=self.reader, status=201
+        )
+
+    def test_reply_create(self):
+        self.assertQueryBudget(
+            7, 'POST', '/api/comments/', {'parent': str(self.comment.pk), 'content': 'hi'}, user=self.reader,
+            status=201
+        )
+
+    def test_comment_detail(self):
+        self.assertQueryBudget(1, 'GET', f'/api/comments/{self.comment.pk}/')
+
+    def test_comment_update(self):
+        self.assertQueryBudget(5, 'PUT', f'/api/comments/{self.own_comment.pk}/', {'content': 'edited'}, user=self.author)
+
+    def test_comment_replies(self):
+        self.assertQueryBudget(3, 'GET', f'/api/comments/{self.comment.pk}/replies/', user=self.reader)
+
+    def test_comment_replies_page(self):
+        self.assertQueryBudget(5, 'GET', f'/api/comments/{self.comment.pk}/replies/?cursor=', user=self.reader)
+
+
+class LikeQueryBudgetTests(PoetryQueryBudgetTestCase):
+
+    def unlike_all(self):
+        Like.objects.filter(user=self.author).delete()
+
+    def budget(self, steps):
+        """One statement on PostgreSQL; elsewhere ``steps`` statements inside a savepoint"""
+        return 1 if connection.vendor == 'postgresql' else steps + 2
+
+    def test_poem_like(self):
+        path = f'/api/poems/{self.poem.slug}/like/'
+        self.assertQueryBudget(self.budget(2), 'PUT', path, user=self.author, status=201, prepare=self.unlike_all)
+
+    def test_poem_unlike(self):
+        path = f'/api/poems/{self.poem.slug}/like/'
+        like = lambda: like_everything(self.author, poems=[self.poem])
+        self.assertQueryBudget(self.budget(2), 'DELETE', path, user=self.author, prepare=like)
+
+    def test_poem_like_toggle(self):
+        path = f'/api/poems/{self.poem.slug}/like/'
+        like = lambda: like_everything(self.author, poems=[self.poem])
+        self.assertQueryBudget(self.budget(2), 'POST', path, user=self.author, prepare=like)
+
+    def test_poem_like_toggle_on(self):
+        path = f'/api/poems/{self.poem.slug}/like/'
+        self.assertQueryBudget(self.budget(3), 'POST', path, user=self.author, status=201, prepare=self.unlike_all)
+
+    def test_comment_like(self):
+        path = f'/api/comments/{self.comment.pk}/like/'
+        self.assertQueryBudget(self.budget(3), 'PUT', path, user=self.author, status=201, prepare=self.unlike_all)
+
+    def test_comment_unlike(self):
+        path = f'/api/comments/{self.comment.pk}/like/'
+        like = lambda: like_everything(self.author, comments=[self.comment])
+        self.assertQueryBudget(self.budget(3), 'DELETE', path, user=self.author, prepare=like)
+
+
+class AsyncReadViewTests(PoetryQueryBudgetTestCase):
+    """The async read views answer exactly like the sync views they stand in for"""
+
+    def assertMatchesSync(self, view, path, user=None, clear_cache=True):
+        headers = self.auth_headers(user) if user is not None else {}
+        cache.clear()
+        expected = self.client.get(path, **headers)
+        if clear_cache:
+            cache.clear()
+        response = call_async_view(view, path, **headers)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), expected.json())
+        return response
+
+    def test_poem_list(self):
+        self.assertMatchesSync(async_views.poem_list, '/api/poems/')
+        self.assertMatchesSync(async_views.poem_list, '/api/poems/?cursor=&ordering=title', user=self.reader)
+        self.assertMatchesSync(async_views.poem_list, '/api/poems/?search=light&fields=title,is_liked', user=self.reader)
+        self.assertMatchesSync(async_views.poem_list, '/api/poems/?ordering=content')
+
+    def test_poem_detail(self):
+        path = f'/api/poems/{self.poem.slug}/'
+        self.assertMatchesSync(async_views.poem_detail, path, user=self.reader)
+        self.assertMatchesSync(async_views.poem_detail, f'{path}?comments=top')
+        self.assertMatchesSync(async_views.poem_detail, f'{path}?comment_depth=1', user=self.reader)
+        self.assertMatchesSync(async_views.poem_detail, '/api/poems/missing/')
+
+    def test_poem_comments(self):
+        path = f'/api/poems/{self.poem.slug}/comments/'
+        self.assertMatchesSync(async_views.poem_comments, path, user=self.reader)
+        self.assertMatchesSync(async_views.poem_comments, f'{path}?cursor=&replies=1', user=self.reader)
+
+    def test_comment_replies(self):
+        path = f'/api/comments/{self.comment.pk}/replies/'
+        self.assertMatchesSync(async_views.comment_replies, path, user=self.reader)
+        self.assertMatchesSync(async_views.comment_replies, f'{path}?cursor=&depth=1')
+
+    def test_shares_cache_entries_with_sync_views(self):
+        response = self.assertMatchesSync(
+            async_views.poem_detail, f'/api/poems/{self.poem.slug}/', user=self.reader, clear_cache=False
+        )
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_conditional_get(self):
+        path = f'/api/poems/{self.poem.slug}/'
+        etag = call_async_view(async_views.poem_detail, path)['ETag']
+        response = call_async_view(async_views.poem_detail, path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_rejects_invalid_token(self):
+        response = call_async_view(async_views.poem_list, '/api/poems/', HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual(response.status_code, 401)
+
+
+class CommentThreadTests(PoetryTestCase):
+    """Whole threads load in one query and nest in memory, oldest replies first"""
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.comment(minutes=1)
+        self.second = self.comment(minutes=2)
+        self.reply = self.comment(parent=self.first, minutes=4)
+        self.early_reply = self.comment(parent=self.first, minutes=3)
+        self.nested = self.comment(parent=self.reply, minutes=5)
+
+    def ids(self, comments):
+        return [comment.id for comment in comments]
+
+    def test_load_poem_thread(self):
+        with self.assertNumQueries(1):
+            roots = load_poem_thread(self.poem)
+        self.assertEqual(self.ids(roots), [self.first.id, self.second.id])
+        first = roots[0]
+        self.assertEqual(self.ids(first.tree_replies), [self.early_reply.id, self.reply.id])
+        self.assertEqual(self.ids(first.tree_replies[1].tree_replies), [self.nested.id])
+        self.assertEqual((first.replies_count, first.total_replies_count), (2, 3))
+        self.assertEqual((roots[1].replies_count, roots[1].total_replies_count), (0, 0))
+
+    def test_load_poem_thread_to_a_depth(self):
+        roots = load_poem_thread(self.poem, max_depth=0)
+        self.assertEqual(roots[0].tree_replies, [])
+        # Pruned comments keep their stored reply count and still count everything below them
+        self.assertEqual((roots[0].replies_count, roots[0].total_replies_count), (2, 3))
+
+    def test_load_reply_thread(self):
+        with self.assertNumQueries(1):
+            replies = load_reply_thread(self.first)
+        self.assertEqual(self.ids(replies), [self.early_reply.id, self.reply.id])
+        self.assertEqual(replies[1].total_replies_count, 1)
+
+    def test_poem_comments(self):
+        data = self.api('GET', f'/api/poems/{self.poem.slug}/comments/').json()
+        self.assertEqual([comment['id'] for comment in data], [str(self.first.id), str(self.second.id)])
+        replies = data[0]['replies']
+        self.assertEqual([reply['id'] for reply in replies], [str(self.early_reply.id), str(self.reply.id)])
+        self.assertEqual(replies[1]['replies'][0]['id'], str(self.nested.id))
+        self.assertEqual((data[0]['replies_count'], data[0]['total_replies_count']), (2, 3))
+
+    def test_poem_detail_embeds_the_thread(self):
+        detail = self.api('GET', f'/api/poems/{self.poem.slug}/').json()
+        comments = self.api('GET', f'/api/poems/{self.poem.slug}/comments/').json()
+        self.assertEqual(detail['comments'], comments)
+
+    def test_comment_replies(self):
+        data = self.api('GET', f'/api/comments/{self.first.id}/replies/').json()
+        self.assertEqual([reply['id'] for reply in data], [str(self.early_reply.id), str(self.reply.id)])
+        self.assertEqual(data[1]['replies'][0]['id'], str(self.nested.id))
+
+
+class LikedFlagTests(PoetryTestCase):
+    """is_liked is resolved for a whole page at once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_poem = Poem.objects.create(user=cls.author, title='Morning', content='Birds at the window')
+        like_everything(cls.reader, poems=[cls.poem])
+
+    def test_poem_list(self):
+        data = self.api('GET', '/api/poems/', user=self.reader).json()
+        liked = {poem['slug']: poem['is_liked'] for poem in data['results']}
+        self.assertEqual(liked, {self.poem.slug: True, self.other_poem.slug: False})
+
+    def test_poem_list_anonymous(self):
+        data = self.api('GET', '/api/poems/').json()
+        self.assertFalse(any(poem['is_liked'] for poem in data['results']))
+
+    def test_comment_thread(self):
+        first, second = self.comment(minutes=1), self.comment(minutes=2)
+        reply = self.comment(parent=first, minutes=3)
+        like_everything(self.reader, comments=[second, reply])
+        data = self.api('GET', f'/api/poems/{self.poem.slug}/comments/', user=self.reader).json()
+        self.assertEqual([comment['is_liked'] for comment in data], [False, True])
+        self.assertTrue(data[0]['replies'][0]['is_liked'])
+
+    def test_one_query_per_page(self):
+        comments = [self.comment(minutes=minutes) for minutes in range(5)]
+        like_everything(self.reader, comments=comments[::2])
+        request = RequestFactory().get('/')
+        request.user = self.reader
+        with self.assertNumQueries(1):
+            liked = liked_ids(request, 'comment', comments)
+        self.assertEqual(liked, {comment.id for comment in comments[::2]})
+
+
+class CounterTests(PoetryTestCase):
+    """Signals keep the stored counters equal to what reconcile_counters recounts"""
+
+    def counters(self):
+        return (
+            list(Poem.objects.order_by('pk').values_list('likes_count', 'comments_count')),
+            list(Comment.objects.order_by('pk').values_list('likes_count', 'replies_count')),
+        )
+
+    def assertCountersReconciled(self):
+        stored = self.counters()
+        call_command('reconcile_counters', chunk_size=2, stdout=io.StringIO())
+        self.assertEqual(stored, self.counters())
+
+    def test_signals_match_a_recount(self):
+        first = self.comment(minutes=1)
+        reply = self.comment(parent=first, minutes=2)
+        self.comment(parent=reply, minutes=3)
+        Like.objects.create(user=self.reader, poem=self.poem)
+        Like.objects.create(user=self.author, comment=first)
+        Like.objects.create(user=self.reader, comment=reply)
+        self.poem.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((self.poem.likes_count, self.poem.comments_count), (1, 3))
+        self.assertEqual((first.likes_count, first.replies_count), (1, 1))
+        self.assertCountersReconciled()
+
+    def test_deletes_match_a_recount(self):
+        first = self.comment(minutes=1)
+        reply = self.comment(parent=first, minutes=2)
+        self.comment(parent=reply, minutes=3)
+        Like.objects.create(user=self.reader, comment=reply)
+        Like.objects.filter(comment=reply).delete()
+        reply.delete()
+        self.poem.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(self.poem.comments_count, 1)
+        self.assertEqual((first.likes_count, first.replies_count), (0, 0))
+        self.assertCountersReconciled()
+
+    def test_full_save_keeps_counters(self):
+        stale = Poem.objects.get(pk=self.poem.pk)
+        Like.objects.create(user=self.reader, poem=self.poem)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(Poem.objects.get(pk=self.poem.pk).likes_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        first = self.comment(minutes=1)
+        self.comment(parent=first, minutes=2)
+        Like.objects.create(user=self.reader, poem=self.poem)
+        Poem.objects.update(likes_count=7, comments_count=0)
+        Comment.objects.update(replies_count=5)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.poem.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((self.poem.likes_count, self.poem.comments_count), (1, 2))
+        self.assertEqual(first.replies_count, 1)
+
+
+class FeedPaginationTests(PoetryTestCase):
+    """Cursor pages of the poem feed walk every poem once, in both directions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index in range(6):
+            Poem.objects.create(user=cls.author, title=f'Verse {index}', content='words')
+        # Tied sort keys make the cursor fall back on the primary key
+        Poem.objects.filter(title__in=['Verse 1', 'Verse 2', 'Verse 3']).update(likes_count=2)
+
+    def walk(self, url, link='next'):
+        slugs = []
+        while url:
+            data = self.api('GET', url).json()
+            slugs += [poem['slug'] for poem in data['results']]
+            url = data[link]
+        return slugs
+
+    def expected(self, *ordering):
+        return list(Poem.objects.order_by(*ordering).values_list('slug', flat=True))
+
+    def test_cursor_walks_every_poem_once(self):
+        slugs = self.walk('/api/poems/?cursor=&page_size=2&ordering=-likes_count')
+        self.assertEqual(slugs, self.expected('-likes_count', '-pk'))
+
+    def test_previous_links_walk_back(self):
+        pages, url = [], '/api/poems/?cursor=&page_size=3&ordering=title'
+        while url:
+            data = self.api('GET', url).json()
+            pages.append([poem['slug'] for poem in data['results']])
+            url, previous = data['next'], data['previous']
+        self.assertEqual(sum(pages, []), self.expected('title', 'pk'))
+
+        back = []
+        while previous:
+            data = self.api('GET', previous).json()
+            back.insert(0, [poem['slug'] for poem in data['results']])
+            previous = data['previous']
+        self.assertEqual(back, pages[:-1])
+
+    def test_page_numbers(self):
+        data = self.api('GET', '/api/poems/?page=2&page_size=3').json()
+        self.assertEqual(data['count'], 7)
+        self.assertEqual([poem['slug'] for poem in data['results']], self.expected('-created_at', '-pk')[3:6])
+        self.assertIn('page=3', data['next'])
+
+    def test_count_modes(self):
+        self.assertIsNone(self.api('GET', '/api/poems/?cursor=').json()['count'])
+        self.assertEqual(self.api('GET', '/api/poems/?cursor=&count=exact').json()['count'], 7)
+        self.assertIsNone(self.api('GET', '/api/poems/?count=none').json()['count'])
+        self.assertIsInstance(self.api('GET', '/api/poems/?count=approximate').json()['count'], int)
+        self.assertEqual(self.api('GET', '/api/poems/?count=some').status_code, 400)
+
+    def test_invalid_cursors(self):
+        data = self.api('GET', '/api/poems/?cursor=&page_size=2&ordering=title').json()
+        cursor = data['next'].split('cursor=')[1].split('&')[0]
+        self.assertEqual(self.api('GET', f'/api/poems/?cursor={cursor}&ordering=-likes_count').status_code, 404)
+        self.assertEqual(self.api('GET', '/api/poems/?cursor=garbage').status_code, 404)
+        for values in (['not-a-date', 'x'], [None, None], [{'a': 1}, 1], ['2024-01-01T00:00:00Z'], []):
+            cursor = base64.urlsafe_b64encode(json.dumps({'o': '-created_at', 'v': values}).encode()).decode()
+            self.assertEqual(self.api('GET', f'/api/poems/?cursor={cursor}').status_code, 404, values)
+
+
+class SearchTests(PoetryTestCase):
+    """Full-text search ranks title matches first and follows edits"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.in_content = Poem.objects.create(user=cls.author, title='Harbour', content='A lantern swings over the quay')
+        cls.in_title = Poem.objects.create(user=cls.author, title='Lantern', content='Paper and wire')
+        cls.elsewhere = Poem.objects.create(user=cls.author, title='Fields', content='Wheat and wind')
+
+    def search(self, query, **params):
+        data = self.client.get('/api/poems/', {'search': query, **params}).json()
+        return data['results']
+
+    def test_title_matches_rank_first(self):
+        results = self.search('lantern')
+        self.assertEqual([poem['slug'] for poem in results], [self.in_title.slug, self.in_content.slug])
+        self.assertGreater(results[0]['search_rank'], results[1]['search_rank'])
+        self.assertIn('<mark>', results[1]['search_highlight'])
+
+    def test_edits_are_searchable(self):
+        self.elsewhere.content = 'Wheat under a lantern moon'
+        self.elsewhere.save()
+        self.assertIn(self.elsewhere.slug, [poem['slug'] for poem in self.search('lantern')])
+
+    def test_search_syntax_is_not_interpreted(self):
+        response = self.client.get('/api/poems/', {'search': '"lantern OR (quay'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_contains_fallback(self):
+        poems = ContainsSearchEngine().search(Poem.objects.order_by('title'), 'wire')
+        self.assertEqual([poem.slug for poem in poems], [self.in_title.slug])
+        self.assertEqual(poems[0].search_rank, 0.0)
+
+
+@override_settings(POETRY_RESPONSE_CACHE=True)
+class ResponseCacheTests(PoetryTestCase):
+    """Cached public responses are shared between users and invalidated by writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_poem = Poem.objects.create(user=cls.author, title='Morning', content='Birds at the window')
+
+    def get(self, path, user=None):
+        response = self.api('GET', path, user=user)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def write(self, method, path, data=None, user=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.api(method, path, data, user=user or self.reader)
+
+    def assertCached(self, path, status):
+        self.assertEqual(self.get(path)['X-Cache'], status)
+
+    def test_hit_after_miss(self):
+        detail = f'/api/poems/{self.poem.slug}/'
+        self.assertEqual(self.get(detail)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(detail)['X-Cache'], 'HIT')
+
+    def test_comment_invalidates_its_poem_and_the_feed(self):
+        detail, other, feed = f'/api/poems/{self.poem.slug}/', f'/api/poems/{self.other_poem.slug}/', '/api/poems/'
+        for path in (detail, other, feed):
+            self.get(path)
+        self.write('POST', '/api/comments/', {'poem': str(self.poem.pk), 'content': 'Lovely'})
+        response = self.get(detail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([comment['content'] for comment in response.json()['comments']], ['Lovely'])
+        self.assertCached(other, 'HIT')
+        self.assertCached(feed, 'MISS')
+
+    def test_comment_like_leaves_the_feed_cached(self):
+        comment = self.comment()
+        detail, feed = f'/api/poems/{self.poem.slug}/', '/api/poems/'
+        self.get(detail)
+        self.get(feed)
+        self.write('PUT', f'/api/comments/{comment.pk}/like/')
+        self.assertEqual(self.get(detail).json()['comments'][0]['likes_count'], 1)
+        self.assertCached(feed, 'HIT')
+
+    def test_poem_edit_invalidates_its_page(self):
+        detail = f'/api/poems/{self.poem.slug}/'
+        self.get(detail)
+        self.write('PUT', detail, {'description': 'Revised'}, user=self.author)
+        self.assertEqual(self.get(detail).json()['description'], 'Revised')
+
+    def test_is_liked_is_per_user_on_hits(self):
+        self.write('PUT', f'/api/poems/{self.poem.slug}/like/')
+        self.get('/api/poems/', user=self.author)
+        response = self.get('/api/poems/', user=self.reader)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        liked = {poem['slug']: poem['is_liked'] for poem in response.json()['results']}
+        self.assertEqual(liked, {self.poem.slug: True, self.other_poem.slug: False})
+
+    @override_settings(POETRY_RESPONSE_CACHE=False)
+    def test_disabled(self):
+        self.assertNotIn('X-Cache', self.get('/api/poems/'))
+
+    def test_requires_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared('default', 'POETRY_RESPONSE_CACHE')
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(CACHES=redis):
+            require_shared('default', 'POETRY_RESPONSE_CACHE')
+
+
+class SlugTests(PoetryTestCase):
+    """Slugs take the lowest free suffix and survive a concurrent save taking theirs"""
+
+    def create(self, title, slug=''):
+        return Poem.objects.create(user=self.author, title=title, slug=slug, content='words')
+
+    def test_lowest_free_suffix(self):
+        self.create('Moon', 'moon-2')
+        self.create('Moonlight')
+        self.assertEqual([self.create('Moon').slug for _ in range(3)], ['moon', 'moon-1', 'moon-3'])
+        self.assertEqual(self.create('Night Light').slug, 'night-light-1')
+
+    def test_untitled(self):
+        self.assertEqual(self.create('???').slug, 'untitled')
+
+    def test_allocate_slugs_queries_per_batch(self):
+        poems = [Poem(user=self.author, title=f'Title {index % 5}', content='words') for index in range(10)]
+        with mock.patch('poetry.models.SLUG_QUERY_BATCH', 2), self.assertNumQueries(3):
+            Poem.allocate_slugs(poems)
+        slugs = [poem.slug for poem in poems]
+        self.assertEqual(len(set(slugs)), 10)
+        self.assertEqual(slugs[:2], ['title-0', 'title-1'])
+        self.assertEqual(slugs[5:7], ['title-0-1', 'title-1-1'])
+        Poem.objects.bulk_create(poems)
+
+    def stale_allocation(self, stale_calls):
+        """Patch allocate_slugs so its first ``stale_calls`` calls miss the poem already holding 'night-light'"""
+        allocate = Poem.allocate_slugs
+        calls = []
+
+        def allocate_slugs(poems):
+            calls.append(poems)
+            if len(calls) > stale_calls:
+                return allocate(poems)
+            for poem in poems:
+                poem.slug = self.poem.slug
+            return poems
+        return mock.patch.object(Poem, 'allocate_slugs', side_effect=allocate_slugs), calls
+
+    def test_retries_a_slug_taken_concurrently(self):
+        patch, calls = self.stale_allocation(stale_calls=1)
+        with patch:
+            poem = self.create('Night Light')
+        self.assertEqual((poem.slug, len(calls)), ('night-light-1', 2))
+
+    def test_gives_up_after_repeated_conflicts(self):
+        patch, calls = self.stale_allocation(stale_calls=SLUG_SAVE_ATTEMPTS)
+        with patch, self.assertRaises(IntegrityError):
+            self.create('Night Light')
+        self.assertEqual(len(calls), SLUG_SAVE_ATTEMPTS)
+
+
+class CommentCreationTests(PoetryTestCase):
+    """Comments are written with their path in one INSERT, singly or as whole threads"""
+
+    def assertCountersMatchReconcile(self):
+        stored = list(Comment.objects.order_by('pk').values_list('replies_count', flat=True))
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(stored, list(Comment.objects.order_by('pk').values_list('replies_count', flat=True)))
+
+    def test_path_is_part_of_the_insert(self):
+        parent = self.comment()
+        with CaptureQueriesContext(connection) as captured:
+            reply = Comment.objects.create(user=self.author, parent=parent, content='reply')
+        statements = [query['sql'] for query in captured.captured_queries]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "poetry_comment"') for sql in statements), 1)
+        self.assertFalse([sql for sql in statements if sql.startswith('UPDATE "poetry_comment"') and '"path"' in sql])
+        self.assertEqual((reply.path, reply.depth, reply.poem_id), (f'{parent.path}.{reply.id}', 1, self.poem.id))
+        self.assertEqual(Comment.objects.get(pk=reply.pk).path, reply.path)
+
+    def test_bulk_create_thread(self):
+        saved = self.comment()
+        top = Comment(id=uuid.uuid4(), user=self.reader, poem=self.poem, content='top')
+        reply = Comment(id=uuid.uuid4(), user=self.author, parent=top, content='reply')
+        nested = Comment(id=uuid.uuid4(), user=self.reader, parent=reply, content='nested')
+        under_saved = Comment(id=uuid.uuid4(), user=self.author, parent_id=saved.id, content='late reply')
+        Comment.bulk_create_thread([top, reply, nested, under_saved])
+
+        stored = Comment.objects.in_bulk([top.id, reply.id, nested.id, under_saved.id])
+        self.assertEqual(stored[nested.id].path, f'{top.id}.{reply.id}.{nested.id}')
+        self.assertEqual(stored[nested.id].depth, 2)
+        self.assertEqual(stored[under_saved.id].path, f'{saved.path}.{under_saved.id}')
+        self.assertEqual([stored[pk].replies_count for pk in (top.id, reply.id, nested.id)], [1, 1, 0])
+        saved.refresh_from_db()
+        self.poem.refresh_from_db()
+        self.assertEqual((saved.replies_count, self.poem.comments_count), (1, 5))
+        self.assertCountersMatchReconcile()
+
+    def test_bulk_create_thread_needs_parents_first(self):
+        top = Comment(id=uuid.uuid4(), user=self.reader, poem=self.poem, content='top')
+        reply = Comment(id=uuid.uuid4(), user=self.author, parent=top, content='reply')
+        with self.assertRaises(ValueError):
+            Comment.bulk_create_thread([reply, top])
+        self.assertFalse(Comment.objects.exists())
+
+
+class LikeEndpointTests(PoetryTestCase):
+    """PUT and DELETE are idempotent, POST toggles, and counters follow exactly"""
+
+    def like(self, method, path=None, user=None):
+        response = self.api(method, path or f'/api/poems/{self.poem.slug}/like/', user=user or self.reader)
+        return response.status_code, response.json()
+
+    def stored_count(self):
+        return Poem.objects.values_list('likes_count', flat=True).get(pk=self.poem.pk)
+
+    def test_put_is_idempotent(self):
+        self.assertEqual(self.like('PUT'), (201, {'status': 'liked', 'likes_count': 1}))
+        self.assertEqual(self.like('PUT'), (200, {'status': 'liked', 'likes_count': 1}))
+        self.assertEqual(Like.objects.filter(poem=self.poem).count(), 1)
+
+    def test_delete_is_idempotent(self):
+        self.like('PUT')
+        self.assertEqual(self.like('DELETE'), (200, {'status': 'unliked', 'likes_count': 0}))
+        self.assertEqual(self.like('DELETE'), (200, {'status': 'unliked', 'likes_count': 0}))
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_post_toggles(self):
+        self.like('PUT', user=self.author)
+        self.assertEqual(self.like('POST'), (201, {'status': 'liked', 'likes_count': 2}))
+        self.assertEqual(self.like('POST'), (200, {'status': 'unliked', 'likes_count': 1}))
+        self.assertEqual(self.like('POST'), (201, {'status': 'liked', 'likes_count': 2}))
+        self.assertEqual(self.stored_count(), 2)
+
+    def test_comment_like_stamps_the_thread(self):
+        comment = self.comment()
+        Poem.objects.filter(pk=self.poem.pk).update(thread_updated_at=None)
+        path = f'/api/comments/{comment.pk}/like/'
+        self.assertEqual(self.like('POST', path), (201, {'status': 'liked', 'likes_count': 1}))
+        self.assertEqual(self.like('DELETE', path), (200, {'status': 'unliked', 'likes_count': 0}))
+        self.assertIsNotNone(Poem.objects.values_list('thread_updated_at', flat=True).get(pk=self.poem.pk))
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 0)
+
+    def test_missing_target(self):
+        self.assertEqual(self.like('PUT', '/api/poems/missing/like/')[0], 404)
+        self.assertEqual(self.like('POST', f'/api/comments/{uuid.uuid4()}/like/')[0], 404)
+        self.assertFalse(Like.objects.exists())
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.api('PUT', f'/api/poems/{self.poem.slug}/like/').status_code, 401)
+
+
+class ConditionalGetTests(PoetryTestCase):
+    """Poem pages and threads answer revalidation with 304 until anything in them changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = f'/api/poems/{self.poem.slug}/'
+
+    def test_if_none_match(self):
+        etag = self.api('GET', self.path)['ETag']
+        self.assertEqual(self.api('GET', self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.api('HEAD', self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.api('GET', f'{self.path}?comments=top', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.api('GET', self.path)['Last-Modified']
+        self.assertEqual(self.api('GET', self.path, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_thread_changes_revalidate(self):
+        etag = self.api('GET', f'{self.path}comments/')['ETag']
+        self.api('PUT', f'{self.path}like/', user=self.reader)
+        self.assertEqual(self.api('GET', f'{self.path}comments/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_varies_with_credentials(self):
+        response = self.api('GET', self.path)
+        self.assertIn('Authorization', response['Vary'])
+        personal = self.api('GET', self.path, user=self.reader, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(personal.status_code, 200)
+
+    def test_writes_skip_validation(self):
+        etag = self.api('GET', self.path)['ETag']
+        with mock.patch('poetry.cache._poem_validators') as validators:
+            response = self.api('PUT', self.path, {'description': 'Revised'}, user=self.author, HTTP_IF_MATCH='"stale"')
+        validators.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotEqual(self.api('GET', self.path)['ETag'], etag)
+
+
+class SparseFieldsetTests(PoetryTestCase):
+    """?fields= and ?exclude= trim responses and the columns loaded for them"""
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.api('GET', '/api/poems/?fields=title,slug').json()
+        self.assertEqual(data['results'], [{'id': str(self.poem.id), 'title': 'Night Light', 'slug': self.poem.slug}])
+        [select] = [query['sql'] for query in captured.captured_queries if '"poetry_poem"."title"' in query['sql']]
+        self.assertNotIn('"poetry_poem"."content"', select)
+
+    def test_exclude(self):
+        poem = self.api('GET', '/api/poems/?exclude=content,is_liked').json()['results'][0]
+        self.assertNotIn('content', poem)
+        self.assertNotIn('is_liked', poem)
+        self.assertEqual(poem['username'], 'author')
+
+    def test_search_fields(self):
+        poem = self.api('GET', '/api/poems/?search=lamp&fields=search_rank').json()['results'][0]
+        self.assertEqual(set(poem), {'id', 'search_rank'})
+
+    def test_comment_fields(self):
+        self.comment()
+        comment = self.api('GET', f'/api/comments/?poem={self.poem.pk}&fields=content,username').json()['results'][0]
+        self.assertEqual(set(comment), {'id', 'content', 'username'})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.api('GET', '/api/poems/?fields=title,titel&exclude=bogus')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: bogus, titel', response.json()['fields'])
+        self.assertEqual(self.api('GET', '/api/comments/?fields=nope').status_code, 400)
+        # Search results only know their extra fields while searching
+        self.assertEqual(self.api('GET', '/api/poems/?fields=search_rank').status_code, 400)
+
+
+class CommentListTests(PoetryTestCase):
+    """comment_list pages by default and streams every match with ?export=json"""
+
+    def setUp(self):
+        super().setUp()
+        self.comments = [self.comment(minutes=minutes) for minutes in range(12)]
+        like_everything(self.reader, comments=self.comments[::3])
+
+    def export(self, query='', user=None):
+        response = self.api('GET', f'/api/comments/?export=json{query}', user=user)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_pages(self):
+        data = self.api('GET', '/api/comments/').json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual([comment['id'] for comment in data['results']], [str(c.id) for c in self.comments[:10]])
+        self.assertEqual(len(self.api('GET', data['next']).json()['results']), 2)
+
+    def test_export_streams_every_comment(self):
+        with mock.patch('poetry.views.COMMENT_EXPORT_CHUNK_SIZE', 5):
+            exported = self.export(user=self.reader)
+        self.assertEqual([comment['id'] for comment in exported], [str(c.id) for c in self.comments])
+        self.assertEqual([comment['is_liked'] for comment in exported], [index % 3 == 0 for index in range(12)])
+
+    def test_export_resolves_likes_per_chunk(self):
+        with mock.patch('poetry.views.COMMENT_EXPORT_CHUNK_SIZE', 5), CaptureQueriesContext(connection) as captured:
+            self.export(user=self.reader)
+        like_queries = [query for query in captured.captured_queries if 'FROM "poetry_like"' in query['sql']]
+        self.assertEqual(len(like_queries), 3)
+
+    def test_export_honours_filters_and_fields(self):
+        reply = self.comment(parent=self.comments[0], minutes=20)
+        exported = self.export(f'&parent={self.comments[0].id}&fields=content')
+        self.assertEqual(exported, [{'id': str(reply.id), 'content': 'at 20'}])
+        self.assertEqual(self.export('&user=0'), [])
+
+    def test_unsupported_export(self):
+        self.assertEqual(self.api('GET', '/api/comments/?export=csv').status_code, 400)
+
+
+class PoemDetailEmbeddingTests(PoetryTestCase):
+    """?comments= and ?comment_depth= control how much of the thread poem_detail embeds"""
+
+    def setUp(self):
+        super().setUp()
+        self.top = self.comment(minutes=1)
+        self.reply = self.comment(parent=self.top, minutes=2)
+        self.nested = self.comment(parent=self.reply, minutes=3)
+
+    def detail(self, query=''):
+        response = self.api('GET', f'/api/poems/{self.poem.slug}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_all(self):
+        [top] = self.detail()['comments']
+        self.assertEqual(top['replies'][0]['replies'][0]['id'], str(self.nested.id))
+        self.assertEqual(top['total_replies_count'], 2)
+
+    def test_top(self):
+        [top] = self.detail('?comments=top')['comments']
+        self.assertEqual((top['replies'], top['replies_count'], top['total_replies_count']), ([], 1, 2))
+
+    def test_none(self):
+        data = self.detail('?comments=none')
+        self.assertNotIn('comments', data)
+        self.assertEqual(data['comments_count'], 3)
+
+    def test_depth(self):
+        [top] = self.detail('?comment_depth=1')['comments']
+        [reply] = top['replies']
+        self.assertEqual((reply['replies'], reply['total_replies_count']), ([], 1))
+        self.assertEqual(top['total_replies_count'], 2)
+        self.assertEqual(self.detail('?comment_depth=0')['comments'], self.detail('?comments=top')['comments'])
+
+    def test_invalid_modes(self):
+        for query in ('?comments=some', '?comment_depth=-1', '?comment_depth=deep', '?comments=top&comment_depth=1'):
+            self.assertEqual(self.api('GET', f'/api/poems/{self.poem.slug}/{query}').status_code, 400, query)
+
+    def test_update_response_omits_the_thread(self):
+        response = self.api('PUT', f'/api/poems/{self.poem.slug}/', {'thoughts': 'Late night'}, user=self.author)
+        self.assertEqual(response.json()['thoughts'], 'Late night')
+        self.assertNotIn('comments', response.json())
+
+
+class ThreadPageTests(PoetryTestCase):
+    """Thread pages show bounded subtrees whose more_replies links continue where they stop"""
+
+    def setUp(self):
+        super().setUp()
+        self.top = self.comment(minutes=0)
+        self.replies = [self.comment(parent=self.top, minutes=minutes) for minutes in range(1, 6)]
+        self.nested = [self.comment(parent=self.replies[0], minutes=minutes) for minutes in (10, 11)]
+
+    def get(self, path):
+        response = self.api('GET', path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, comments):
+        return [comment['id'] for comment in comments]
+
+    def test_page_is_bounded(self):
+        [top] = self.get(f'/api/poems/{self.poem.slug}/comments/?cursor=&replies=2&depth=2')['results']
+        self.assertEqual(self.ids(top['replies']), [str(reply.id) for reply in self.replies[:2]])
+        first = top['replies'][0]
+        self.assertEqual(self.ids(first['replies']), [str(reply.id) for reply in self.nested])
+        self.assertIsNone(first['more_replies'])
+        self.assertEqual(top['replies'][1]['replies'], [])
+
+    def test_more_replies_continue_after_the_last_shown(self):
+        [top] = self.get(f'/api/poems/{self.poem.slug}/comments/?cursor=&replies=2&depth=1')['results']
+        self.assertEqual(top['replies'][0]['replies'], [])
+        self.assertIn('replies=2', top['replies'][0]['more_replies'])
+
+        shown = self.ids(top['replies'])
+        page = self.get(top['more_replies'])
+        self.assertEqual(shown + self.ids(page['results']), [str(reply.id) for reply in self.replies])
+        self.assertIsNone(page['next'])
+        # The continued page keeps expanding replies within the same limits
+        nested = self.get(top['replies'][0]['more_replies'])['results']
+        self.assertEqual(self.ids(nested), [str(reply.id) for reply in self.nested])
+
+    def test_no_replies_shown(self):
+        [top] = self.get(f'/api/poems/{self.poem.slug}/comments/?cursor=&replies=0')['results']
+        self.assertEqual(top['replies'], [])
+        self.assertEqual(len(self.get(top['more_replies'])['results']), 5)
+
+    def test_comment_replies_page(self):
+        page = self.get(f'/api/comments/{self.top.id}/replies/?cursor=&replies=1&depth=1&page_size=2')
+        self.assertEqual(self.ids(page['results']), [str(reply.id) for reply in self.replies[:2]])
+        self.assertEqual(self.ids(page['results'][0]['replies']), [str(self.nested[0].id)])
+        self.assertEqual(len(self.get(page['next'])['results']), 2)
+
+    def test_limits_are_validated(self):
+        for query in ('replies=51', 'depth=11', 'replies=-1', 'depth=x'):
+            response = self.api('GET', f'/api/poems/{self.poem.slug}/comments/?cursor=&{query}')
+            self.assertEqual(response.status_code, 400, query)
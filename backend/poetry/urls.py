@@ -1,10 +1,14 @@
 from django.urls import path
-from . import views
+from django.conf import settings
+from . import async_views, views
+
+# Under ASGI the public reads are served by the async views
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
     # Poem endpoints
-    path('', views.poem_list, name='poem-list'),
-    path('<str:slug>/', views.poem_detail, name='poem-detail'),
+    path('', read_views.poem_list, name='poem-list'),
+    path('<str:slug>/', read_views.poem_detail, name='poem-detail'),
     path('<str:slug>/like/', views.poem_like, name='poem-like'),
-    path('<str:slug>/comments/', views.poem_comments, name='poem-comments'),
+    path('<str:slug>/comments/', read_views.poem_comments, name='poem-comments'),
 ]
\ No newline at end of file
@@ -2,196 +2,273 @@ from rest_framework import status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
-from django.db.models import Count, Q
 from django.shortcuts import get_object_or_404
 import logging
 
+from api.pagination import FeedResultsSetPagination, StandardResultsSetPagination
+from api.streaming import chunked, streaming_json_response
+from .cache import cached_public_get, conditional_poem_get
 from .models import Poem, Comment, Like
+from .comment_tree import (
+    expand_thread_page,
+    load_poem_thread,
+    load_reply_thread,
+    thread_queryset,
+    walk_comment_tree
+)
+from .likes import like_context, set_like
+from .search import search_poems
 from .serializers import (
     PoemListSerializer, 
+    PoemSearchResultSerializer,
     PoemDetailSerializer,
     CommentSerializer,
     RecursiveCommentSerializer, 
+    ThreadPageCommentSerializer,
     LikeSerializer
 )
 
 logger = logging.getLogger(__name__)
 
+# Fields poem_list may be ordered by; each is a plain column usable as a cursor key
+POEM_ORDERING_FIELDS = ('created_at', 'updated_at', 'title', 'likes_count', 'comments_count')
+
+# Rows fetched (and serialized) per round-trip by comment_list's streaming export
+COMMENT_EXPORT_CHUNK_SIZE = 500
+
+# Thread pages: (default, maximum) replies shown per comment and levels shown below each
+THREAD_PAGE_REPLIES = (3, 50)
+THREAD_PAGE_DEPTH = (2, 10)
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
+@cached_public_get('poem')
 def poem_list(request):
     """
     List all poems or create a new poem
     """
     if request.method == 'GET':
-        # Get base queryset
-        poems = Poem.objects.all().select_related('user')
-        
-        # Add counts for likes and comments
-        poems = poems.annotate(
-                likes_count=Count('likes', distinct=True),
-                comments_count=Count('comments', distinct=True)
-        )
-        
-        # Filter by user if requested
-        user_id = request.query_params.get('user')
-        if user_id:
-            poems = poems.filter(user_id=user_id)
+        serializer_class, fields, poems, error = _poem_feed(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Handle search
-        search_query = request.query_params.get('search')
-        if search_query:
-            poems = poems.filter(
-                Q(title__icontains=search_query) | 
-                Q(content__icontains=search_query) | 
-                Q(description__icontains=search_query)
-            )
+        # Pagination by page number, or by keyset cursor when ?cursor= is given
+        paginator = FeedResultsSetPagination()
+        poems_page = paginator.paginate_queryset(poems, request)
         
-        # Handle ordering
-        ordering = request.query_params.get('ordering', '-created_at')
-        poems = poems.order_by(ordering)
-        
-        # Pagination (basic implementation)
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 20))
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        poems_page = poems[start:end]
-        
-        serializer = PoemListSerializer(poems_page, many=True, context={'request': request})
-        return Response({
-            'count': poems.count(),
-            'results': serializer.data
-        })
+        context = like_context(request, poems=poems_page) if 'is_liked' in fields else {'request': request}
+        serializer = serializer_class(poems_page, many=True, context={**context, 'fields': fields})
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         serializer = PoemListSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
-            logger.info(f"Poem created: '{serializer.instance.title}' by {request.user.username}")
+            logger.info("Poem created: '%s' by %s", serializer.instance.title, request.user.username)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _poem_feed(request):
+    """
+    Build poem_list's GET queryset from the query parameters.
+    
+    Returns ``(serializer_class, fields, poems, error)``.
+    """
+    # Honour ?fields= / ?exclude= (resolved against the serializer used below)
+    search_query = request.query_params.get('search')
+    serializer_class = PoemSearchResultSerializer if search_query else PoemListSerializer
+    fields = serializer_class.requested_fields(request)
+    
+    # Get base queryset; like and comment counts are stored columns
+    poems = Poem.objects.all().select_related('user')
+    
+    # Filter by user if requested
+    user_id = request.query_params.get('user')
+    if user_id:
+        poems = poems.filter(user_id=user_id)
+    
+    # Handle search through the full-text index, ranked by relevance by default
+    if search_query:
+        poems = search_poems(poems, search_query)
+    
+    # Handle ordering
+    ordering = request.query_params.get('ordering', '-search_rank' if search_query else '-created_at')
+    allowed = POEM_ORDERING_FIELDS + (('search_rank',) if search_query else ())
+    if ordering.lstrip('-') not in allowed:
+        return serializer_class, fields, None, f"Unsupported ordering: {ordering}"
+    # Break ties on the primary key, matching the keyset the cursor mode seeks on
+    poems = poems.order_by(ordering, '-pk' if ordering.startswith('-') else 'pk')
+    
+    # Only load the columns the requested fields (and the cursor key) read
+    poems = serializer_class.sparse_queryset(poems, fields, extra=[ordering.lstrip('-')])
+    return serializer_class, fields, poems, None
+
+
+@conditional_poem_get
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticatedOrReadOnly])
+@cached_public_get('comment', slug_kwarg='slug')
 def poem_detail(request, slug):
     """
-    Retrieve, update or delete a poem
+    Retrieve (embedding the thread per ?comments= / ?comment_depth=), update or delete a poem
     """
+    if request.method == 'GET':
+        embedding, error = _comment_embedding(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One fetch: counts are stored columns and the search vector is never needed here
     try:
-        poem = Poem.objects.select_related('user').get(slug=slug)
-        
-        # Add counts for likes and comments
-        poem.likes_count = Like.objects.filter(poem=poem).count()
-        poem.comments_count = Comment.objects.filter(poem=poem).count()
-        
+        poem = Poem.objects.select_related('user').defer('search_vector').get(slug=slug)
     except Poem.DoesNotExist:
         return Response({'error': 'Poem not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        serializer = PoemDetailSerializer(poem)
+        serializer = PoemDetailSerializer(poem, context={'request': request, **embedding})
         return Response(serializer.data)
     
     # Check if user is the author for PUT and DELETE
-    if request.user != poem.user and not request.user.is_staff:
+    if poem.user_id != request.user.pk and not request.user.is_staff:
         return Response({'error': 'You do not have permission to modify this poem'}, 
                         status=status.HTTP_403_FORBIDDEN)
     
     if request.method == 'PUT':
-        serializer = PoemDetailSerializer(poem, data=request.data, partial=True)
+        # Echo the edit without re-serializing the comment thread
+        serializer = PoemDetailSerializer(poem, data=request.data, partial=True, context={'comments': 'none'})
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"Poem updated: '{poem.title}' by {request.user.username}")
+            logger.info("Poem updated: '%s' by %s", poem.title, request.user.username)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'DELETE':
+        poem_id = poem.pk
         poem.delete()
-        logger.info(f"Poem deleted: '{poem.title}' by {request.user.username}")
+        logger.info("Poem deleted: ID %s by %s", poem_id, request.user.username)
         return Response({'message': 'Poem deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
-@api_view(['POST'])
+def _comment_embedding(request):
+    """
+    Read how much of the thread poem_detail should embed.
+    
+    ``?comments=all|top|none`` (default all) and, with all, an optional
+    ``?comment_depth=N`` limiting replies to N levels below the top-level
+    comments. Returns ``(context, error)``.
+    """
+    comments = request.query_params.get('comments', 'all')
+    if comments not in ('all', 'top', 'none'):
+        return None, f"Unsupported comments mode: {comments}"
+    
+    depth = request.query_params.get('comment_depth')
+    if depth is None:
+        return {'comments': comments}, None
+    if comments != 'all':
+        return None, f"comment_depth cannot be combined with comments={comments}"
+    try:
+        depth = int(depth)
+    except ValueError:
+        depth = -1
+    if depth < 0:
+        return None, "comment_depth must be a non-negative integer"
+    return {'comments': comments, 'comment_depth': depth}, None
+
+
+def _like_response(request, target_model, lookup, value):
+    """
+    Apply a like request: PUT likes, DELETE unlikes and POST toggles.
+    
+    PUT and DELETE are idempotent. Every response carries the new like count.
+    """
+    liked = {'PUT': True, 'DELETE': False}.get(request.method)
+    result = set_like(request.user, target_model, lookup, value, liked=liked)
+    
+    if result is None:
+        return Response({'error': f"{target_model.__name__} not found"}, status=status.HTTP_404_NOT_FOUND)
+    
+    liked, changed, likes_count = result
+    return Response(
+        {'status': 'liked' if liked else 'unliked', 'likes_count': likes_count},
+        status=status.HTTP_201_CREATED if liked and changed else status.HTTP_200_OK
+    )
+
+
+@api_view(['POST', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def poem_like(request, slug):
     """
-    Like or unlike a poem
+    Like (PUT), unlike (DELETE) or toggle the like (POST) on a poem
     """
-    poem = get_object_or_404(Poem, slug=slug)
-    user = request.user
-    
-    # Check if the user has already liked this poem
-    like = Like.objects.filter(
-        user=user,
-        poem=poem,
-        content_type='poem'
-    ).first()
-    
-    if like:
-        # Unlike
-        like.delete()
-        logger.info(f"User {user.username} unliked poem: {poem.title}")
-        return Response({"status": "unliked"}, status=status.HTTP_200_OK)
-    else:
-        # Like
-        like = Like(user=user, poem=poem, content_type='poem')
-        like.save()
-        logger.info(f"User {user.username} liked poem: {poem.title}")
-        return Response({"status": "liked"}, status=status.HTTP_201_CREATED)
+    return _like_response(request, Poem, 'slug', slug)
 
 
+@conditional_poem_get
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_public_get('comment', slug_kwarg='slug')
 def poem_comments(request, slug):
     """
-    Get all comments for a poem
+    Get all comments for a poem, or one bounded page of the thread with ?cursor=
     """
     poem = get_object_or_404(Poem, slug=slug)
     
-    # Get only top-level comments
-    top_comments = Comment.objects.filter(
-        poem=poem, 
-        parent=None
-    ).select_related('user').prefetch_related('replies')
-    
-    # Count all descendants for each comment
-    for comment in top_comments:
-        # Use exclude instead of ne (which doesn't exist in Django)
-        # This gets all comments with path starting with this comment's path
-        # but excludes the comment itself
-        descendants = Comment.objects.filter(
-            path__startswith=comment.path
-        ).exclude(id=comment.id).count()
-        
-        # Add the count as an attribute
-        comment.total_replies_count = descendants
+    # ?cursor= switches to bounded thread pages
+    if request.query_params.get('cursor') is not None:
+        return _thread_page_response(request, thread_queryset().filter(poem=poem, depth=0))
     
-    # Annotate with like counts
-    top_comments = top_comments.annotate(
-        likes_count=Count('likes', distinct=True),
-        replies_count=Count('replies', distinct=True)
-    )
+    # Load the whole thread in one query; counts are computed while nesting
+    top_comments = load_poem_thread(poem)
+    context = like_context(request, comments=walk_comment_tree(top_comments))
     
-    serializer = RecursiveCommentSerializer(top_comments, many=True, context={'request': request})
+    serializer = RecursiveCommentSerializer(top_comments, many=True, context=context)
     return Response(serializer.data)
 
 
+def _thread_page_limits(request):
+    """Read ?replies= and ?depth= for a thread page. Returns ``(limits, error)``"""
+    limits = {}
+    for param, (default, maximum) in (('replies', THREAD_PAGE_REPLIES), ('depth', THREAD_PAGE_DEPTH)):
+        try:
+            value = int(request.query_params.get(param, default))
+        except ValueError:
+            value = -1
+        if not 0 <= value <= maximum:
+            return None, f"{param} must be an integer between 0 and {maximum}"
+        limits[param] = value
+    return limits, None
+
+
+def _thread_page_response(request, roots):
+    """
+    Respond with one cursor page of ``roots``, each expanded to a bounded subtree.
+    
+    Every comment shows at most ?replies= replies and ?depth= levels below
+    the roots; truncated comments link to their next page of replies.
+    """
+    limits, error = _thread_page_limits(request)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    paginator = StandardResultsSetPagination()
+    roots = paginator.paginate_queryset(roots.order_by('created_at', 'pk'), request)
+    expand_thread_page(roots, max_replies=limits['replies'], max_depth=limits['depth'])
+    
+    context = {**like_context(request, comments=walk_comment_tree(roots)), 'thread_page': limits}
+    serializer = ThreadPageCommentSerializer(roots, many=True, context=context)
+    return paginator.get_paginated_response(serializer.data)
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def comment_list(request):
     """
-    List all comments or create a new comment
+    List comments (paginated, or streamed in full with ?export=json) or create a new comment
     """
     if request.method == 'GET':
-        comments = Comment.objects.all().select_related('user', 'poem', 'parent')
-        
-        # Add counts for likes and replies
-        comments = comments.annotate(
-            likes_count=Count('likes', distinct=True),
-            replies_count=Count('replies', distinct=True)
-        )
+        # Honour ?fields= / ?exclude=; poem and parent render as ids, so only user is joined
+        fields = CommentSerializer.requested_fields(request)
+        comments = CommentSerializer.sparse_queryset(Comment.objects.all(), fields, extra=['created_at'])
         
         # Filter by poem if requested
         poem_id = request.query_params.get('poem')
@@ -208,8 +285,20 @@ def comment_list(request):
         if user_id:
             comments = comments.filter(user_id=user_id)
         
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        comments = comments.order_by('created_at', 'pk')
+        
+        # ?export=json streams every matching comment instead of one page
+        export = request.query_params.get('export')
+        if export is not None:
+            if export != 'json':
+                return Response({'error': f"Unsupported export format: {export}"}, status=status.HTTP_400_BAD_REQUEST)
+            return streaming_json_response(_comment_export_batches(request, comments, fields))
+        
+        paginator = StandardResultsSetPagination()
+        comments = paginator.paginate_queryset(comments, request)
+        context = like_context(request, comments=comments) if 'is_liked' in fields else {'request': request}
+        serializer = CommentSerializer(comments, many=True, context={**context, 'fields': fields})
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         serializer = CommentSerializer(data=request.data)
@@ -217,15 +306,28 @@ def comment_list(request):
             serializer.save(user=request.user)
             
             # Log appropriate message based on whether it's a comment or reply
-            if serializer.instance.parent:
-                logger.info(f"Reply created by {request.user.username} on comment {serializer.instance.parent.id}")
+            if serializer.instance.parent_id:
+                logger.info("Reply created by %s on comment %s", request.user.username, serializer.instance.parent_id)
             else:
-                logger.info(f"Comment created by {request.user.username} on poem '{serializer.instance.poem.title}'")
+                logger.info("Comment created by %s on poem %s", request.user.username, serializer.instance.poem_id)
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _comment_export_batches(request, comments, fields):
+    """
+    Serialize comments chunk by chunk for a streaming export.
+    
+    Rows come from a server-side cursor and likes are resolved per chunk, so
+    memory stays flat however many comments match.
+    """
+    rows = comments.iterator(chunk_size=COMMENT_EXPORT_CHUNK_SIZE)
+    for chunk in chunked(rows, COMMENT_EXPORT_CHUNK_SIZE):
+        context = like_context(request, comments=chunk) if 'is_liked' in fields else {'request': request}
+        yield CommentSerializer(chunk, many=True, context={**context, 'fields': fields}).data
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def comment_detail(request, pk):
@@ -234,11 +336,6 @@ def comment_detail(request, pk):
     """
     try:
         comment = Comment.objects.select_related('user', 'poem', 'parent').get(pk=pk)
-        
-        # Add counts for likes and replies
-        comment.likes_count = Like.objects.filter(comment=comment).count()
-        comment.replies_count = Comment.objects.filter(parent=comment).count()
-        
     except Comment.DoesNotExist:
         return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -247,7 +344,7 @@ def comment_detail(request, pk):
         return Response(serializer.data)
     
     # Check if user is the author for PUT and DELETE
-    if request.user != comment.user and not request.user.is_staff:
+    if comment.user_id != request.user.pk and not request.user.is_staff:
         return Response({'error': 'You do not have permission to modify this comment'}, 
                         status=status.HTTP_403_FORBIDDEN)
     
@@ -255,63 +352,41 @@ def comment_detail(request, pk):
         serializer = CommentSerializer(comment, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"Comment updated by {request.user.username}")
+            logger.info("Comment updated by %s", request.user.username)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'DELETE':
         comment.delete()
-        logger.info(f"Comment deleted by {request.user.username}")
+        logger.info("Comment deleted by %s", request.user.username)
         return Response({'message': 'Comment deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
-@api_view(['POST'])
+@api_view(['POST', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def comment_like(request, pk):
     """
-    Like or unlike a comment
+    Like (PUT), unlike (DELETE) or toggle the like (POST) on a comment
     """
-    comment = get_object_or_404(Comment, pk=pk)
-    user = request.user
-    
-    # Check if the user has already liked this comment
-    like = Like.objects.filter(
-        user=user,
-        comment=comment,
-        content_type='comment'
-    ).first()
-    
-    if like:
-        # Unlike
-        like.delete()
-        logger.info(f"User {user.username} unliked comment {comment.id}")
-        return Response({"status": "unliked"}, status=status.HTTP_200_OK)
-    else:
-        # Like
-        like = Like(user=user, comment=comment, content_type='comment')
-        like.save()
-        logger.info(f"User {user.username} liked comment {comment.id}")
-        return Response({"status": "liked"}, status=status.HTTP_201_CREATED)
+    return _like_response(request, Comment, 'id', pk)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def comment_replies(request, pk):
     """
-    Get all replies for a specific comment
+    Get all replies for a specific comment, or one bounded page of them with ?cursor=
     """
     comment = get_object_or_404(Comment, pk=pk)
     
-    # Get direct replies only
-    replies = Comment.objects.filter(
-        parent=comment
-    ).select_related('user').prefetch_related('replies')
+    # ?cursor= switches to bounded thread pages of the direct replies
+    if request.query_params.get('cursor') is not None:
+        replies = thread_queryset().filter(parent_id=comment.pk)
+        return _thread_page_response(request, replies)
     
-    # Annotate with counts
-    replies = replies.annotate(
-        likes_count=Count('likes', distinct=True),
-        replies_count=Count('replies', distinct=True)
-    )
+    # Load the whole subtree by path prefix; direct replies are the roots
+    replies = load_reply_thread(comment)
+    context = like_context(request, comments=walk_comment_tree(replies))
     
-    serializer = RecursiveCommentSerializer(replies, many=True, context={'request': request})
+    serializer = RecursiveCommentSerializer(replies, many=True, context=context)
     return Response(serializer.data)
\ No newline at end of file
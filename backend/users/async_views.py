@@ -0,0 +1,36 @@
+"""
+Async versions of the public user read endpoints, for ASGI deployments.
+
+See ``poetry.async_views``; other methods are served by ``views``.
+"""
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.response import Response
+import logging
+
+from api.async_support import async_read_view
+from . import views
+from .serializers import UserSerializer
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+@async_read_view(views.user_detail_public)
+async def user_detail_public(request, pk):
+    fields = UserSerializer.requested_fields(request)
+    try:
+        user = await UserSerializer.sparse_queryset(User.objects.select_related('profile'), fields).aget(pk=pk)
+    except User.DoesNotExist:
+        logger.warning("User not found: ID %s", pk)
+        return Response(
+            {'errors': {'user': 'User not found'}},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    logger.info("User detail requested: %s", user.username)
+
+    # Serializing cannot query here, so stats are resolved up front
+    stats = None
+    if 'stats' in fields:
+        stats = (await UserSerializer.aget_bulk_user_stats([user.pk]))[user.pk]
+    return Response(UserSerializer.serialize(user, stats=stats, fields=fields), status=status.HTTP_200_OK)
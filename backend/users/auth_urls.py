@@ -5,4 +5,5 @@ from . import views
 urlpatterns = [
     path('token/', views.token_obtain_pair, name='token_obtain_pair'),
     path('token/refresh/', views.token_refresh, name='token_refresh'),
+    path('logout/', views.logout, name='logout'),
 ]
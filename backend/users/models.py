@@ -21,14 +21,14 @@ class User(AbstractUser):
         try:
             super().save(*args, **kwargs)
             if is_new:
-                logger.info(f"User created: {self.username} (ID: {self.pk})")
+                logger.info("User created: %s (ID: %s)", self.username, self.pk)
                 # Create profile for new users
                 if not hasattr(self, 'profile'):
                     Profile.objects.create(user=self)
             else:
-                logger.info(f"User updated: {self.username} (ID: {self.pk})")
+                logger.info("User updated: %s (ID: %s)", self.username, self.pk)
         except Exception as e:
-            logger.error(f"Error saving user {self.username}: {str(e)}")
+            logger.error("Error saving user %s: %s", self.username, e)
             raise
 
 class Profile(models.Model):
@@ -53,11 +53,11 @@ class Profile(models.Model):
         try:
             super().save(*args, **kwargs)
             if is_new:
-                logger.info(f"Profile created for user: {self.user.username} (ID: {self.user.pk})")
+                logger.info("Profile created for user ID %s", self.user_id)
             else:
-                logger.info(f"Profile updated for user: {self.user.username} (ID: {self.user.pk})")
+                logger.info("Profile updated for user ID %s", self.user_id)
         except Exception as e:
-            logger.error(f"Error saving profile for {self.user.username}: {str(e)}")
+            logger.error("Error saving profile for user ID %s: %s", self.user_id, e)
             raise
         
 # from users.models import Profile
@@ -2,10 +2,11 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db.models import Count, Sum
 from .models import Profile
 import logging
-import traceback
 from django.apps import apps
+from api.fieldsets import requested_fields, sparse_queryset
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -22,8 +23,43 @@ class ProfileSerializer:
         }
 
 class UserSerializer:
+    # Keys of a serialized user, selectable with ?fields= / ?exclude=
+    FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'profile', 'is_active', 'stats']
+    
+    # Columns each key reads; stats come from a separate aggregate
+    FIELD_COLUMNS = {
+        'id': ['id'],
+        'username': ['username'],
+        'email': ['email'],
+        'first_name': ['first_name'],
+        'last_name': ['last_name'],
+        'profile': ['profile__id', 'profile__avatar_url', 'profile__bio', 'profile__create_at', 'profile__updated_at'],
+        'is_active': ['is_active'],
+        'stats': [],
+    }
+    
+    @staticmethod
+    def requested_fields(request):
+        """Resolve ?fields= / ?exclude= against the user keys"""
+        return requested_fields(request, UserSerializer.FIELDS)
+    
+    @staticmethod
+    def sparse_queryset(queryset, fields):
+        """Load only the user (and profile) columns the given keys read"""
+        # The username is always loaded since views log it
+        return sparse_queryset(queryset, ['username'] + [
+            column for name in fields for column in UserSerializer.FIELD_COLUMNS[name]
+        ])
+    
     @staticmethod
-    def serialize(instance=None, data=None):
+    def serialize(instance=None, data=None, include_stats=True, stats=None, fields=None):
+        """
+        Serialize a user, optionally applying updates first.
+        
+        Pass ``stats`` when they were already computed (see serialize_many)
+        to skip the per-user stats query, and ``fields`` to render only those
+        keys (unrequested profile and stats are never loaded).
+        """
         if instance is None:
             instance = User()
         
@@ -45,30 +81,44 @@ class UserSerializer:
         if updated and instance.pk:
             try:
                 instance.save()
-                logger.info(f"User updated: {instance.username}")
+                logger.info("User updated: %s", instance.username)
             except Exception as e:
-                logger.error(f"Failed to update user {instance.username}: {str(e)}")
+                logger.error("Failed to update user %s: %s", instance.username, e)
                 return {'errors': {'user': str(e)}}
         
+        if fields is None:
+            fields = UserSerializer.FIELDS
+        
         # Handle cases where profile might not exist yet
         profile_data = None
-        if hasattr(instance, 'profile') and instance.profile:
+        if 'profile' in fields and hasattr(instance, 'profile') and instance.profile:
             profile_data = ProfileSerializer.serialize(instance.profile)
         
-        result = {
-            'id': instance.id if instance.pk else None,
-            'username': instance.username,
-            'email': instance.email,
-            'first_name': instance.first_name,
-            'last_name': instance.last_name,
-            'profile': profile_data,
-            'is_active': instance.is_active,
+        # Read attributes lazily so deferred columns of unrequested keys stay unloaded
+        values = {
+            'id': lambda: instance.id if instance.pk else None,
+            'username': lambda: instance.username,
+            'email': lambda: instance.email,
+            'first_name': lambda: instance.first_name,
+            'last_name': lambda: instance.last_name,
+            'profile': lambda: profile_data,
+            'is_active': lambda: instance.is_active,
         }
+        result = {name: value() for name, value in values.items() if name in fields}
         
-        # Always include stats
-        result['stats'] = UserSerializer.get_user_stats(instance)
+        if include_stats and 'stats' in fields:
+            result['stats'] = stats if stats is not None else UserSerializer.get_user_stats(instance)
         
         return result
+    
+    @staticmethod
+    def serialize_many(users, fields=None):
+        """Serialize a page of users, computing all their stats in one grouped query"""
+        users = list(users)
+        if fields is not None and 'stats' not in fields:
+            return [UserSerializer.serialize(user, include_stats=False, fields=fields) for user in users]
+        stats = UserSerializer.get_bulk_user_stats([user.pk for user in users])
+        return [UserSerializer.serialize(user, stats=stats[user.pk], fields=fields) for user in users]
 
     
     @staticmethod
@@ -116,10 +166,10 @@ class UserSerializer:
             
             # Profile will be created automatically through the User.save() method
             
-            logger.info(f"User created: {user.username} (ID: {user.id})")
+            logger.info("User created: %s (ID: %s)", user.username, user.id)
             return UserSerializer.serialize(user)
         except Exception as e:
-            logger.error(f"Error creating user: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error creating user: %s", e)
             raise
     
     @staticmethod
@@ -148,10 +198,10 @@ class UserSerializer:
                 
                 profile.save()
             
-            logger.info(f"User updated: {instance.username} (ID: {instance.id})")
+            logger.info("User updated: %s (ID: %s)", instance.username, instance.id)
             return UserSerializer.serialize(instance)
         except Exception as e:
-            logger.error(f"Error updating user {instance.username}: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error updating user %s: %s", instance.username, e)
             raise
     
     @staticmethod
@@ -190,32 +240,51 @@ class UserSerializer:
             user.set_password(new_password)
             user.save()
             
-            logger.info(f"Password changed for user: {user.username} (ID: {user.id})")
+            logger.info("Password changed for user: %s (ID: %s)", user.username, user.id)
             return {'message': 'Password changed successfully'}
         except Exception as e:
-            logger.error(f"Error changing password for {user.username}: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error changing password for %s: %s", user.username, e)
             raise
     
     @staticmethod
     def get_user_stats(user):
         """Get poetry stats for a user"""
+        return UserSerializer.get_bulk_user_stats([user.pk])[user.pk]
+    
+    @staticmethod
+    def get_bulk_user_stats(user_ids):
+        """Get poetry stats for many users with a single grouped aggregate"""
+        if not user_ids:
+            return UserSerializer._collect_stats(user_ids, [])
+        return UserSerializer._collect_stats(user_ids, UserSerializer._stats_rows(user_ids))
+    
+    @staticmethod
+    async def aget_bulk_user_stats(user_ids):
+        """``get_bulk_user_stats`` through the async ORM"""
+        if not user_ids:
+            return UserSerializer._collect_stats(user_ids, [])
+        return UserSerializer._collect_stats(user_ids, [row async for row in UserSerializer._stats_rows(user_ids)])
+    
+    @staticmethod
+    def _stats_rows(user_ids):
         # Dynamically import models from the other app
-        Poem = apps.get_model('poetry', 'Poem')  # Replace 'poetry_app' with the actual app name
-        Like = apps.get_model('poetry', 'Like')  # Replace 'poetry_app' with the actual app name
-        
-        # Count poems by this user
-        poem_count = Poem.objects.filter(user=user).count()
+        Poem = apps.get_model('poetry', 'Poem')
         
-        # Count total likes on all poems by this user
-        total_likes = Like.objects.filter(
-            content_type='poem',
-            poem__user=user
-        ).count()
-        
-        return {
-            'poem_count': poem_count,
-            'total_likes': total_likes
-        }
+        # Total likes is the sum of the stored like counters on the user's poems
+        return Poem.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+            poem_count=Count('id'),
+            total_likes=Sum('likes_count')
+        )
+    
+    @staticmethod
+    def _collect_stats(user_ids, rows):
+        stats = {pk: {'poem_count': 0, 'total_likes': 0} for pk in user_ids}
+        for row in rows:
+            stats[row['user_id']] = {
+                'poem_count': row['poem_count'],
+                'total_likes': row['total_likes'] or 0
+            }
+        return stats
 class UserProfileSerializer(serializers.Serializer):
     """Serializer for updating user and profile data together"""
     first_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
@@ -1,3 +1,226 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
 
-# Create your tests here.
+from api.authentication import ClaimsRefreshToken, user_states
+from api.models import RotatedRefreshToken
+from api.testing import SEED_PASSWORD, QueryBudgetTestCase, call_async_view, grow_thread, like_everything
+from poetry.models import Poem
+from utilities.aws_s3 import get_s3_client
+from . import async_views
+from .models import Profile
+
+User = get_user_model()
+
+
+class UserQueryBudgetTestCase(QueryBudgetTestCase):
+    """
+    Seeded users, one of whom is followed through growth: every growth step
+    gives them more poems, comments and likes, so their stats really grow.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.select_related('profile').order_by('pk').first()
+        cls.admin = User.objects.create_user('budget_admin', password=SEED_PASSWORD, is_staff=True)
+
+    def grow(self):
+        super().grow()
+        poems = [Poem(user=self.user, title=f"Grown {index}", content='grown') for index in range(3)]
+        Poem.allocate_slugs(poems)
+        poems = Poem.objects.bulk_create(poems)
+        grow_thread(poems[0], [self.user], comments=5, rng=self.rng)
+        like_everything(self.user, poems=Poem.objects.exclude(user=self.user))
+
+
+class UserQueryBudgetTests(UserQueryBudgetTestCase):
+
+    def test_user_list(self):
+        self.assertQueryBudget(3, 'GET', '/api/users/users/')
+
+    def test_user_list_sparse_fields(self):
+        self.assertQueryBudget(2, 'GET', '/api/users/users/?fields=username')
+
+    def test_user_detail(self):
+        self.assertQueryBudget(2, 'GET', f'/api/users/users/{self.user.pk}/', user=self.admin)
+
+    def test_user_update(self):
+        self.assertQueryBudget(3, 'PUT', f'/api/users/users/{self.user.pk}/', {'first_name': 'Ada'}, user=self.admin)
+
+    def test_user_detail_public(self):
+        self.assertQueryBudget(2, 'GET', f'/api/users/users/public/{self.user.pk}/')
+
+    def test_current_user(self):
+        self.assertQueryBudget(2, 'GET', '/api/users/users/me/', user=self.user)
+
+    def test_user_stats(self):
+        self.assertQueryBudget(1, 'GET', '/api/users/users/me/stats/', user=self.user)
+
+    def test_update_user_profile(self):
+        self.assertQueryBudget(4, 'PUT', '/api/users/users/me/profile/', {'bio': 'Poet'}, user=self.user)
+
+    def test_update_avatar(self):
+        data = {'avatar_url': 'https://example.com/a.png'}
+        self.assertQueryBudget(3, 'PUT', '/api/users/users/me/avatar/', data, user=self.user)
+
+
+class AvatarUpdateTests(TestCase):
+
+    def setUp(self):
+        user_states.clear()
+        self.user = User.objects.create_user('painter', email='painter@example.com', password=SEED_PASSWORD)
+        Poem.objects.create(user=self.user, title='Still Life', content='apples', likes_count=2)
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {ClaimsRefreshToken.for_user(self.user).access_token}"}
+
+    def update(self, avatar_url):
+        return self.client.put(
+            '/api/users/users/me/avatar/', json.dumps({'avatar_url': avatar_url}), content_type='application/json',
+            **self.headers
+        )
+
+    def test_updates_the_avatar(self):
+        data = self.update('https://example.com/a.png').json()
+        self.assertEqual(data['profile']['avatar_url'], 'https://example.com/a.png')
+        self.assertEqual(data['stats'], {'poem_count': 1, 'total_likes': 2})
+        self.assertEqual(data['email'], 'painter@example.com')
+
+    def test_creates_a_missing_profile(self):
+        Profile.objects.filter(user=self.user).delete()
+        data = self.update('https://example.com/b.png').json()
+        self.assertEqual(data['profile']['avatar_url'], 'https://example.com/b.png')
+        self.assertEqual(Profile.objects.get(user=self.user).avatar_url, 'https://example.com/b.png')
+
+    def test_requires_a_url(self):
+        self.assertEqual(self.update('').status_code, 400)
+
+
+class AuthQueryBudgetTests(UserQueryBudgetTestCase):
+
+    def test_token_obtain_pair(self):
+        data = {'username': self.user.username, 'password': SEED_PASSWORD}
+        self.assertQueryBudget(3, 'POST', '/api/auth/token/', data)
+
+    def test_token_refresh(self):
+        data = {'refresh': str(RefreshToken.for_user(self.user))}
+        # Claiming the token for rotation is one INSERT; forget the claim so every run may refresh
+        self.assertQueryBudget(
+            1, 'POST', '/api/auth/token/refresh/', data, prepare=RotatedRefreshToken.objects.all().delete
+        )
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('revoked', password=SEED_PASSWORD)
+        self.tokens = self.post('/api/auth/token/', {'username': 'revoked', 'password': SEED_PASSWORD}).json()
+
+    def post(self, path, data, access=None):
+        headers = {'HTTP_AUTHORIZATION': f"Bearer {access}"} if access else {}
+        return self.client.post(path, json.dumps(data), content_type='application/json', **headers)
+
+    def me(self, access):
+        return self.client.get('/api/users/users/me/', HTTP_AUTHORIZATION=f"Bearer {access}").status_code
+
+    def refresh(self, refresh):
+        return self.post('/api/auth/token/refresh/', {'refresh': refresh})
+
+    def test_refresh_rotates_the_refresh_token(self):
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        rotated = response.json()
+        self.assertNotEqual(rotated['refresh'], self.tokens['refresh'])
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 200)
+        self.assertEqual(self.me(rotated['access']), 200)
+
+    def test_logout_revokes_the_whole_session(self):
+        rotated = self.refresh(self.tokens['refresh']).json()
+        other = self.post('/api/auth/token/', {'username': 'revoked', 'password': SEED_PASSWORD}).json()
+        response = self.post('/api/auth/logout/', {'refresh': rotated['refresh']}, access=rotated['access'])
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.me(self.tokens['access']), 401)
+        self.assertEqual(self.me(rotated['access']), 401)
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 401)
+        # Other logins of the same user stay signed in
+        self.assertEqual(self.me(other['access']), 200)
+
+    def test_password_change_revokes_earlier_tokens(self):
+        data = {'current_password': SEED_PASSWORD, 'new_password': 'An0ther-Passphrase', 'confirm_password': 'An0ther-Passphrase'}
+        response = self.post('/api/users/users/me/password/', data, access=self.tokens['access'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me(self.tokens['access']), 401)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+        self.assertEqual(self.me(response.json()['access']), 200)
+
+
+@override_settings(
+    AWS_S3_ENDPOINT_URL='http://127.0.0.1:9000', AWS_ACCESS_KEY='stand-in', AWS_SECRET_ACCESS_KEY='stand-in',
+    AWS_STORAGE_BUCKET_NAME='uploads', AWS_S3_PRESIGNED_EXPIRY=120, AWS_S3_MAX_UPLOAD_URLS=3,
+)
+class ImageUploadUrlTests(TestCase):
+    # Presigning happens locally, so the stand-in endpoint need not be running
+
+    def setUp(self):
+        user = User.objects.create_user('uploader', password=SEED_PASSWORD)
+        self.headers = {'HTTP_AUTHORIZATION': f"Bearer {ClaimsRefreshToken.for_user(user).access_token}"}
+
+    def batch(self, data):
+        return self.client.post('/api/users/users/image-urls/', json.dumps(data), content_type='application/json', **self.headers)
+
+    def test_client_is_shared_across_threads(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_s3_client())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        with self.settings(AWS_S3_REGION_NAME='us-east-1'):
+            self.assertIsNot(get_s3_client(), clients[0])
+
+    def test_single_url_uses_settings(self):
+        response = self.client.get('/api/users/users/image-url/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        upload = urlsplit(response.json()['uploadURL'])
+        self.assertEqual((upload.netloc, upload.path.split('/')[1]), ('127.0.0.1:9000', 'uploads'))
+        self.assertEqual(parse_qs(upload.query)['X-Amz-Expires'], ['120'])
+        self.assertTrue(response.json()['objectURL'].startswith('http://127.0.0.1:9000/uploads/'))
+
+    def test_batch_of_put_urls(self):
+        response = self.batch({'content_types': ['image/jpeg', 'image/png']})
+        self.assertEqual(response.status_code, 200)
+        uploads = response.json()['uploads']
+        self.assertEqual(len(uploads), 2)
+        self.assertEqual(len({upload['objectURL'] for upload in uploads}), 2)
+
+    def test_batch_of_post_forms(self):
+        response = self.batch({'content_types': ['image/png'], 'method': 'post'})
+        self.assertEqual(response.status_code, 200)
+        upload, = response.json()['uploads']
+        self.assertEqual(upload['uploadURL'], 'http://127.0.0.1:9000/uploads')
+        self.assertEqual(upload['fields']['Content-Type'], 'image/png')
+        self.assertIn('policy', upload['fields'])
+
+    def test_batch_is_validated(self):
+        for data in (
+            {}, {'content_types': ['image/jpeg'] * 4}, {'content_types': ['text/html']},
+            {'content_types': ['image/jpeg'], 'method': 'get'},
+        ):
+            self.assertEqual(self.batch(data).status_code, 400, data)
+
+
+class AsyncReadViewTests(UserQueryBudgetTestCase):
+
+    def test_user_detail_public_matches_sync(self):
+        for path in (f'/api/users/users/public/{self.user.pk}/', '/api/users/users/public/0/'):
+            for query in ('', '?fields=username,stats', '?exclude=profile'):
+                expected = self.client.get(path + query)
+                response = call_async_view(async_views.user_detail_public, path + query)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), expected.json())
@@ -3,11 +3,14 @@ from rest_framework.response import Response
 from rest_framework import status
 from .serializers import ProfileSerializer, UserSerializer, UserProfileSerializer
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from api.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken
+from api.revocation import claim_refresh, is_revoked, revoke_session, revoke_user, session_id
+from api.pagination import StandardResultsSetPagination
 from django.contrib.auth import authenticate, get_user_model
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 import logging
-import traceback
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -30,21 +33,21 @@ def token_obtain_pair(request):
     try:
         user = authenticate(username=username, password=password)
         if user is None:
-            logger.warning(f"Login failed: Invalid credentials for username: {username}")
+            logger.warning("Login failed: Invalid credentials for username: %s", username)
             return Response(
                 {"errors": {"credentials": "Invalid username or password"}}, 
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        refresh = RefreshToken.for_user(user)
-        logger.info(f"Login successful: {username}")
+        refresh = ClaimsRefreshToken.for_user(user)
+        logger.info("Login successful: %s", username)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
             "user": UserSerializer.serialize(user)
         })
     except Exception as e:
-        logger.error(f"Login error: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Login error: %s", e)
         return Response(
             {"errors": {"server": "An unexpected error occurred"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -65,27 +68,72 @@ def token_refresh(request):
         )
     
     try:
-        refresh = RefreshToken(refresh_token)
+        refresh = ClaimsRefreshToken(refresh_token)
+        if is_revoked(refresh):
+            raise TokenError("Token has been revoked")
+        data = {}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            # Only the first refresh with a token succeeds; a replay is refused
+            if not claim_refresh(refresh):
+                raise TokenError("Token was already rotated")
+            refresh.rotate()
+            data["refresh"] = str(refresh)
+        data["access"] = str(refresh.access_token)
         logger.info("Token refresh successful")
-        return Response({
-            "access": str(refresh.access_token)
-        })
+        return Response(data)
     except Exception as e:
-        logger.warning(f"Token refresh failed: {str(e)}")
+        logger.warning("Token refresh failed: %s", e)
         return Response(
             {"errors": {"refresh": "Invalid refresh token"}}, 
             status=status.HTTP_401_UNAUTHORIZED
         )
+
+
+@api_view(['POST'])
+@csrf_exempt
+@permission_classes([AllowAny])
+def logout(request):
+    """Revoke the login session of the refresh token sent, and of the bearer access token"""
+    refresh_token = request.data.get("refresh")
+    if not refresh_token:
+        logger.warning("Logout failed: Missing refresh token")
+        return Response(
+            {"errors": {"refresh": "Refresh token is required"}},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        refresh = ClaimsRefreshToken(refresh_token)
+    except TokenError as e:
+        logger.warning("Logout failed: %s", e)
+        return Response(
+            {"errors": {"refresh": "Invalid refresh token"}},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    revoke_session(refresh)
+    # Older access tokens carry no session, so revoke the one in use by itself
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is not None:
+        try:
+            access = authentication.get_validated_token(raw_token)
+        except InvalidToken:
+            access = None
+        if access is not None and session_id(access) != session_id(refresh):
+            revoke_session(access)
+    logger.info("Logout: user ID %s", refresh[jwt_settings.USER_ID_CLAIM])
+    return Response(status=status.HTTP_205_RESET_CONTENT)
         
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
     """Get the currently authenticated user's details"""
-    logger.info(f"Current user info requested: {request.user.username}")
+    logger.info("Current user info requested: %s", request.user.username)
+    fields = UserSerializer.requested_fields(request)
     try:
-        return Response(UserSerializer.serialize(request.user, include_stats=True), status=status.HTTP_200_OK)
+        return Response(UserSerializer.serialize(request.user, include_stats=True, fields=fields), status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error fetching current user info: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error fetching current user info: %s", e)
         return Response(
             {"errors": {"server": "An error occurred while fetching user information"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -99,12 +147,14 @@ def current_user(request):
 def user_list_create(request):
     if request.method == 'GET':
         logger.info("User list requested")
+        fields = UserSerializer.requested_fields(request)
         try:
-            users = User.objects.all()
-            serialized_users = [UserSerializer.serialize(user) for user in users]
-            return Response(serialized_users, status=status.HTTP_200_OK)
+            users = UserSerializer.sparse_queryset(User.objects.select_related('profile').order_by('id'), fields)
+            paginator = StandardResultsSetPagination()
+            page = paginator.paginate_queryset(users, request)
+            return paginator.get_paginated_response(UserSerializer.serialize_many(page, fields=fields))
         except Exception as e:
-            logger.error(f"Error fetching users: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error fetching users: %s", e)
             return Response(
                 {"errors": {"server": "An error occurred while fetching users"}}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -122,7 +172,7 @@ def user_list_create(request):
                 )
             return Response(serialized_data, status=status.HTTP_201_CREATED)
         except Exception as e:
-            logger.error(f"Error creating user: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error creating user: %s", e)
             return Response(
                 {"errors": {"server": "An error occurred while creating user"}}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -131,12 +181,13 @@ def user_list_create(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def user_detail_public(request, pk):
+    fields = UserSerializer.requested_fields(request)
     try:
-        user = User.objects.get(pk=pk)
-        logger.info(f"User detail requested: {user.username}")
-        return Response(UserSerializer.serialize(user), status=status.HTTP_200_OK)
+        user = UserSerializer.sparse_queryset(User.objects.select_related('profile'), fields).get(pk=pk)
+        logger.info("User detail requested: %s", user.username)
+        return Response(UserSerializer.serialize(user, fields=fields), status=status.HTTP_200_OK)
     except User.DoesNotExist:
-        logger.warning(f"User not found: ID {pk}")
+        logger.warning("User not found: ID %s", pk)
         return Response(
             {'errors': {'user': 'User not found'}}, 
             status=status.HTTP_404_NOT_FOUND
@@ -147,12 +198,13 @@ def user_detail_public(request, pk):
 def user_detail(request, pk):
     # For GET requests, explicitly use AllowAny permission
     if request.method == 'GET':
+        fields = UserSerializer.requested_fields(request)
         try:
-            user = User.objects.get(pk=pk)
-            logger.info(f"User detail requested: {user.username}")
-            return Response(UserSerializer.serialize(user), status=status.HTTP_200_OK)
+            user = UserSerializer.sparse_queryset(User.objects.select_related('profile'), fields).get(pk=pk)
+            logger.info("User detail requested: %s", user.username)
+            return Response(UserSerializer.serialize(user, fields=fields), status=status.HTTP_200_OK)
         except User.DoesNotExist:
-            logger.warning(f"User not found: ID {pk}")
+            logger.warning("User not found: ID %s", pk)
             return Response(
                 {'errors': {'user': 'User not found'}}, 
                 status=status.HTTP_404_NOT_FOUND
@@ -166,24 +218,24 @@ def user_detail(request, pk):
         )
     
     try:
-        user = User.objects.get(pk=pk)
+        user = User.objects.select_related('profile').get(pk=pk)
     except User.DoesNotExist:
-        logger.warning(f"User not found: ID {pk}")
+        logger.warning("User not found: ID %s", pk)
         return Response(
             {'errors': {'user': 'User not found'}}, 
             status=status.HTTP_404_NOT_FOUND
         )
     
     # Permission check - users can only modify their own data unless they're staff
-    if request.method in ['PUT', 'DELETE'] and user != request.user and not request.user.is_staff:
-        logger.warning(f"Permission denied: User {request.user.username} attempted to modify user {user.username}")
+    if request.method in ['PUT', 'DELETE'] and user.pk != request.user.pk and not request.user.is_staff:
+        logger.warning("Permission denied: User %s attempted to modify user %s", request.user.username, user.username)
         return Response(
             {'errors': {'permission': 'You do not have permission to modify this user'}},
             status=status.HTTP_403_FORBIDDEN
         )
     
     if request.method == 'PUT':
-        logger.info(f"User update requested: {user.username}")
+        logger.info("User update requested: %s", user.username)
         try:
             serialized_data = UserSerializer.serialize(instance=user, data=request.data)
             if serialized_data.get('errors'):
@@ -193,7 +245,7 @@ def user_detail(request, pk):
                 )
             return Response(serialized_data, status=status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"Error updating user {user.username}: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error updating user %s: %s", user.username, e)
             return Response(
                 {"errors": {"server": "An error occurred while updating user"}}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -203,10 +255,10 @@ def user_detail(request, pk):
         try:
             username = user.username
             user.delete()
-            logger.info(f"User deleted: {username}")
+            logger.info("User deleted: %s", username)
             return Response({'message': 'User deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
-            logger.error(f"Error deleting user {user.username}: {str(e)}\n{traceback.format_exc()}")
+            logger.exception("Error deleting user %s: %s", user.username, e)
             return Response(
                 {"errors": {"server": "An error occurred while deleting user"}}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -216,7 +268,7 @@ def user_detail(request, pk):
 @csrf_exempt
 @permission_classes([IsAuthenticated])
 def password_change(request):
-    logger.info(f"Password change requested for user: {request.user.username}")
+    logger.info("Password change requested for user: %s", request.user.username)
     try:
         result = UserSerializer.change_password(request.user, request.data)
         if result.get('errors'):
@@ -224,9 +276,13 @@ def password_change(request):
                 {"errors": result['errors']}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        # Sign out every session, then sign this one back in
+        revoke_user(request.user.pk)
+        refresh = ClaimsRefreshToken.for_user(request.user)
+        result.update(refresh=str(refresh), access=str(refresh.access_token))
         return Response(result, status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error changing password for {request.user.username}: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error changing password for %s: %s", request.user.username, e)
         return Response(
             {"errors": {"server": "An error occurred while changing password"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -237,11 +293,12 @@ def password_change(request):
 @permission_classes([IsAuthenticated])
 def current_user(request):
     """Get the currently authenticated user's details"""
-    logger.info(f"Current user info requested: {request.user.username}")
+    logger.info("Current user info requested: %s", request.user.username)
+    fields = UserSerializer.requested_fields(request)
     try:
-        return Response(UserSerializer.serialize(request.user, include_stats=True), status=status.HTTP_200_OK)
+        return Response(UserSerializer.serialize(request.user, include_stats=True, fields=fields), status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error fetching current user info: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error fetching current user info: %s", e)
         return Response(
             {"errors": {"server": "An error occurred while fetching user information"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -251,14 +308,14 @@ def current_user(request):
 @permission_classes([IsAuthenticated])
 def update_user_profile(request):
     """Update both user and profile information in a single request"""
-    logger.info(f"User and profile update requested for user: {request.user.username}")
+    logger.info("User and profile update requested for user: %s", request.user.username)
     
     try:
         # Ensure profile exists
         if not hasattr(request.user, 'profile'):
             from .models import Profile
             Profile.objects.create(user=request.user)
-            logger.info(f"Created missing profile for user: {request.user.username}")
+            logger.info("Created missing profile for user: %s", request.user.username)
         
         serializer = UserProfileSerializer(data=request.data)
         if serializer.is_valid():
@@ -272,7 +329,7 @@ def update_user_profile(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
     except Exception as e:
-        logger.error(f"Error updating user and profile for {request.user.username}: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error updating user and profile for %s: %s", request.user.username, e)
         return Response(
             {"errors": {"server": "An error occurred while updating user and profile"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -282,12 +339,12 @@ def update_user_profile(request):
 @permission_classes([IsAuthenticated])
 def user_stats(request):
     """Get poetry stats for the authenticated user"""
-    logger.info(f"Stats requested for user: {request.user.username}")
+    logger.info("Stats requested for user: %s", request.user.username)
     try:
         stats = UserSerializer.get_user_stats(request.user)
         return Response(stats, status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error fetching stats for {request.user.username}: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error fetching stats for %s: %s", request.user.username, e)
         return Response(
             {"errors": {"server": "An error occurred while fetching user stats"}}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1,6 +1,8 @@
 import boto3
+from botocore.config import Config
 import logging
 import os
+import threading
 from django.conf import settings
 from botocore.exceptions import ClientError
 import uuid
@@ -8,27 +10,68 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+def get_s3_client():
+    """
+    The process's S3 client for the current settings, created on first use.
+
+    boto3 clients are thread-safe (sessions are not), so every thread shares
+    one client and its pool of ``AWS_S3_MAX_POOL_CONNECTIONS`` HTTP
+    connections. A forked worker builds its own.
+    """
+    global _clients, _clients_pid
+    key = (
+        settings.AWS_S3_REGION_NAME, settings.AWS_S3_ENDPOINT_URL, settings.AWS_ACCESS_KEY,
+        settings.AWS_SECRET_ACCESS_KEY, settings.AWS_S3_MAX_POOL_CONNECTIONS,
+    )
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients, _clients_pid = {}, os.getpid()
+        if key not in _clients:
+            config = Config(
+                max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                # Local stand-ins serve buckets under the endpoint's path, not as subdomains
+                s3={'addressing_style': 'path' if settings.AWS_S3_ENDPOINT_URL else 'auto'},
+            )
+            _clients[key] = boto3.session.Session().client(
+                's3',
+                region_name=settings.AWS_S3_REGION_NAME,
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                aws_access_key_id=settings.AWS_ACCESS_KEY,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=config,
+            )
+        return _clients[key]
+
+
 class S3Handler:
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            region_name='eu-north-1',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
-        )
-        self.bucket_name = 'kenyamall'  # Using your existing bucket
+        self.s3_client = get_s3_client()
+        self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+        self.expiry = settings.AWS_S3_PRESIGNED_EXPIRY
+
+    def new_key(self):
+        """Create a unique image name"""
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        unique_id = str(uuid.uuid4())[:8]
+        return f"{unique_id}-{timestamp}.jpeg"
+
+    def object_url(self, key):
+        """URL of an uploaded object, without query parameters"""
+        if settings.AWS_S3_ENDPOINT_URL:
+            return f"{settings.AWS_S3_ENDPOINT_URL.rstrip('/')}/{self.bucket_name}/{key}"
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{key}"
 
     def generate_presigned_url(self, content_type='image/jpeg'):
         """
         Generate a presigned URL for uploading an image to S3
         """
         try:
-            # Create a unique image name
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            unique_id = str(uuid.uuid4())[:8]
-            image_name = f"{unique_id}-{timestamp}.jpeg"
-            
-            # Generate the presigned URL
+            image_name = self.new_key()
             response = self.s3_client.generate_presigned_url(
                 'put_object',
                 Params={
@@ -36,17 +79,44 @@ class S3Handler:
                     'Key': image_name,
                     'ContentType': content_type
                 },
-                ExpiresIn=1000
+                ExpiresIn=self.expiry
             )
-            
-            # Get the URL without query parameters
-            object_url = f"https://{self.bucket_name}.s3.amazonaws.com/{image_name}"
-            
-            logger.info(f"Generated presigned URL for image upload: {image_name}")
+
+            logger.info("Generated presigned URL for image upload: %s", image_name)
             return {
                 'upload_url': response,
-                'object_url': object_url
+                'object_url': self.object_url(image_name)
+            }
+        except ClientError as e:
+            logger.error("Error generating presigned URL: %s", e)
+            raise
+
+    def generate_presigned_post(self, content_type='image/jpeg'):
+        """
+        Generate a presigned POST form for uploading an image to S3.
+
+        Unlike a presigned PUT, the form also limits the upload's size to
+        ``AWS_S3_MAX_UPLOAD_BYTES``.
+        """
+        try:
+            image_name = self.new_key()
+            response = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=image_name,
+                Fields={'Content-Type': content_type},
+                Conditions=[
+                    {'Content-Type': content_type},
+                    ['content-length-range', 1, settings.AWS_S3_MAX_UPLOAD_BYTES],
+                ],
+                ExpiresIn=self.expiry
+            )
+
+            logger.info("Generated presigned POST for image upload: %s", image_name)
+            return {
+                'upload_url': response['url'],
+                'fields': response['fields'],
+                'object_url': self.object_url(image_name)
             }
         except ClientError as e:
-            logger.error(f"Error generating presigned URL: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error("Error generating presigned POST: %s", e)
+            raise
@@ -2,6 +2,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from utilities.aws_s3 import S3Handler
 import logging
 
@@ -11,7 +13,7 @@ logger = logging.getLogger(__name__)
 @permission_classes([IsAuthenticated])
 def get_image_upload_url(request):
     """Get a presigned URL for uploading an image to S3"""
-    logger.info(f"Image upload URL requested by user: {request.user.username}")
+    logger.info("Image upload URL requested by user: %s", request.user.username)
     
     content_type = request.query_params.get('content_type', 'image/jpeg')
     
@@ -24,17 +26,62 @@ def get_image_upload_url(request):
             'objectURL': url_info['object_url']
         }, status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error generating image upload URL: {str(e)}")
+        logger.error("Error generating image upload URL: %s", e)
         return Response(
             {"errors": {"server": "An error occurred while generating image upload URL"}},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_image_upload_urls(request):
+    """Get presigned URLs for uploading several images to S3 in one request"""
+    content_types = request.data.get('content_types')
+    method = request.data.get('method', 'put')
+    logger.info("Image upload URLs requested by user: %s", request.user.username)
+
+    errors = {}
+    if not isinstance(content_types, list) or not content_types:
+        errors['content_types'] = 'A non-empty list of content types is required'
+    elif len(content_types) > settings.AWS_S3_MAX_UPLOAD_URLS:
+        errors['content_types'] = f'At most {settings.AWS_S3_MAX_UPLOAD_URLS} uploads per request'
+    elif not all(isinstance(content_type, str) and content_type.startswith('image/') for content_type in content_types):
+        errors['content_types'] = 'Only images can be uploaded'
+    if method not in ('put', 'post'):
+        errors['method'] = "Method must be 'put' or 'post'"
+    if errors:
+        return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        s3_handler = S3Handler()
+        uploads = []
+        for content_type in content_types:
+            if method == 'post':
+                url_info = s3_handler.generate_presigned_post(content_type=content_type)
+                uploads.append({
+                    'uploadURL': url_info['upload_url'],
+                    'fields': url_info['fields'],
+                    'objectURL': url_info['object_url']
+                })
+            else:
+                url_info = s3_handler.generate_presigned_url(content_type=content_type)
+                uploads.append({
+                    'uploadURL': url_info['upload_url'],
+                    'objectURL': url_info['object_url']
+                })
+        return Response({'uploads': uploads}, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error("Error generating image upload URLs: %s", e)
+        return Response(
+            {"errors": {"server": "An error occurred while generating image upload URLs"}},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_avatar(request):
     """Update user's avatar URL"""
-    logger.info(f"Avatar update requested for user: {request.user.username}")
+    logger.info("Avatar update requested for user: %s", request.user.username)
     
     try:
         avatar_url = request.data.get('avatar_url')
@@ -45,21 +92,25 @@ def update_avatar(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Ensure profile exists
-        if not hasattr(request.user, 'profile'):
-            from users.models import Profile
-            Profile.objects.create(user=request.user)
-            logger.info(f"Created missing profile for user: {request.user.username}")
+        from users.models import Profile
+        from users.serializers import UserSerializer
+        
+        # The authenticated user only carries its token claims; load the row with its profile
+        user = get_user_model().objects.select_related('profile').get(pk=request.user.pk)
+        profile = getattr(user, 'profile', None)
+        if profile is None:
+            profile = Profile(user=user)
+            logger.info("Created missing profile for user: %s", user.username)
         
         # Update the avatar URL
-        profile = request.user.profile
         profile.avatar_url = avatar_url
         profile.save()
+        user.profile = profile
         
-        from users.serializers import UserSerializer
-        return Response(UserSerializer.serialize(request.user), status=status.HTTP_200_OK)
+        stats = UserSerializer.get_bulk_user_stats([user.pk])[user.pk]
+        return Response(UserSerializer.serialize(user, stats=stats), status=status.HTTP_200_OK)
     except Exception as e:
-        logger.error(f"Error updating avatar for {request.user.username}: {str(e)}")
+        logger.error("Error updating avatar for %s: %s", request.user.username, e)
         return Response(
             {"errors": {"server": "An error occurred while updating avatar"}},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR